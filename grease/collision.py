@@ -39,8 +39,33 @@ broad-phase system are actually in collision.
 
 __version__ = '$Id$'
 
+import heapq
+import itertools
+import math
+import operator
+import time
+import weakref
+import multiprocessing
+from multiprocessing import sharedctypes, util
 from bGrease.geometry import Vec2d
-from bisect import bisect_right
+from bisect import bisect_left, bisect_right
+
+PAIR_KEY_BITS = 32
+"""Number of bits used for each entity id packed into a pair key"""
+
+PAIR_KEY_MASK = (1 << PAIR_KEY_BITS) - 1
+
+
+def pair_key(id1, id2):
+	"""Return the canonical key for an unordered pair of integer ids.
+	The key is a single int containing both ids, lowest first, so it
+	hashes and compares much faster than a :class:`Pair`. Broad-phase
+	systems use these keys internally while generating candidates.
+	"""
+	if id1 < id2:
+		return (id1 << PAIR_KEY_BITS) | id2
+	else:
+		return (id2 << PAIR_KEY_BITS) | id1
 
 
 class Pair(tuple):
@@ -59,12 +84,24 @@ class Pair(tuple):
 	for each entity in the pair
 	"""
 
+	time_of_impact = None
+	"""Fraction of the time step (0 to 1) when the pair first touched,
+	set by collision systems that perform swept collision detection
+	"""
+
 	def __new__(cls, entity1, entity2, point=None, normal=None):
 		pair = tuple.__new__(cls, (entity1, entity2))
 		return pair
 	
 	def __hash__(self):
-		return hash(self[0]) ^ hash(self[1])
+		# Order the member hashes so the result is symmetric. Simply xoring
+		# them would collide badly for entities, whose hashes are their
+		# sequential ids
+		hash0 = hash(self[0])
+		hash1 = hash(self[1])
+		if hash0 > hash1:
+			return hash((hash1, hash0))
+		return hash((hash0, hash1))
 	
 	def __eq__(self, other):
 		other = tuple(other)
@@ -81,6 +118,71 @@ class Pair(tuple):
 		)
 
 
+class CollisionStats(object):
+	"""Statistics of a collision system for the last time step, used to
+	tune collision masks and to detect when broad-phase efficiency
+	collapses. Collision systems keep statistics when created with
+	``stats=True``. They can be read directly, or for all systems of a
+	world using :meth:`bGrease.world.BaseWorld.system_stats`.
+
+	Pair counts and the time spent finding pairs are recorded when the
+	pairs are first retrieved after each time step. Times are in seconds.
+	"""
+
+	FIELDS = ('entities', 'removals', 'sort_swaps', 'candidate_pairs', 
+		'collisions', 'hit_ratio', 'update_time', 'pair_time', 
+		'narrow_time', 'handler_time')
+
+	entities = 0
+	"""Number of entities in the broad phase"""
+
+	removals = 0
+	"""Number of entities removed from the broad phase's axis arrays, 
+	because they were deleted or became static
+	"""
+
+	sort_swaps = 0
+	"""Number of endpoint swaps made sorting the axis arrays. For 
+	:class:`BroadSweepAndPrune`, which uses Python's sort, this is the
+	number of endpoints that changed position.
+	"""
+
+	candidate_pairs = 0
+	"""Number of candidate pairs found by the broad phase"""
+
+	collisions = 0
+	"""Number of pairs found in collision by the narrow phase"""
+
+	update_time = 0.0
+	"""Time spent updating the broad phase"""
+
+	pair_time = 0.0
+	"""Time spent finding the broad phase candidate pairs"""
+
+	narrow_time = 0.0
+	"""Time spent testing the candidate pairs in the narrow phase"""
+
+	handler_time = 0.0
+	"""Time spent in the collision handlers"""
+
+	@property
+	def hit_ratio(self):
+		"""Fraction of candidate pairs found in collision by the narrow 
+		phase, or None if there were no candidates. A low ratio means the
+		broad phase is passing on many false positives.
+		"""
+		if self.candidate_pairs:
+			return float(self.collisions) / self.candidate_pairs
+
+	def as_dict(self):
+		"""Return the statistics as a dict"""
+		return dict((name, getattr(self, name)) for name in self.FIELDS)
+
+	def __repr__(self):
+		return '<%s %s>' % (self.__class__.__name__, ' '.join(
+			'%s=%r' % (name, getattr(self, name)) for name in self.FIELDS))
+
+
 class BroadSweepAndPrune(object):
 	"""2D Broad-phase sweep and prune bounding box collision detector
 
@@ -97,8 +199,12 @@ class BroadSweepAndPrune(object):
 
 	:param collision_component: Name of the collision component used by this
 		system, defaults to 'collision'. This component supplies each
-		entities' aabb and collision masks.
+		entities' aabb, collision masks and static flag.
 	:type collision_component: str
+
+	:param stats: If True, keep :class:`CollisionStats` for each time 
+		step. Defaults to False.
+	:type stats: bool
 	"""
 	world = None
 	"""|BaseWorld| object this system belongs to"""
@@ -106,85 +212,280 @@ class BroadSweepAndPrune(object):
 	collision_component = None
 	"""Name of world's collision component used by this system"""
 
+	stats = None
+	""":class:`CollisionStats` for the last time step, or None if the
+	system does not keep statistics
+	"""
+
 	LEFT_ATTR = "left"
 	RIGHT_ATTR = "right"
 	TOP_ATTR = "top"
 	BOTTOM_ATTR = "bottom"
 
-	def __init__(self, collision_component='collision'):
+	MAX_LAYERS = 16
+	"""Number of distinct collision layers always partitioned. Beyond this,
+	entities are only partitioned into layers if there are no more layers
+	than the square root of the number of entities, otherwise the masks
+	of each candidate pair are tested instead.
+	"""
+
+	def __init__(self, collision_component='collision', stats=False):
 		self.collision_component = collision_component
+		if stats:
+			self.stats = CollisionStats()
 		self._by_x = None
 		self._by_y = None
 		self._collision_pairs = None
+		self._ids = None
+		self._id_entities = None
+		self._entries = None
+		self._layers = None
+		self._static = None
+		self._static_by_x = None
+		self._static_by_y = None
 	
 	def set_world(self, world):
 		"""Bind the system to a world"""
 		self.world = world
 	
+	def _add_id(self, entity):
+		"""Assign the dense integer id used in pair keys to the entity"""
+		if entity not in self._ids:
+			entity_id = self._new_id()
+			self._ids[entity] = entity_id
+			self._id_entities[entity_id] = entity
+
+	def _append_entries(self, data, position=None):
+		"""Append the axis entries for an entity to the active axis arrays,
+		return the left, right, bottom and top entries. If a position
+		component is given, the entries are derived from the entity's
+		position and collision radius rather than its aabb.
+		"""
+		if position is not None and data.entity in position:
+			x, y = position[data.entity].position
+			radius = data.radius
+			entries = ([x - radius, self.LEFT_ATTR, data], 
+				[x + radius, self.RIGHT_ATTR, data],
+				[y - radius, self.BOTTOM_ATTR, data],
+				[y + radius, self.TOP_ATTR, data])
+		else:
+			aabb = data.aabb
+			entries = ([aabb.left, self.LEFT_ATTR, data], 
+				[aabb.right, self.RIGHT_ATTR, data],
+				[aabb.bottom, self.BOTTOM_ATTR, data],
+				[aabb.top, self.TOP_ATTR, data])
+		self._by_x.append(entries[0])
+		self._by_x.append(entries[1])
+		self._by_y.append(entries[2])
+		self._by_y.append(entries[3])
+		self._entries[self._ids[data.entity]] = entries
+		return entries
+
+	def _remove_entries(self, entities):
+		"""Remove the axis entries for the given entities from the active
+		axis arrays
+		"""
+		entities = set(entities)
+		ids = self._ids
+		for entity in entities:
+			self._entries.pop(ids.get(entity), None)
+		self._by_x[:] = [entry for entry in self._by_x 
+			if entry[2].entity not in entities]
+		self._by_y[:] = [entry for entry in self._by_y 
+			if entry[2].entity not in entities]
+
+	def _rebuild_static(self):
+		"""Rebuild the sorted axis arrays of the static entities"""
+		LEFT = self.LEFT_ATTR
+		RIGHT = self.RIGHT_ATTR
+		TOP = self.TOP_ATTR
+		BOTTOM = self.BOTTOM_ATTR
+		by_x = self._static_by_x = []
+		by_y = self._static_by_y = []
+		for data in self._static.itervalues():
+			aabb = data.aabb
+			by_x.append([aabb.left, LEFT, data])
+			by_x.append([aabb.right, RIGHT, data])
+			by_y.append([aabb.bottom, BOTTOM, data])
+			by_y.append([aabb.top, TOP, data])
+		by_x.sort()
+		by_y.sort()
+
+	def _read_aabbs(self):
+		"""Update the values of the active axis entries from the entities'
+		aabbs
+		"""
+		for entry in self._by_x:
+			entry[0] = getattr(entry[2].aabb, entry[1])
+		for entry in self._by_y:
+			entry[0] = getattr(entry[2].aabb, entry[1])
+
+	def _read_circles(self, position):
+		"""Update the values of the active axis entries from the entities'
+		positions and collision radii. Entities without a position keep
+		their previous values.
+		"""
+		get_position = position.get
+		for left, right, bottom, top in self._entries.itervalues():
+			data = left[2]
+			position_data = get_position(data.entity)
+			if position_data is not None:
+				x, y = position_data.position
+				radius = data.radius
+				left[0] = x - radius
+				right[0] = x + radius
+				bottom[0] = y - radius
+				top[0] = y + radius
+
+	def _fit_circle_aabb(self, data, position):
+		"""Set the aabb of an entity from its position and collision
+		radius, so that it is current when the entity is read as static
+		"""
+		if data.entity in position:
+			x, y = position[data.entity].position
+			radius = data.radius
+			aabb = data.aabb
+			aabb.left = x - radius
+			aabb.right = x + radius
+			aabb.bottom = y - radius
+			aabb.top = y + radius
+
 	def step(self, dt):
 		"""Update the system for this time step, updates and sorts the 
 		axis arrays.
+
+		Static entities, those with their ``collision.static`` flag set,
+		are kept in separate axis arrays that are only rebuilt when 
+		entities become static, stop being static, or are added or
+		removed. Their aabbs are read once when they become static.
+		"""
+		self._step(None)
+
+	def step_circles(self, dt, position_component='position'):
+		"""Update the system for this time step like :meth:`step`, but 
+		derive the bounds of each entity directly from its position and
+		collision radius, rather than reading back its aabb.
+
+		This fuses the aabb update of a circular narrow phase system
+		with the broad phase. The aabbs of moving entities are not updated,
+		the aabb of an entity is only set when it becomes static.
+
+		:param position_component: Name of the position component 
+			supplying each entity's position.
+		:type position_component: str
+		"""
+		self._step(getattr(self.world.components, position_component))
+
+	def _step(self, position):
+		"""Update the axis arrays, reading the entities' bounds from their
+		circles if a position component is given, or their aabbs otherwise
 		"""
 		component = getattr(self.world.components, self.collision_component)
 		LEFT = self.LEFT_ATTR
-		RIGHT = self.RIGHT_ATTR
-		TOP = self.TOP_ATTR
-		BOTTOM = self.BOTTOM_ATTR
+		stats = self.stats
+		if stats is not None:
+			start = time.time()
+		removals = 0
 		if self._by_x is None:
 			# Build axis lists from scratch
 			# Note we cache the box positions here
 			# so that we can perform hit tests efficiently
 			# it also isolates us from changes made to the 
 			# box positions after we run
-			by_x = self._by_x = []
-			append_x = by_x.append
-			by_y = self._by_y = []
-			append_y = by_y.append
+			self._by_x = []
+			self._by_y = []
+			self._ids = {}
+			self._id_entities = {}
+			self._entries = {}
+			self._new_id = itertools.count().next
+			static = self._static = {}
+			add_id = self._add_id
+			append_entries = self._append_entries
 			for data in component.itervalues():
-				append_x([data.aabb.left, LEFT, data])
-				append_x([data.aabb.right, RIGHT, data])
-				append_y([data.aabb.bottom, BOTTOM, data])
-				append_y([data.aabb.top, TOP, data])
+				add_id(data.entity)
+				if data.static:
+					if position is not None:
+						self._fit_circle_aabb(data, position)
+					static[data.entity] = data
+				else:
+					append_entries(data, position)
+			static_changed = True
 		else:
 			by_x = self._by_x
 			by_y = self._by_y
-			removed = []
-			for entry in by_x:
-				entry[0] = getattr(entry[2].aabb, entry[1])
-			for entry in by_y:
-				entry[0] = getattr(entry[2].aabb, entry[1])
+			static = self._static
+			static_changed = False
+			if position is None:
+				self._read_aabbs()
+			else:
+				self._read_circles(position)
 			# Removing entities is inefficient, but expected to be rare
 			if component.deleted_entities:
 				deleted_entities = component.deleted_entities
-				deleted_x = []
-				deleted_y = []
-				for i, (_, _, data) in enumerate(by_x):
-					if data.entity in deleted_entities:
-						deleted_x.append(i)
-				deleted_x.reverse()
-				for i in deleted_x:
-					del by_x[i]
-				for i, (_, _, data) in enumerate(by_y):
-					if data.entity in deleted_entities:
-						deleted_y.append(i)
-				deleted_y.reverse()
-				for i in deleted_y:
-					del by_y[i]
+				self._remove_entries(deleted_entities)
+				ids = self._ids
+				id_entities = self._id_entities
+				for entity in deleted_entities:
+					if entity in ids:
+						del id_entities[ids.pop(entity)]
+						removals += 1
+					if entity in static:
+						del static[entity]
+						static_changed = True
+			# Move entities that started or stopped being static
+			woken = [data for data in static.itervalues() if not data.static]
+			sleepers = [data for _, side, data in by_x 
+				if side is LEFT and data.static]
+			if sleepers:
+				if position is not None:
+					for data in sleepers:
+						self._fit_circle_aabb(data, position)
+				self._remove_entries([data.entity for data in sleepers])
+				for data in sleepers:
+					static[data.entity] = data
+				removals += len(sleepers)
+				static_changed = True
+			for data in woken:
+				del static[data.entity]
+				self._append_entries(data, position)
+				static_changed = True
 			# Tack on new entities
 			for entity in component.new_entities:
 				data = component[entity]
-				by_x.append([data.aabb.left, LEFT, data])
-				by_x.append([data.aabb.right, RIGHT, data])
-				by_y.append([data.aabb.bottom, BOTTOM, data])
-				by_y.append([data.aabb.top, TOP, data])
+				self._add_id(entity)
+				if data.static:
+					if position is not None:
+						self._fit_circle_aabb(data, position)
+					static[entity] = data
+					static_changed = True
+				else:
+					self._append_entries(data, position)
+		if static_changed:
+			self._rebuild_static()
 				
 		# Tim-sort is highly efficient with mostly sorted lists.
 		# Because positions tend to change little each frame
 		# we take advantage of this here. Obviously things are
 		# less efficient with very fast moving, or teleporting entities
-		by_x.sort()
-		by_y.sort()
+		if stats is None:
+			self._by_x.sort()
+			self._by_y.sort()
+		else:
+			stats.sort_swaps = (self._sort_counting_moves(self._by_x) 
+				+ self._sort_counting_moves(self._by_y))
+			stats.removals = removals
+			stats.entities = len(self._ids)
+			stats.update_time = time.time() - start
 		self._collision_pairs = None
+
+	@staticmethod
+	def _sort_counting_moves(axis):
+		"""Sort the axis array in place, return the number of entries that
+		changed position
+		"""
+		before = axis[:]
+		axis.sort()
+		return sum(1 for old, new in itertools.izip(before, axis) if old is not new)
 	
 	@property
 	def collision_pairs(self):
@@ -194,63 +495,211 @@ class BroadSweepAndPrune(object):
 				# Axis arrays not ready
 				return set()
 
+			stats = self.stats
+			if stats is not None:
+				start = time.time()
 			LEFT = self.LEFT_ATTR
 			RIGHT = self.RIGHT_ATTR
 			TOP = self.TOP_ATTR
 			BOTTOM = self.BOTTOM_ATTR
-			# Build candidates overlapping along the x-axis
+			BITS = PAIR_KEY_BITS
+			ids = self._ids
+			id_entities = self._id_entities
+			# Build candidates overlapping along the x-axis. Candidates are
+			# tracked as pair keys (see pair_key(), inlined here for speed),
+			# Pair objects are only created for the final result
+			# Entities are partitioned into layers by their collision masks
+			# and whether they are static, and each entity is only tested 
+			# against open entities in the layers it can interact with. This
+			# skips entire groups that cannot collide, including static vs.
+			# static, without testing their masks pair-wise. With many 
+			# distinct layers the partitioning costs more than it saves,
+			# so the masks are tested pair-wise instead (see MAX_LAYERS).
 			component = getattr(self.world.components, self.collision_component)
-			xoverlaps = set()
-			add_xoverlap = xoverlaps.add
+			static = self._static
+			if static:
+				# Merge in the static axis arrays, the sort is 
+				# a linear merge of the two sorted runs
+				by_x = self._by_x + self._static_by_x
+				by_x.sort()
+				all_by_y = self._by_y + self._static_by_y
+				all_by_y.sort()
+			else:
+				by_x = self._by_x
+				all_by_y = self._by_y
+			layer_set = set([(data.from_mask, data.into_mask, data.entity in static) 
+				for _, side, data in by_x if side is LEFT])
+			layered = (len(layer_set) <= self.MAX_LAYERS 
+				or len(layer_set) ** 2 <= len(ids))
+			if layered:
+				layer_partners = self._layer_partners(layer_set)
+				open_by_layer = dict((layer, set()) for layer in layer_partners)
+				open_partners = dict(
+					(layer, [open_by_layer[partner] for partner in partners])
+					for layer, partners in layer_partners.iteritems())
+				layers = {}
+				xoverlaps = set()
+				add_xoverlap = xoverlaps.add
+				for _, side, data in by_x:
+					if side is LEFT:
+						entity_id = ids[data.entity]
+						layer = layers[entity_id] = (
+							data.from_mask, data.into_mask, data.entity in static)
+						partner_opens = open_partners[layer]
+						if not partner_opens:
+							# Cannot collide with anything
+							continue
+						for open_ids in partner_opens:
+							if not open_ids:
+								continue
+							for open_id in open_ids:
+								if entity_id < open_id:
+									add_xoverlap((entity_id << BITS) | open_id)
+								else:
+									add_xoverlap((open_id << BITS) | entity_id)
+						open_by_layer[layer].add(entity_id)
+					elif side is RIGHT:
+						entity_id = ids[data.entity]
+						open_by_layer[layers[entity_id]].discard(entity_id)
+			else:
+				# Too many layers to partition efficiently, test the masks
+				# of each pair of open entities instead
+				xoverlaps = self._flat_xoverlaps(by_x)
 			discard_xoverlap = xoverlaps.discard
-			open = {}
-			for _, side, data in self._by_x:
-				if side is LEFT:
-					for open_entity, (from_mask, into_mask) in open.iteritems():
-						if data.from_mask & into_mask or from_mask & data.into_mask:
-							add_xoverlap(Pair(data.entity, open_entity))
-					open[data.entity] = (data.from_mask, data.into_mask)
-				elif side is RIGHT:
-					del open[data.entity]
-
-			if len(xoverlaps) <= 10 and len(xoverlaps)*4 < len(self._by_y):
+
+			if len(xoverlaps) <= 10 and len(xoverlaps)*4 < len(all_by_y):
 				# few candidates were found, so just scan the x overlap candidates
 				# along y. This requires an additional sort, but it should
 				# be cheaper than scanning everyone and its simpler
 				# than a separate brute-force check
-				entities = set([entity for entity, _ in xoverlaps] 
-					+ [entity for _, entity in xoverlaps])
+				entity_ids = set([key >> BITS for key in xoverlaps] 
+					+ [key & PAIR_KEY_MASK for key in xoverlaps])
+				entries = self._entries
 				by_y = []
-				for entity in entities:
-					data = component[entity]
+				for entity_id in entity_ids:
+					data = component[id_entities[entity_id]]
+					# Active entities are read from their axis entries, 
+					# which are current even when the aabbs are not 
+					# updated (see step_circles()). Static entities are
+					# not in the active axis arrays, but their aabbs are
+					# set when they become static.
 					# We can use tuples here, which are cheaper to create
-					by_y.append((data.aabb.bottom, BOTTOM, data))
-					by_y.append((data.aabb.top, TOP, data))
+					if entity_id in entries:
+						bottom, top = entries[entity_id][2:]
+						by_y.append((bottom[0], BOTTOM, data))
+						by_y.append((top[0], TOP, data))
+					else:
+						by_y.append((data.aabb.bottom, BOTTOM, data))
+						by_y.append((data.aabb.top, TOP, data))
 				by_y.sort()
 			else:
-				by_y = self._by_y
+				by_y = all_by_y
 
 			# Now check the candidates along the y-axis
-			open = set()
-			add_open = open.add
-			discard_open = open.discard
-			self._collision_pairs = set()
-			add_pair = self._collision_pairs.add
-			for _, side, data in by_y:
-				if side is BOTTOM:
-					for open_entity in open:
-						pair = Pair(data.entity, open_entity)
-						if pair in xoverlaps:
-							discard_xoverlap(pair)
-							add_pair(pair)
-							if not xoverlaps:
-								# No more candidates, bail
-								return self._collision_pairs
-					add_open(data.entity)
-				elif side is TOP:
-					discard_open(data.entity)
+			keys = []
+			add_key = keys.append
+			if layered:
+				for open_ids in open_by_layer.itervalues():
+					open_ids.clear()
+				for _, side, data in by_y:
+					if side is BOTTOM:
+						entity_id = ids[data.entity]
+						layer = layers[entity_id]
+						partner_opens = open_partners[layer]
+						if not partner_opens:
+							continue
+						for open_ids in partner_opens:
+							for open_id in open_ids:
+								if entity_id < open_id:
+									key = (entity_id << BITS) | open_id
+								else:
+									key = (open_id << BITS) | entity_id
+								if key in xoverlaps:
+									discard_xoverlap(key)
+									add_key(key)
+						if not xoverlaps:
+							# No more candidates, bail
+							break
+						open_by_layer[layer].add(entity_id)
+					elif side is TOP:
+						entity_id = ids[data.entity]
+						open_by_layer[layers[entity_id]].discard(entity_id)
+			else:
+				# The masks were tested along the x-axis, so only the
+				# candidates need to be checked
+				open_ids = set()
+				for _, side, data in by_y:
+					if side is BOTTOM:
+						entity_id = ids[data.entity]
+						for open_id in open_ids:
+							if entity_id < open_id:
+								key = (entity_id << BITS) | open_id
+							else:
+								key = (open_id << BITS) | entity_id
+							if key in xoverlaps:
+								discard_xoverlap(key)
+								add_key(key)
+						if not xoverlaps:
+							break
+						open_ids.add(entity_id)
+					elif side is TOP:
+						open_ids.discard(ids[data.entity])
+			self._collision_pairs = set([
+				Pair(id_entities[key >> BITS], id_entities[key & PAIR_KEY_MASK])
+				for key in keys])
+			if stats is not None:
+				stats.candidate_pairs = len(keys)
+				stats.pair_time = time.time() - start
 		return self._collision_pairs
 	
+	def _flat_xoverlaps(self, by_x):
+		"""Return the set of pair keys of the entities overlapping along the
+		sorted x-axis array that can collide, testing the collision masks
+		and static flags of each pair
+		"""
+		LEFT = self.LEFT_ATTR
+		BITS = PAIR_KEY_BITS
+		ids = self._ids
+		static = self._static
+		xoverlaps = set()
+		add_xoverlap = xoverlaps.add
+		open = {}
+		for _, side, data in by_x:
+			entity_id = ids[data.entity]
+			if side is LEFT:
+				from_mask = data.from_mask
+				into_mask = data.into_mask
+				is_static = data.entity in static
+				for open_id, (open_from, open_into, open_static) in open.iteritems():
+					if ((from_mask & open_into or open_from & into_mask)
+						and not (is_static and open_static)):
+						if entity_id < open_id:
+							add_xoverlap((entity_id << BITS) | open_id)
+						else:
+							add_xoverlap((open_id << BITS) | entity_id)
+				open[entity_id] = (from_mask, into_mask, is_static)
+			else:
+				open.pop(entity_id, None)
+		return xoverlaps
+
+	def _layer_partners(self, layers):
+		"""Return a dict mapping each layer to the sequence of layers,
+		including itself if applicable, that it can collide with. A layer
+		is a (from_mask, into_mask, static) tuple, static layers never
+		collide with each other. The result is cached until the set of 
+		layers in use changes.
+		"""
+		layers = frozenset(layers)
+		if self._layers is None or self._layers[0] != layers:
+			partners = {}
+			for layer in layers:
+				from_mask, into_mask, static = layer
+				partners[layer] = tuple(other for other in layers 
+					if not (static and other[2]) 
+					and (from_mask & other[1] or other[0] & into_mask))
+			self._layers = (layers, partners)
+		return self._layers[1]
+
 	def query_point(self, x_or_point, y=None, from_mask=0xffffffff):
 		"""Hit test at the point specified. 
 
@@ -274,29 +723,41 @@ class BroadSweepAndPrune(object):
 			x, y = x_or_point
 		else:
 			x = x_or_point
+		hits = self._query_axes(self._by_x, self._by_y, x, y, from_mask)
+		if self._static:
+			hits |= self._query_axes(
+				self._static_by_x, self._static_by_y, x, y, from_mask)
+		return hits
+
+	def _query_axes(self, by_x, by_y, x, y, from_mask):
+		"""Hit test at the point specified against a pair of sorted axis
+		arrays
+		"""
+		if not by_x:
+			return set()
 		LEFT = self.LEFT_ATTR
 		RIGHT = self.RIGHT_ATTR
 		TOP = self.TOP_ATTR
 		BOTTOM = self.BOTTOM_ATTR
-		x_index = bisect_right(self._by_x, [x])
+		x_index = bisect_right(by_x, [x])
 		x_hits = set()
 		add_x_hit = x_hits.add
 		discard_x_hit = x_hits.discard
-		if x_index <= len(self._by_x) // 2:
+		if x_index <= len(by_x) // 2:
 			# closer to the left, scan from left to right
-			while (x == self._by_x[x_index][0] 
-				and self._by_x[x_index][1] is LEFT 
-				and x_index < len(self._by_x)):
+			while (x == by_x[x_index][0] 
+				and by_x[x_index][1] is LEFT 
+				and x_index < len(by_x)):
 				# Ensure we hit on exact left edge matches
 				x_index += 1
-			for _, side, data in self._by_x[:x_index]:
+			for _, side, data in by_x[:x_index]:
 				if side is LEFT and from_mask & data.into_mask:
 					add_x_hit(data.entity)
 				else:
 					discard_x_hit(data.entity)
 		else:
 			# closer to the right
-			for _, side, data in reversed(self._by_x[x_index:]):
+			for _, side, data in reversed(by_x[x_index:]):
 				if side is RIGHT and from_mask & data.into_mask:
 					add_x_hit(data.entity)
 				else:
@@ -304,25 +765,25 @@ class BroadSweepAndPrune(object):
 		if not x_hits:
 			return x_hits
 
-		y_index = bisect_right(self._by_y, [y])
+		y_index = bisect_right(by_y, [y])
 		y_hits = set()
 		add_y_hit = y_hits.add
 		discard_y_hit = y_hits.discard
-		if y_index <= len(self._by_y) // 2:
+		if y_index <= len(by_y) // 2:
 			# closer to the bottom
-			while (y == self._by_y[y_index][0] 
-				and self._by_y[y_index][1] is BOTTOM 
-				and y_index < len(self._by_y)):
+			while (y == by_y[y_index][0] 
+				and by_y[y_index][1] is BOTTOM 
+				and y_index < len(by_y)):
 				# Ensure we hit on exact bottom edge matches
 				y_index += 1
-			for _, side, data in self._by_y[:y_index]:
+			for _, side, data in by_y[:y_index]:
 				if side is BOTTOM:
 					add_y_hit(data.entity)
 				else:
 					discard_y_hit(data.entity)
 		else:
 			# closer to the top
-			for _, side, data in reversed(self._by_y[y_index:]):
+			for _, side, data in reversed(by_y[y_index:]):
 				if side is TOP:
 					add_y_hit(data.entity)
 				else:
@@ -333,6 +794,641 @@ class BroadSweepAndPrune(object):
 			return y_hits
 
 
+class BroadPersistentSweepAndPrune(BroadSweepAndPrune):
+	"""2D Broad-phase sweep and prune collision detector that maintains
+	the set of overlapping pairs incrementally
+
+	Rather than re-sorting the axis arrays and finding all overlaps from
+	scratch each time step, the axis arrays are kept sorted using an
+	insertion sort. Each time two endpoints are swapped during the sort,
+	the pair of entities is added to the persistent set of overlapping 
+	pairs if their boxes begin to overlap, or removed if they stop 
+	overlapping. The work done each time step is thus proportional to the
+	number of endpoint swaps, which is small when bodies move coherently,
+	rather than the number of overlapping pairs.
+
+	This works best with many slow moving bodies that overlap often.
+	Very fast or teleporting bodies cause many swaps.
+
+	Static entities are kept in the same axis arrays, but their aabbs 
+	are only read in the step they become static, so they do not move in
+	the arrays while they remain static. Collision masks are applied when the candidate pairs are
+	retrieved, so changing them takes effect immediately.
+
+	:param collision_component: Name of the collision component used by this
+		system, defaults to 'collision'. This component supplies each
+		entities' aabb, collision masks and static flag.
+	:type collision_component: str
+
+	:param stats: If True, keep :class:`CollisionStats` for each time 
+		step. The sort swaps reported are the swaps made by the 
+		insertion sort. Defaults to False.
+	:type stats: bool
+	"""
+
+	def __init__(self, collision_component='collision', stats=False):
+		BroadSweepAndPrune.__init__(self, collision_component, stats)
+		self._pairs = None
+		self._static_ids = None
+
+	def _begin_overlap(self, id1, id2):
+		"""Add the pair to the overlapping pairs if their boxes overlap"""
+		entries1 = self._entries[id1]
+		entries2 = self._entries[id2]
+		if (entries1[0][0] <= entries2[1][0] and entries2[0][0] <= entries1[1][0]
+			and entries1[2][0] <= entries2[3][0] and entries2[2][0] <= entries1[3][0]):
+			key = pair_key(id1, id2)
+			if key not in self._pairs:
+				self._pairs[key] = Pair(
+					self._id_entities[id1], self._id_entities[id2])
+
+	def _insertion_sort(self, axis, low_side):
+		"""Sort the axis array in place, updating the overlapping pairs 
+		for each pair of endpoints swapped. Return the number of swaps.
+		"""
+		ids = self._ids
+		pairs = self._pairs
+		begin_overlap = self._begin_overlap
+		swaps = 0
+		for i in xrange(1, len(axis)):
+			entry = axis[i]
+			value, side, data = entry
+			j = i - 1
+			other = axis[j]
+			while other[0] > value or (other[0] == value and other[1] > side):
+				swaps += 1
+				other_data = other[2]
+				if other_data is not data and side is not other[1]:
+					id1 = ids[data.entity]
+					id2 = ids[other_data.entity]
+					if side is low_side:
+						# Low endpoint moved below the other's high endpoint
+						begin_overlap(id1, id2)
+					elif id1 < id2:
+						# High endpoint moved below the other's low endpoint
+						pairs.pop((id1 << PAIR_KEY_BITS) | id2, None)
+					else:
+						pairs.pop((id2 << PAIR_KEY_BITS) | id1, None)
+				axis[j + 1] = other
+				j -= 1
+				if j < 0:
+					break
+				other = axis[j]
+			axis[j + 1] = entry
+		return swaps
+
+	def _find_pairs(self):
+		"""Return a dict of all pairs with overlapping boxes from scratch.
+		The axis arrays must be sorted.
+		"""
+		LEFT = self.LEFT_ATTR
+		ids = self._ids
+		id_entities = self._id_entities
+		entries = self._entries
+		pairs = {}
+		open = set()
+		for _, side, data in self._by_x:
+			entity_id = ids[data.entity]
+			if side is LEFT:
+				bottom = entries[entity_id][2][0]
+				top = entries[entity_id][3][0]
+				for open_id in open:
+					if bottom <= entries[open_id][3][0] and entries[open_id][2][0] <= top:
+						pairs[pair_key(entity_id, open_id)] = Pair(
+							id_entities[entity_id], id_entities[open_id])
+				open.add(entity_id)
+			else:
+				open.discard(entity_id)
+		return pairs
+
+	def _read_entries(self, position):
+		"""Update the values of the axis entries of non-static entities
+		from their aabbs, or from their positions and collision radii if a
+		position component is given. Entities that became static since the
+		last step are read once more, so their entries are current.
+		"""
+		static_ids = self._static_ids
+		if position is not None:
+			get_position = position.get
+		for entity_id, (left, right, bottom, top) in self._entries.iteritems():
+			data = left[2]
+			if data.static:
+				if entity_id in static_ids:
+					continue
+				static_ids.add(entity_id)
+				if position is not None:
+					self._fit_circle_aabb(data, position)
+			elif entity_id in static_ids:
+				static_ids.discard(entity_id)
+			if position is None:
+				aabb = data.aabb
+				left[0] = aabb.left
+				right[0] = aabb.right
+				bottom[0] = aabb.bottom
+				top[0] = aabb.top
+			else:
+				position_data = get_position(data.entity)
+				if position_data is not None:
+					x, y = position_data.position
+					radius = data.radius
+					left[0] = x - radius
+					right[0] = x + radius
+					bottom[0] = y - radius
+					top[0] = y + radius
+
+	def _add_entity(self, data, position):
+		"""Add the axis entries for a new entity"""
+		self._add_id(data.entity)
+		self._append_entries(data, position)
+		if data.static:
+			self._static_ids.add(self._ids[data.entity])
+			if position is not None:
+				self._fit_circle_aabb(data, position)
+
+	def step(self, dt):
+		"""Update the system for this time step, updates the axis arrays
+		and the overlapping pairs.
+		"""
+		self._step(None)
+
+	def _step(self, position):
+		"""Update the axis arrays and the overlapping pairs, reading the 
+		entities' bounds from their circles if a position component is 
+		given, or their aabbs otherwise
+		"""
+		component = getattr(self.world.components, self.collision_component)
+		stats = self.stats
+		if stats is not None:
+			start = time.time()
+		swaps = removals = 0
+		if self._by_x is None:
+			self._by_x = []
+			self._by_y = []
+			self._ids = {}
+			self._id_entities = {}
+			self._new_id = itertools.count().next
+			self._static = {}
+			self._static_ids = set()
+			self._entries = {}
+			for data in component.itervalues():
+				self._add_entity(data, position)
+			self._by_x.sort()
+			self._by_y.sort()
+			self._pairs = self._find_pairs()
+		else:
+			ids = self._ids
+			if component.deleted_entities:
+				deleted_ids = set()
+				for entity in component.deleted_entities:
+					if entity in ids:
+						entity_id = ids.pop(entity)
+						del self._id_entities[entity_id]
+						del self._entries[entity_id]
+						self._static_ids.discard(entity_id)
+						deleted_ids.add(entity_id)
+				removals = len(deleted_ids)
+				if deleted_ids:
+					self._remove_entries(component.deleted_entities)
+					pairs = self._pairs
+					for key in pairs.keys():
+						if (key >> PAIR_KEY_BITS in deleted_ids 
+							or key & PAIR_KEY_MASK in deleted_ids):
+							del pairs[key]
+			self._read_entries(position)
+			for entity in component.new_entities:
+				if entity not in ids and entity in component:
+					self._add_entity(component[entity], position)
+			swaps = (self._insertion_sort(self._by_x, self.LEFT_ATTR)
+				+ self._insertion_sort(self._by_y, self.BOTTOM_ATTR))
+		if stats is not None:
+			stats.sort_swaps = swaps
+			stats.removals = removals
+			stats.entities = len(self._ids)
+			stats.update_time = time.time() - start
+		self._collision_pairs = None
+
+	@property
+	def collision_pairs(self):
+		"""Set of candidate collision pairs for this timestep"""
+		if self._collision_pairs is None:
+			if self._by_x is None:
+				return set()
+			stats = self.stats
+			if stats is not None:
+				start = time.time()
+			entries = self._entries
+			pairs = self._collision_pairs = set()
+			add_pair = pairs.add
+			for key, pair in self._pairs.iteritems():
+				data1 = entries[key >> PAIR_KEY_BITS][0][2]
+				data2 = entries[key & PAIR_KEY_MASK][0][2]
+				if ((data1.from_mask & data2.into_mask 
+					or data2.from_mask & data1.into_mask)
+					and not (data1.static and data2.static)):
+					add_pair(pair)
+			if stats is not None:
+				stats.candidate_pairs = len(pairs)
+				stats.pair_time = time.time() - start
+		return self._collision_pairs
+
+
+class _TreeNode(object):
+	"""Node of the dynamic aabb tree used by :class:`BroadAABBTree`. Leaf
+	nodes have no children and refer to the collision data of an entity.
+	All nodes store a "fat" box that encloses their leaves, leaves also
+	store the entity's actual aabb as of the last time step.
+	"""
+	__slots__ = ('left', 'bottom', 'right', 'top', 'parent', 'child1', 'child2',
+		'height', 'entity_id', 'data', 'aabb', 'static')
+
+	def __init__(self, parent=None):
+		self.parent = parent
+		self.child1 = None
+		self.child2 = None
+		self.height = 0
+		self.data = None
+
+	def set_union(self, node1, node2):
+		"""Set the box of this node to the union of two nodes' boxes"""
+		self.left = min(node1.left, node2.left)
+		self.bottom = min(node1.bottom, node2.bottom)
+		self.right = max(node1.right, node2.right)
+		self.top = max(node1.top, node2.top)
+
+
+class BroadAABBTree(object):
+	"""2D Broad-phase dynamic bounding volume hierarchy collision detector
+
+	Entities' bounding boxes are stored in a balanced binary tree of
+	enclosing boxes. Each entity is stored using a "fat" box, enlarged by a
+	margin on all sides, and is only removed and reinserted into the tree
+	when its aabb moves outside of its fat box. This makes updates for
+	slow moving and static bodies very cheap.
+
+	Unlike sweep and prune, the tree does not degrade when bodies are
+	clustered along an axis, and it adapts to very uneven body density, 
+	making it suitable for large sparse worlds. Candidate pairs are found
+	by traversing the tree against itself.
+
+	This system has the same interface as :class:`BroadSweepAndPrune` and
+	can be used in its place, e.g., as the `broad_phase` of a
+	:class:`Circular` system.
+
+	:param collision_component: Name of the collision component used by this
+		system, defaults to 'collision'. This component supplies each
+		entities' aabb, collision masks and static flag.
+	:type collision_component: str
+
+	:param margin: Distance that entity boxes are enlarged by on each side
+		when stored in the tree, defaults to 4.0. Larger values mean
+		fewer reinsertions for moving bodies, but more false positives.
+	:type margin: float
+	"""
+	world = None
+	"""|BaseWorld| object this system belongs to"""
+
+	collision_component = None
+	"""Name of world's collision component used by this system"""
+
+	margin = None
+	"""Distance that entity boxes are enlarged by in the tree"""
+
+	def __init__(self, collision_component='collision', margin=4.0):
+		self.collision_component = collision_component
+		self.margin = float(margin)
+		self._root = None
+		self._leaves = None
+		self._id_entities = None
+		self._collision_pairs = None
+	
+	def set_world(self, world):
+		"""Bind the system to a world"""
+		self.world = world
+
+	def _add_leaf(self, data):
+		"""Create a leaf for the entity and insert it into the tree"""
+		leaf = _TreeNode()
+		leaf.entity_id = self._new_id()
+		leaf.data = data
+		leaf.static = data.static
+		aabb = data.aabb
+		leaf.aabb = (aabb.left, aabb.bottom, aabb.right, aabb.top)
+		self._leaves[data.entity] = leaf
+		self._id_entities[leaf.entity_id] = data.entity
+		self._insert_leaf(leaf)
+
+	def _insert_leaf(self, leaf):
+		"""Insert the leaf into the tree, choosing the sibling that
+		minimizes the increase in the tree's total box perimeter
+		"""
+		margin = self.margin
+		left, bottom, right, top = leaf.aabb
+		leaf.left = left - margin
+		leaf.bottom = bottom - margin
+		leaf.right = right + margin
+		leaf.top = top + margin
+		if self._root is None:
+			self._root = leaf
+			leaf.parent = None
+			return
+		left = leaf.left
+		bottom = leaf.bottom
+		right = leaf.right
+		top = leaf.top
+		node = self._root
+		while node.child1 is not None:
+			perimeter = node.right - node.left + node.top - node.bottom
+			combined = (max(node.right, right) - min(node.left, left)
+				+ max(node.top, top) - min(node.bottom, bottom))
+			# Cost of creating a new parent for this node and the leaf
+			cost = 2.0 * combined
+			# Minimum cost of pushing the leaf further down the tree
+			inheritance = 2.0 * (combined - perimeter)
+			child_costs = []
+			for child in (node.child1, node.child2):
+				child_cost = (max(child.right, right) - min(child.left, left)
+					+ max(child.top, top) - min(child.bottom, bottom)) + inheritance
+				if child.child1 is not None:
+					child_cost -= child.right - child.left + child.top - child.bottom
+				child_costs.append(child_cost)
+			cost1, cost2 = child_costs
+			if cost < cost1 and cost < cost2:
+				break
+			if cost1 < cost2:
+				node = node.child1
+			else:
+				node = node.child2
+
+		# Create a new parent for the sibling and the leaf
+		sibling = node
+		old_parent = sibling.parent
+		new_parent = _TreeNode(old_parent)
+		new_parent.set_union(leaf, sibling)
+		new_parent.height = sibling.height + 1
+		new_parent.child1 = sibling
+		new_parent.child2 = leaf
+		sibling.parent = new_parent
+		leaf.parent = new_parent
+		if old_parent is None:
+			self._root = new_parent
+		elif old_parent.child1 is sibling:
+			old_parent.child1 = new_parent
+		else:
+			old_parent.child2 = new_parent
+		self._refit(leaf.parent)
+
+	def _remove_leaf(self, leaf):
+		"""Remove the leaf from the tree"""
+		if leaf is self._root:
+			self._root = None
+			return
+		parent = leaf.parent
+		grand_parent = parent.parent
+		if parent.child1 is leaf:
+			sibling = parent.child2
+		else:
+			sibling = parent.child1
+		leaf.parent = None
+		if grand_parent is None:
+			self._root = sibling
+			sibling.parent = None
+		else:
+			if grand_parent.child1 is parent:
+				grand_parent.child1 = sibling
+			else:
+				grand_parent.child2 = sibling
+			sibling.parent = grand_parent
+			self._refit(grand_parent)
+
+	def _refit(self, node):
+		"""Walk up the tree from the node, rebalancing and updating
+		the boxes and heights of the nodes
+		"""
+		while node is not None:
+			node = self._balance(node)
+			child1 = node.child1
+			child2 = node.child2
+			node.height = 1 + max(child1.height, child2.height)
+			node.set_union(child1, child2)
+			node = node.parent
+
+	def _balance(self, a):
+		"""Perform a left or right rotation if node a is imbalanced.
+		Return the new root of the subtree.
+		"""
+		if a.child1 is None or a.height < 2:
+			return a
+		b = a.child1
+		c = a.child2
+		balance = c.height - b.height
+		if balance > 1:
+			# Rotate c up
+			f = c.child1
+			g = c.child2
+			c.child1 = a
+			c.parent = a.parent
+			a.parent = c
+			self._replace_child(c.parent, a, c)
+			if f.height > g.height:
+				c.child2 = f
+				a.child2 = g
+				g.parent = a
+				a.set_union(b, g)
+				c.set_union(a, f)
+				a.height = 1 + max(b.height, g.height)
+				c.height = 1 + max(a.height, f.height)
+			else:
+				c.child2 = g
+				a.child2 = f
+				f.parent = a
+				a.set_union(b, f)
+				c.set_union(a, g)
+				a.height = 1 + max(b.height, f.height)
+				c.height = 1 + max(a.height, g.height)
+			return c
+		if balance < -1:
+			# Rotate b up
+			d = b.child1
+			e = b.child2
+			b.child1 = a
+			b.parent = a.parent
+			a.parent = b
+			self._replace_child(b.parent, a, b)
+			if d.height > e.height:
+				b.child2 = d
+				a.child1 = e
+				e.parent = a
+				a.set_union(c, e)
+				b.set_union(a, d)
+				a.height = 1 + max(c.height, e.height)
+				b.height = 1 + max(a.height, d.height)
+			else:
+				b.child2 = e
+				a.child1 = d
+				d.parent = a
+				a.set_union(c, d)
+				b.set_union(a, e)
+				a.height = 1 + max(c.height, d.height)
+				b.height = 1 + max(a.height, e.height)
+			return b
+		return a
+
+	def _replace_child(self, parent, old_child, new_child):
+		"""Replace a child of the parent node, or the root if parent
+		is None
+		"""
+		if parent is None:
+			self._root = new_child
+		elif parent.child1 is old_child:
+			parent.child1 = new_child
+		else:
+			parent.child2 = new_child
+
+	def step(self, dt):
+		"""Update the system for this time step. Entities whose aabbs
+		have moved outside of their fat boxes are reinserted into the tree.
+		The aabbs of static entities are not read while they remain static.
+		"""
+		component = getattr(self.world.components, self.collision_component)
+		if self._leaves is None:
+			self._root = None
+			self._leaves = {}
+			self._id_entities = {}
+			self._new_id = itertools.count().next
+			for data in component.itervalues():
+				self._add_leaf(data)
+		else:
+			leaves = self._leaves
+			if component.deleted_entities:
+				for entity in component.deleted_entities:
+					if entity in leaves:
+						leaf = leaves.pop(entity)
+						del self._id_entities[leaf.entity_id]
+						self._remove_leaf(leaf)
+			moved = []
+			for leaf in leaves.itervalues():
+				data = leaf.data
+				if leaf.static and data.static:
+					continue
+				leaf.static = data.static
+				aabb = data.aabb
+				left = aabb.left
+				bottom = aabb.bottom
+				right = aabb.right
+				top = aabb.top
+				leaf.aabb = (left, bottom, right, top)
+				if (left < leaf.left or bottom < leaf.bottom 
+					or right > leaf.right or top > leaf.top):
+					moved.append(leaf)
+			for leaf in moved:
+				self._remove_leaf(leaf)
+				self._insert_leaf(leaf)
+			for entity in component.new_entities:
+				if entity not in leaves:
+					self._add_leaf(component[entity])
+		self._collision_pairs = None
+
+	@property
+	def collision_pairs(self):
+		"""Set of candidate collision pairs for this timestep"""
+		if self._collision_pairs is None:
+			root = self._root
+			if root is None or root.child1 is None:
+				return set()
+			BITS = PAIR_KEY_BITS
+			keys = []
+			add_key = keys.append
+			# Traverse the tree against itself. A node paired with 
+			# None means test its subtree against itself
+			stack = [(root, None)]
+			push = stack.append
+			pop = stack.pop
+			while stack:
+				a, b = pop()
+				if b is None:
+					if a.child1 is not None:
+						push((a.child1, None))
+						push((a.child2, None))
+						push((a.child1, a.child2))
+					continue
+				if (a.left > b.right or b.left > a.right 
+					or a.bottom > b.top or b.bottom > a.top):
+					continue
+				a_leaf = a.child1 is None
+				b_leaf = b.child1 is None
+				if a_leaf and b_leaf:
+					if a.static and b.static:
+						continue
+					left_a, bottom_a, right_a, top_a = a.aabb
+					left_b, bottom_b, right_b, top_b = b.aabb
+					if (left_a > right_b or left_b > right_a 
+						or bottom_a > top_b or bottom_b > top_a):
+						continue
+					data_a = a.data
+					data_b = b.data
+					if (data_a.from_mask & data_b.into_mask 
+						or data_b.from_mask & data_a.into_mask):
+						id_a = a.entity_id
+						id_b = b.entity_id
+						if id_a < id_b:
+							add_key((id_a << BITS) | id_b)
+						else:
+							add_key((id_b << BITS) | id_a)
+				elif b_leaf or (not a_leaf and 
+					a.right - a.left + a.top - a.bottom > b.right - b.left + b.top - b.bottom):
+					# Descend into the larger node
+					push((a.child1, b))
+					push((a.child2, b))
+				else:
+					push((a, b.child1))
+					push((a, b.child2))
+			id_entities = self._id_entities
+			self._collision_pairs = set([
+				Pair(id_entities[key >> BITS], id_entities[key & PAIR_KEY_MASK])
+				for key in keys])
+		return self._collision_pairs
+
+	def query_point(self, x_or_point, y=None, from_mask=0xffffffff):
+		"""Hit test at the point specified. 
+
+		:param x_or_point: x coordinate (float) or sequence of (x, y) floats.
+
+		:param y: y coordinate (float) if x is not a sequence
+
+		:param from_mask: Bit mask used to filter query results. This value
+			is bit ANDed with candidate entities' ``collision.into_mask``.
+			If the result is non-zero, then it is considered a hit. By
+			default all entities colliding with the input point are
+			returned.
+
+		:return: A set of entities where the point is inside their bounding
+			boxes as of the last time step.
+		"""
+		hits = set()
+		if self._root is None:
+			return hits
+		if y is None:
+			x, y = x_or_point
+		else:
+			x = x_or_point
+		stack = [self._root]
+		push = stack.append
+		pop = stack.pop
+		while stack:
+			node = pop()
+			if x < node.left or x > node.right or y < node.bottom or y > node.top:
+				continue
+			if node.child1 is not None:
+				push(node.child1)
+				push(node.child2)
+			else:
+				left, bottom, right, top = node.aabb
+				if (left <= x <= right and bottom <= y <= top 
+					and from_mask & node.data.into_mask):
+					hits.add(node.data.entity)
+		return hits
+
+
 class Circular(object):
 	"""Basic narrow-phase collision detector which treats all entities as
 	circles with their radius defined in the collision component.
@@ -359,6 +1455,36 @@ class Circular(object):
 	:param broad_phase: A broad-phase collision system to use as a source
 		for collision pairs. If not specified, a :class:`BroadSweepAndPrune`
 		system will be created automatically.
+
+	:param swept: If True, perform continuous collision detection. Each
+		entity's aabb covers the path it travelled over the last time step,
+		derived from its position and `movement.velocity`, and the narrow
+		phase computes the time of impact for circles that touched at any
+		point along their paths. This keeps fast moving entities from passing
+		through thin targets between steps. The movement system must run
+		before this system for the paths to be correct. Defaults to False.
+	:type swept: bool
+
+	:param movement_component: Name of movement component used when
+		`swept` is True, defaults to 'movement'. Entities not in this
+		component are treated as stationary.
+	:type movement_component: str
+
+	:param stats: If True, keep :class:`CollisionStats` for each time 
+		step. The statistics object is shared with the broad phase if it
+		supports statistics and does not keep its own. With statistics 
+		enabled, collision pairs are found before the handlers are
+		invoked, so that each phase is timed separately. Defaults to False.
+	:type stats: bool
+
+	:param fused: If True, and `update_aabbs` is True, `swept` is False
+		and the broad phase supports it (it has a ``step_circles`` method,
+		like :class:`BroadSweepAndPrune`), the entities' positions and
+		radii are fed straight into the broad phase rather than being
+		written to their `collision.aabb` fields and read back. This
+		makes updating the broad phase faster, but the aabbs of moving
+		entities are no longer kept up to date. Defaults to False.
+	:type fused: bool
 	"""
 	world = None
 	"""|BaseWorld| object this system belongs to"""
@@ -382,16 +1508,43 @@ class Circular(object):
 	broad_phase = None
 	"""Broad phase collision system used as a source for collision pairs"""
 
+	swept = False
+	"""Flag to indicate whether the system performs swept (continuous)
+	collision detection
+	"""
+
+	movement_component = None
+	"""Name of world's movement component used for swept collision detection"""
+
+	fused = False
+	"""Flag to indicate whether entity bounds are fed straight into the broad
+	phase instead of being written to the `collision.aabb` fields
+	"""
+
+	stats = None
+	""":class:`CollisionStats` for the last time step, or None if the
+	system does not keep statistics
+	"""
+
 	def __init__(self, handlers=(), position_component='position', 
-		collision_component='collision', update_aabbs=True, broad_phase=None):
+		collision_component='collision', update_aabbs=True, broad_phase=None,
+		swept=False, movement_component='movement', fused=False, stats=False):
 		self.handlers = tuple(handlers)
 		if broad_phase is None:
 			broad_phase = BroadSweepAndPrune(collision_component)
 		self.collision_component = collision_component
 		self.position_component = position_component
+		self.movement_component = movement_component
 		self.update_aabbs = bool(update_aabbs)
+		self.swept = bool(swept)
+		self.fused = bool(fused)
 		self.broad_phase = broad_phase
+		if stats:
+			self.stats = CollisionStats()
+			if hasattr(broad_phase, 'stats') and broad_phase.stats is None:
+				broad_phase.stats = self.stats
 		self._collision_pairs = None
+		self._dt = 0
 	
 	def set_world(self, world):
 		"""Bind the system to a world"""
@@ -405,42 +1558,173 @@ class Circular(object):
 		"""Update the collision system for this time step and invoke
 		the handlers
 		"""
-		if self.update_aabbs:
-			for position, collision in self.world.components.join(
-				self.position_component, self.collision_component):
-				aabb = collision.aabb
-				x, y = position.position
-				radius = collision.radius
-				aabb.left = x - radius
-				aabb.right = x + radius
-				aabb.bottom = y - radius
-				aabb.top = y + radius
-		self.broad_phase.step(dt)
+		self._dt = dt
+		if (self.fused and self.update_aabbs and not self.swept
+			and hasattr(self.broad_phase, 'step_circles')):
+			self.broad_phase.step_circles(dt, self.position_component)
+		else:
+			if self.update_aabbs:
+				if self.swept:
+					self._update_swept_aabbs(dt)
+				else:
+					for position, collision in self.world.components.join(
+						self.position_component, self.collision_component):
+						aabb = collision.aabb
+						x, y = position.position
+						radius = collision.radius
+						aabb.left = x - radius
+						aabb.right = x + radius
+						aabb.bottom = y - radius
+						aabb.top = y + radius
+			self.broad_phase.step(dt)
 		self._collision_pairs = None
-		for handler in self.handlers:
-			handler(self)
+		stats = self.stats
+		if stats is None:
+			for handler in self.handlers:
+				handler(self)
+		else:
+			self.collision_pairs
+			start = time.time()
+			for handler in self.handlers:
+				handler(self)
+			stats.handler_time = time.time() - start
 	
+	def _movement(self):
+		"""Return the movement component used for swept collision or
+		an empty dict if the world has none
+		"""
+		return getattr(self.world.components, self.movement_component, {})
+
+	def _update_swept_aabbs(self, dt):
+		"""Update the entities' aabbs to enclose their circles at both their
+		previous and current positions
+		"""
+		movement = self._movement()
+		for position, collision in self.world.components.join(
+			self.position_component, self.collision_component):
+			aabb = collision.aabb
+			x, y = position.position
+			radius = collision.radius
+			if position.entity in movement:
+				vx, vy = movement[position.entity].velocity
+				x0 = x - vx * dt
+				y0 = y - vy * dt
+			else:
+				x0 = x
+				y0 = y
+			aabb.left = min(x, x0) - radius
+			aabb.right = max(x, x0) + radius
+			aabb.bottom = min(y, y0) - radius
+			aabb.top = max(y, y0) + radius
+
+	@staticmethod
+	def time_of_impact(start1, travel1, radius1, start2, travel2, radius2):
+		"""Return the time of impact of two moving circles, or None if they
+		do not touch. The time is expressed as the fraction of the travel
+		vectors at which the circles first touch, 0 if they are touching at
+		their start positions.
+
+		:param start1: Start position of the first circle (Vec2d)
+		:param travel1: Displacement of the first circle during the step (Vec2d)
+		:param radius1: Radius of the first circle
+		:param start2: Start position of the second circle (Vec2d)
+		:param travel2: Displacement of the second circle during the step (Vec2d)
+		:param radius2: Radius of the second circle
+		"""
+		separation = start2 - start1
+		relative_travel = travel2 - travel1
+		c = separation.get_length_sqrd() - (radius1 + radius2)**2
+		if c <= 0:
+			return 0.0
+		b = separation.dot(relative_travel)
+		if b >= 0:
+			# Moving apart or parallel
+			return None
+		a = relative_travel.get_length_sqrd()
+		discriminant = b*b - a*c
+		if discriminant < 0:
+			return None
+		t = (-b - math.sqrt(discriminant)) / a
+		if t > 1.0:
+			return None
+		return t
+
+	def _swept_collision_pairs(self):
+		"""Compute collision pairs using the time of impact of the circles
+		travelling over the last time step
+		"""
+		position = getattr(self.world.components, self.position_component)
+		collision = getattr(self.world.components, self.collision_component)
+		movement = self._movement()
+		dt = self._dt
+		time_of_impact = self.time_of_impact
+		zero = Vec2d(0, 0)
+		pairs = set()
+		for pair in self.broad_phase.collision_pairs:
+			entity1, entity2 = pair
+			position1 = position[entity1].position
+			position2 = position[entity2].position
+			radius1 = collision[entity1].radius
+			radius2 = collision[entity2].radius
+			if entity1 in movement:
+				travel1 = movement[entity1].velocity * dt
+			else:
+				travel1 = zero
+			if entity2 in movement:
+				travel2 = movement[entity2].velocity * dt
+			else:
+				travel2 = zero
+			start1 = position1 - travel1
+			start2 = position2 - travel2
+			t = time_of_impact(start1, travel1, radius1, start2, travel2, radius2)
+			if t is not None:
+				contact1 = start1 + travel1 * t
+				contact2 = start2 + travel2 * t
+				normal = (contact2 - contact1).normalized()
+				pair.set_point_normal(
+					normal * radius1 + contact1, normal,
+					normal * -radius2 + contact2, -normal)
+				pair.time_of_impact = t
+				pairs.add(pair)
+		return pairs
+
 	@property
 	def collision_pairs(self):
 		"""The set of entity pairs in collision in this timestep"""
 		if self._collision_pairs is None:
-			position = getattr(self.world.components, self.position_component)
-			collision = getattr(self.world.components, self.collision_component)
-			pairs = self._collision_pairs = set()
-			for pair in self.broad_phase.collision_pairs:
-				entity1, entity2 = pair
-				position1 = position[entity1].position
-				position2 = position[entity2].position
-				radius1 = collision[entity1].radius
-				radius2 = collision[entity2].radius
-				separation = position2 - position1
-				if separation.get_length_sqrd() <= (radius1 + radius2)**2:
-					normal = separation.normalized()
-					pair.set_point_normal(
-						normal * radius1 + position1, normal,
-						normal * -radius2 + position2, -normal)
-					pairs.add(pair)
+			stats = self.stats
+			if stats is not None:
+				# Find the candidates first so they are timed separately
+				stats.candidate_pairs = len(self.broad_phase.collision_pairs)
+				start = time.time()
+			if self.swept:
+				self._collision_pairs = self._swept_collision_pairs()
+			else:
+				self._collision_pairs = self._circle_collision_pairs()
+			if stats is not None:
+				stats.collisions = len(self._collision_pairs)
+				stats.narrow_time = time.time() - start
 		return self._collision_pairs
+
+	def _circle_collision_pairs(self):
+		"""Return the set of candidate pairs whose circles overlap"""
+		position = getattr(self.world.components, self.position_component)
+		collision = getattr(self.world.components, self.collision_component)
+		pairs = set()
+		for pair in self.broad_phase.collision_pairs:
+			entity1, entity2 = pair
+			position1 = position[entity1].position
+			position2 = position[entity2].position
+			radius1 = collision[entity1].radius
+			radius2 = collision[entity2].radius
+			separation = position2 - position1
+			if separation.get_length_sqrd() <= (radius1 + radius2)**2:
+				normal = separation.normalized()
+				pair.set_point_normal(
+					normal * radius1 + position1, normal,
+					normal * -radius2 + position2, -normal)
+				pairs.add(pair)
+		return pairs
 	
 	def query_point(self, x_or_point, y=None, from_mask=0xffffffff):
 		"""Hit test at the point specified. 
@@ -473,6 +1757,510 @@ class Circular(object):
 		return hits
 
 
+def _collide_strip(lefts, xs, ys, radii, from_masks, into_masks, 
+	strip_left, strip_right, start, end):
+	"""Return the pair keys of the circles in collision within a strip of
+	the world. The arrays describe the circles sorted by their left edges.
+	Only the circles indexed from start to end are considered, and a pair
+	is only reported by the strip that contains the left edge of the 
+	pair's box overlap so that each pair is found only once.
+	"""
+	BITS = PAIR_KEY_BITS
+	keys = []
+	# Circles whose boxes are open along x, and a heap of their right 
+	# edges used to expire them as the sweep moves past them
+	active = set()
+	expiry = []
+	add_active = active.add
+	remove_active = active.remove
+	heappush = heapq.heappush
+	heappop = heapq.heappop
+	for i in xrange(start, end):
+		left = lefts[i]
+		x = xs[i]
+		y = ys[i]
+		radius = radii[i]
+		bottom = y - radius
+		top = y + radius
+		while expiry and expiry[0][0] < left:
+			remove_active(heappop(expiry)[1])
+		if strip_left <= left < strip_right:
+			from_mask = from_masks[i]
+			into_mask = into_masks[i]
+			for j in active:
+				radius_j = radii[j]
+				y_j = ys[j]
+				if bottom > y_j + radius_j or y_j - radius_j > top:
+					continue
+				if not (from_mask & into_masks[j] or from_masks[j] & into_mask):
+					continue
+				dx = xs[j] - x
+				dy = y_j - y
+				if dx*dx + dy*dy <= (radius + radius_j)**2:
+					keys.append((j << BITS) | i)
+		add_active(i)
+		heappush(expiry, (x + radius, i))
+	return keys
+
+_shared_arrays = None
+
+def _init_collision_worker(arrays):
+	"""Initialize a collision worker process with the shared arrays"""
+	global _shared_arrays
+	_shared_arrays = arrays
+
+def _collide_shared_strip(strip):
+	"""Collide a strip using the worker's shared arrays"""
+	return _collide_strip(*(_shared_arrays + strip))
+
+def _terminate_pool(pool):
+	"""Shut down a pool of collision workers"""
+	pool.terminate()
+	pool.join()
+
+
+class ParallelCircular(object):
+	"""Narrow-phase collision detector which treats all entities as circles,
+	like :class:`Circular`, but distributes the work among multiple 
+	processes for very large numbers of entities.
+
+	Each time step, the entities' positions, radii and collision masks are
+	copied into arrays in shared memory, sorted by the left edge of their
+	bounding boxes. The world is divided into vertical strips containing 
+	roughly equal numbers of entities, with each strip also including
+	the entities overlapping it from the left. Each strip is then swept for
+	colliding circles in a pool of worker processes. Pairs are owned by
+	a single strip, so the results can simply be merged.
+
+	Since the broad and narrow phase are performed together in the workers,
+	this system does not use a separate broad-phase system. It does not
+	update the entities' `collision.aabb` fields.
+
+	:param handlers: A sequence of collision handler functions that are invoked
+		after collision detection.
+	:type handlers: sequence of functions
+	
+	:param collision_component: Name of collision component for this system,
+		defaults to 'collision'. This supplies each entity's collision
+		radius and masks.
+	:type collision_component: str
+
+	:param position_component: Name of position component for this system,
+		defaults to 'position'. This supplies each entity's position.
+	:type position_component: str
+
+	:param processes: Number of worker processes, defaults to the number
+		of CPUs available.
+	:type processes: int
+
+	:param strips: Number of strips the world is divided into. Defaults to
+		four times the number of processes to balance the load.
+	:type strips: int
+
+	:param min_parallel_count: Minimum number of entities for the work to 
+		be distributed to the worker processes, defaults to 5000. With fewer 
+		entities the overhead outweighs the benefit and collision detection
+		is done in-process.
+	:type min_parallel_count: int
+	"""
+	world = None
+	"""|BaseWorld| object this system belongs to"""
+
+	position_component = None
+	"""Name of world's position component used by this system"""
+
+	collision_component = None
+	"""Name of world's collision component used by this system"""
+
+	handlers = None
+	"""A sequence of collision handler functions invoke after collision
+	detection
+	"""
+
+	processes = None
+	"""Number of worker processes"""
+
+	strips = None
+	"""Number of strips the world is divided into"""
+
+	min_parallel_count = None
+	"""Minimum number of entities needed to use the worker processes"""
+
+	def __init__(self, handlers=(), position_component='position', 
+		collision_component='collision', processes=None, strips=None,
+		min_parallel_count=5000):
+		self.handlers = tuple(handlers)
+		self.collision_component = collision_component
+		self.position_component = position_component
+		if processes is None:
+			processes = multiprocessing.cpu_count()
+		self.processes = int(processes)
+		self.strips = int(strips or self.processes * 4)
+		self.min_parallel_count = min_parallel_count
+		self._pool = None
+		self._pool_finalizer = None
+		self._arrays = None
+		self._capacity = 0
+		self._entities = []
+		self._lefts = []
+		self._max_diameter = 0
+		self._keys = []
+		self._collision_pairs = None
+	
+	def set_world(self, world):
+		"""Bind the system to a world. The worker processes are shut
+		down when the system is unbound from its world
+		"""
+		if world is not self.world:
+			self.close()
+		self.world = world
+		for handler in self.handlers:
+			if hasattr(handler, 'set_world'):
+				handler.set_world(world)
+
+	def close(self):
+		"""Shut down the worker processes. They will be restarted
+		automatically if needed by a later time step. The workers are 
+		also shut down when the system is garbage collected or the 
+		program exits.
+		"""
+		if self._pool is not None:
+			self._pool_finalizer()
+			self._pool_finalizer = None
+			self._pool = None
+
+	def _shared(self, count):
+		"""Return the shared arrays and worker pool, reallocating them if
+		they are too small for count entities
+		"""
+		if count > self._capacity or self._pool is None:
+			self.close()
+			if count > self._capacity:
+				self._capacity = max(count * 2, 1024)
+				self._arrays = tuple(
+					[sharedctypes.RawArray('d', self._capacity) for i in range(4)]
+					+ [sharedctypes.RawArray('L', self._capacity) for i in range(2)])
+			# Workers inherit the arrays when the pool is created
+			self._pool = multiprocessing.Pool(self.processes, 
+				_init_collision_worker, (self._arrays,))
+			# The finalizer must not reference the system, so that it can
+			# be collected
+			self._pool_finalizer = util.Finalize(self, _terminate_pool, 
+				(self._pool,), exitpriority=10)
+		return self._arrays, self._pool
+
+	def _strip_bounds(self, count):
+		"""Return a list of (strip_left, strip_right, start, end) tuples
+		for each strip
+		"""
+		lefts = self._lefts
+		strips = max(min(self.strips, count // 64), 1)
+		edges = [float('-inf')] + [
+			lefts[i * count // strips] for i in range(1, strips)] + [float('inf')]
+		bounds = []
+		for strip_left, strip_right in zip(edges[:-1], edges[1:]):
+			if strip_left == strip_right:
+				continue
+			start = bisect_left(lefts, strip_left - self._max_diameter)
+			end = bisect_left(lefts, strip_right)
+			bounds.append((strip_left, strip_right, start, end))
+		return bounds
+
+	def step(self, dt):
+		"""Update the collision system for this time step and invoke
+		the handlers
+		"""
+		rows = []
+		append = rows.append
+		for position, collision in self.world.components.join(
+			self.position_component, self.collision_component):
+			x, y = position.position
+			radius = collision.radius
+			append((x - radius, x, y, radius, 
+				collision.from_mask, collision.into_mask, position.entity))
+		rows.sort(key=operator.itemgetter(0))
+		count = len(rows)
+		columns = zip(*rows) or [()] * 7
+		self._lefts = list(columns[0])
+		self._entities = columns[6]
+		self._max_diameter = 2 * max(columns[3] or [0])
+		strips = self._strip_bounds(count)
+		if count >= self.min_parallel_count and self.processes > 1:
+			arrays, pool = self._shared(count)
+			for array, column in zip(arrays, columns):
+				array[:count] = column
+			self._keys = []
+			for keys in pool.map(_collide_shared_strip, strips):
+				self._keys.extend(keys)
+		else:
+			self._keys = []
+			for strip in strips:
+				self._keys.extend(_collide_strip(*(tuple(columns[:6]) + strip)))
+		self._columns = columns
+		self._collision_pairs = None
+		for handler in self.handlers:
+			handler(self)
+
+	@property
+	def collision_pairs(self):
+		"""The set of entity pairs in collision in this timestep"""
+		if self._collision_pairs is None:
+			BITS = PAIR_KEY_BITS
+			pairs = self._collision_pairs = set()
+			if not self._keys:
+				return pairs
+			entities = self._entities
+			_, xs, ys, radii = self._columns[:4]
+			for key in self._keys:
+				i = key >> BITS
+				j = key & PAIR_KEY_MASK
+				position1 = Vec2d(xs[i], ys[i])
+				position2 = Vec2d(xs[j], ys[j])
+				normal = (position2 - position1).normalized()
+				pair = Pair(entities[i], entities[j])
+				pair.set_point_normal(
+					normal * radii[i] + position1, normal,
+					normal * -radii[j] + position2, -normal)
+				pairs.add(pair)
+		return self._collision_pairs
+
+	def query_point(self, x_or_point, y=None, from_mask=0xffffffff):
+		"""Hit test at the point specified. 
+
+		:param x_or_point: x coordinate (float) or sequence of (x, y) floats.
+
+		:param y: y coordinate (float) if x is not a sequence
+
+		:param from_mask: Bit mask used to filter query results. This value
+			is bit ANDed with candidate entities' ``collision.into_mask``.
+			If the result is non-zero, then it is considered a hit. By
+			default all entities colliding with the input point are
+			returned.
+
+		:return: A set of entities where the point is inside their collision
+			radii as of the last time step.
+		"""
+		if y is None:
+			x, y = x_or_point
+		else:
+			x = x_or_point
+		hits = set()
+		if not self._lefts:
+			return hits
+		_, xs, ys, radii, _, into_masks = self._columns[:6]
+		start = bisect_left(self._lefts, x - self._max_diameter)
+		end = bisect_right(self._lefts, x)
+		for i in xrange(start, end):
+			dx = x - xs[i]
+			dy = y - ys[i]
+			if dx*dx + dy*dy <= radii[i]**2 and from_mask & into_masks[i]:
+				hits.add(self._entities[i])
+		return hits
+
+
+class NearestNeighbors(object):
+	"""Spatial index answering nearest neighbor queries, such as "the k 
+	entities closest to a point", for entities in the collision component.
+
+	Add this system to the world before the systems that query it. The
+	index is a kd-tree of the entities' positions that is rebuilt lazily
+	on the first query after each time step, so stepping the system costs
+	nothing if it is not queried. Each subtree records the combined
+	``collision.into_mask`` of its entities, so queries filtered by mask
+	skip whole subtrees with no matching entities.
+
+	Distances are measured between points and the entities' positions,
+	collision radii are not taken into account. 
+
+	Example::
+
+		targets = world.systems.nearest.nearest(missile.position.position, 
+			k=3, from_mask=ENEMY_MASK)
+
+	:param position_component: Name of position component for this system,
+		defaults to 'position'. This supplies each entity's position.
+	:type position_component: str
+
+	:param collision_component: Name of collision component for this system,
+		defaults to 'collision'. This supplies each entity's collision masks.
+		Only entities in both components are indexed.
+	:type collision_component: str
+	"""
+	world = None
+	"""|BaseWorld| object this system belongs to"""
+
+	position_component = None
+	"""Name of world's position component used by this system"""
+
+	collision_component = None
+	"""Name of world's collision component used by this system"""
+
+	def __init__(self, position_component='position', 
+		collision_component='collision'):
+		self.position_component = position_component
+		self.collision_component = collision_component
+		self._tree = None
+
+	def set_world(self, world):
+		"""Bind the system to a world"""
+		self.world = world
+		self._tree = None
+
+	def step(self, dt):
+		"""Invalidate the index for this time step"""
+		self._tree = None
+
+	def _build(self):
+		"""Build the kd-tree of the indexed entities. The tree is stored
+		implicitly in arrays: the entity at the middle of each range of 
+		the arrays splits the range into its two subtrees.
+		"""
+		items = [(position.position[0], position.position[1], 
+			collision.into_mask, position.entity)
+			for position, collision in self.world.components.join(
+				self.position_component, self.collision_component)]
+		count = len(items)
+		axes = [0] * count
+		subtree_masks = [0] * count
+		stack = [(0, count)]
+		while stack:
+			lo, hi = stack.pop()
+			if lo >= hi:
+				continue
+			part = items[lo:hi]
+			xs = [item[0] for item in part]
+			ys = [item[1] for item in part]
+			# Split along the axis with the widest spread
+			axis = int(max(ys) - min(ys) > max(xs) - min(xs))
+			part.sort(key=operator.itemgetter(axis))
+			items[lo:hi] = part
+			mid = (lo + hi) // 2
+			axes[mid] = axis
+			subtree_masks[mid] = reduce(operator.or_, [item[2] for item in part])
+			stack.append((lo, mid))
+			stack.append((mid + 1, hi))
+		self._tree = ([item[0] for item in items], [item[1] for item in items],
+			[item[2] for item in items], [item[3] for item in items],
+			axes, subtree_masks)
+		return self._tree
+
+	def _nearest_indices(self, x, y, k, from_mask, max_distance):
+		"""Return a list of (distance squared, index) of the k nearest 
+		matching entities, nearest first. The tree must be built.
+		"""
+		xs, ys, into_masks, _, axes, subtree_masks = self._tree
+		best = []
+		if max_distance is None:
+			worst = float('inf')
+		else:
+			worst = max_distance * max_distance
+		heappush = heapq.heappush
+		heapreplace = heapq.heapreplace
+		# Each stack entry is a range of the arrays and the squared 
+		# distance along the split axis to the region it covers
+		stack = [(0, len(xs), 0.0)]
+		pop = stack.pop
+		push = stack.append
+		while stack:
+			lo, hi, bound = pop()
+			if lo >= hi or bound > worst:
+				continue
+			mid = (lo + hi) // 2
+			if not from_mask & subtree_masks[mid]:
+				continue
+			px = xs[mid]
+			py = ys[mid]
+			if from_mask & into_masks[mid]:
+				dx = px - x
+				dy = py - y
+				dist = dx*dx + dy*dy
+				if dist <= worst:
+					if len(best) < k:
+						heappush(best, (-dist, mid))
+						if len(best) == k:
+							worst = -best[0][0]
+					else:
+						heapreplace(best, (-dist, mid))
+						worst = -best[0][0]
+			if axes[mid]:
+				diff = y - py
+			else:
+				diff = x - px
+			# Visit the near side first
+			if diff < 0:
+				push((mid + 1, hi, diff * diff))
+				push((lo, mid, 0.0))
+			else:
+				push((lo, mid, diff * diff))
+				push((mid + 1, hi, 0.0))
+		return sorted((-dist, index) for dist, index in best)
+
+	def nearest(self, x_or_point, y=None, k=1, from_mask=0xffffffff,
+		max_distance=None):
+		"""Return the entities nearest to the point specified.
+
+		:param x_or_point: x coordinate (float) or sequence of (x, y) floats.
+
+		:param y: y coordinate (float) if x is not a sequence
+
+		:param k: Maximum number of entities to return, defaults to 1.
+		:type k: int
+
+		:param from_mask: Bit mask used to filter query results. This value
+			is bit ANDed with candidate entities' ``collision.into_mask``.
+			If the result is non-zero, the entity is considered. By default
+			all entities are considered.
+
+		:param max_distance: If specified, only entities within this 
+			distance of the point are returned.
+		:type max_distance: float
+
+		:return: A list of up to k entities, nearest first.
+		"""
+		if y is None:
+			x, y = x_or_point
+		else:
+			x = x_or_point
+		if k < 1:
+			return []
+		if self._tree is None:
+			self._build()
+		entities = self._tree[3]
+		return [entities[index] for _, index in 
+			self._nearest_indices(x, y, k, from_mask, max_distance)]
+
+	def nearest_many(self, points, k=1, from_mask=0xffffffff, 
+		max_distance=None):
+		"""Return the entities nearest to each of many points. This is
+		more efficient than calling :meth:`nearest` for each point.
+
+		:param points: Sequence of (x, y) points.
+
+		:param k: Maximum number of entities to return for each point, 
+			defaults to 1.
+		:type k: int
+
+		:param from_mask: Bit mask used to filter query results, as for
+			:meth:`nearest`.
+
+		:param max_distance: If specified, only entities within this 
+			distance of each point are returned.
+		:type max_distance: float
+
+		:return: A list containing a list of up to k entities, nearest 
+			first, for each point.
+		"""
+		if k < 1:
+			return [[] for point in points]
+		if self._tree is None:
+			self._build()
+		entities = self._tree[3]
+		nearest_indices = self._nearest_indices
+		return [[entities[index] for _, index in 
+			nearest_indices(x, y, k, from_mask, max_distance)]
+			for x, y in points]
+
+
 def dispatch_events(collision_system):
 	"""Collision handler that dispatches `on_collide()` events to entities
 	marked for collision by the specified collision system. The `on_collide()`
@@ -499,30 +2287,100 @@ def dispatch_events(collision_system):
 
 	If a pair of entities are in collision, then the event will be dispatched
 	to both objects in arbitrary order if all of their collision masks align.
+	Handler methods are looked up once per entity class each time step and
+	calls are batched by class, so events are not dispatched in pair order,
+	see :class:`EventDispatcher`.
 	"""
-	collision = getattr(collision_system.world.components, 
-		collision_system.collision_component)
-	for pair in collision_system.collision_pairs:
-		entity1, entity2 = pair
-		if pair.info is not None:
-			args1, args2 = pair.info
-		else:
-			args1 = entity1, None, None
-			args2 = entity2, None, None
-		try:
-			on_collide = entity1.on_collide
-			masks_align = collision[entity2].from_mask & collision[entity1].into_mask
-		except (AttributeError, KeyError):
-			pass
-		else:
-			if masks_align:
-				on_collide(*args2)
-		try:
-			on_collide = entity2.on_collide
-			masks_align = collision[entity1].from_mask & collision[entity2].into_mask
-		except (AttributeError, KeyError):
-			pass
+	try:
+		dispatcher = _dispatchers[collision_system]
+	except KeyError:
+		dispatcher = _dispatchers[collision_system] = EventDispatcher()
+	dispatcher(collision_system)
+
+
+class EventDispatcher(object):
+	"""Collision handler that dispatches `on_collide()` events to entities
+	marked for collision by the specified collision system, in the same
+	manner as :func:`dispatch_events`.
+
+	Whether an entity handles collision events is determined once per
+	entity class each time the dispatcher is called, by looking up 
+	`on_collide()` on the class. Pairs where neither entity's class defines
+	the handler are skipped without looking up their collision data. The
+	events for each pair are collected and dispatched after all pairs are
+	processed, in batches, one entity class at a time. So unlike dispatching
+	them as the pairs are visited, all events of one class are dispatched 
+	before those of the next.
+
+	Since handlers are looked up on the class, `on_collide()` must be 
+	defined by the entity class, which is always the case for 
+	:class:`~bGrease.entity.Entity` subclasses.
+	"""
+
+	def __init__(self):
+		self._handlers = {}
+
+	def _class_handler(self, cls):
+		"""Return the function used to dispatch events to entities of the
+		class, or None if the class has no `on_collide()` method
+		"""
+		on_collide = getattr(cls, 'on_collide', None)
+		if on_collide is None:
+			handler = None
+		elif getattr(on_collide, 'im_self', True) is None:
+			# Plain method, call its function directly
+			handler = on_collide.im_func
 		else:
-			if masks_align:
-				on_collide(*args1)
+			handler = lambda entity, *args: entity.on_collide(*args)
+		self._handlers[cls] = handler
+		return handler
+
+	def __call__(self, collision_system):
+		collision = getattr(collision_system.world.components, 
+			collision_system.collision_component)
+		# Look up the handlers afresh each step, so handlers rebound on the
+		# classes take effect and the classes are not kept alive
+		handlers = self._handlers
+		handlers.clear()
+		class_handler = self._class_handler
+		get_data = collision.get
+		batches = {}
+		for pair in collision_system.collision_pairs:
+			entity1, entity2 = pair
+			cls1 = entity1.__class__
+			cls2 = entity2.__class__
+			if cls1 in handlers:
+				handler1 = handlers[cls1]
+			else:
+				handler1 = class_handler(cls1)
+			if cls2 in handlers:
+				handler2 = handlers[cls2]
+			else:
+				handler2 = class_handler(cls2)
+			if handler1 is None and handler2 is None:
+				continue
+			data1 = get_data(entity1)
+			data2 = get_data(entity2)
+			if data1 is None or data2 is None:
+				continue
+			if pair.info is not None:
+				args1, args2 = pair.info
+			else:
+				args1 = entity1, None, None
+				args2 = entity2, None, None
+			if handler1 is not None and data2.from_mask & data1.into_mask:
+				if handler1 in batches:
+					batches[handler1].append((entity1, args2))
+				else:
+					batches[handler1] = [(entity1, args2)]
+			if handler2 is not None and data1.from_mask & data2.into_mask:
+				if handler2 in batches:
+					batches[handler2].append((entity2, args1))
+				else:
+					batches[handler2] = [(entity2, args1)]
+		for handler, events in batches.iteritems():
+			for entity, args in events:
+				handler(entity, *args)
 
+_dispatchers = weakref.WeakKeyDictionary()
+"""Collision systems -> dispatchers used by :func:`dispatch_events`"""
@@ -134,6 +134,12 @@ class Collision(Component):
 	- **into_mask** (int) -- A bitmask that determines what entities can collide
 		with this object.
 
+	- **static** (bool) -- Set True for entities that are not currently moving,
+		such as obstacles or bodies at rest. Broad-phase systems can store
+		these separately and avoid updating them each time step. Static
+		entities never collide with each other. Clear this flag before
+		moving a static entity.
+
 	When considering an entity A for collision with entity B, A's ``from_mask`` is
 	bit ANDed with B's ``into_mask``. If the result is nonzero (meaning 1 or more
 	bits is set the same for each) then the collision test is made. Otherwise,
@@ -143,7 +149,8 @@ class Collision(Component):
 	all entities will collide with each other by default.
 	"""
 	def __init__(self):
-		Component.__init__(self, aabb=Rect, radius=float, from_mask=int, into_mask=int)
+		Component.__init__(self, aabb=Rect, radius=float, from_mask=int, into_mask=int,
+			static=bool)
 		self.fields['into_mask'].default = lambda: 0xffffffff
 		self.fields['from_mask'].default = lambda: 0xffffffff
 
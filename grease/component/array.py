@@ -0,0 +1,486 @@
+#############################################################################
+#
+# Copyright (c) 2010 by Casey Duncan and contributors
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the MIT License
+# A copy of the license should accompany this distribution.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#
+#############################################################################
+"""Array-backed components, storing their scalar fields in NumPy arrays.
+
+Requires NumPy, which is otherwise optional. Field comparisons and in-place
+mutators of these fields, e.g., ``world[...].movement.speed *= 0.99``, are
+evaluated as single NumPy operations over the field's column instead of per
+entity.
+
+The columns of an array component can also be published each time step to
+a memory-mapped file, see :meth:`ArrayComponent.share`. Other processes,
+such as workers running read-only systems, attach to it with 
+:class:`SharedColumnsReader` and read the columns without copying them.
+"""
+
+__version__ = '$Id$'
+
+import mmap
+import struct
+import operator
+import itertools
+import numpy
+from bGrease.component.general import Component, Data, _immutable_types
+
+column_types = {
+	int: numpy.int_,
+	float: numpy.float64,
+	bool: numpy.bool_,
+}
+"""Field types stored in columns -> NumPy dtypes"""
+
+_vector_compare = frozenset([
+	operator.eq, operator.ne, operator.gt, operator.ge, operator.lt, operator.le])
+
+_vector_mutate = {
+	operator.iadd: operator.add,
+	operator.isub: operator.sub,
+	operator.imul: operator.mul,
+	operator.idiv: operator.div,
+	operator.itruediv: operator.truediv,
+	operator.ifloordiv: operator.floordiv,
+	operator.imod: operator.mod,
+	operator.ipow: operator.pow,
+	operator.ilshift: operator.lshift,
+	operator.irshift: operator.rshift,
+	operator.iand: operator.and_,
+	operator.ior: operator.or_,
+	operator.ixor: operator.xor,
+}
+"""In-place operators -> operators applied to columns. The result is
+assigned back to the column, which casts it to the column dtype"""
+
+
+class ArrayComponent(Component):
+	"""Component storing its :class:`int`, :class:`float` and :class:`bool`
+	fields in NumPy arrays, one column per field. Fields of other types are
+	stored in the data records like :class:`Component`.
+
+	Row ``i`` of each column holds the field value of the ``i``-th entity in
+	the component's :attr:`sparse_entities`, so the columns stay dense as
+	entities are removed. Data records read and write their column values
+	through the component while their entity is a member.
+
+	Integer columns are fixed width, so unlike :class:`Component` fields
+	their values may overflow.
+	"""
+
+	columns = None
+	"""Dict mapping field names to NumPy column arrays. The columns may
+	be longer than the number of entities in the component."""
+
+	def __init__(self, **fields):
+		Component.__init__(self, **fields)
+		self.columns = {}
+		for fname, field in self.fields.items():
+			if field.type in column_types:
+				self.columns[fname] = numpy.zeros(16, column_types[field.type])
+
+	def _row(self, entity):
+		"""Return the column row of a member entity"""
+		return self.sparse_entities.sparse[entity.entity_id]
+
+	def _detach(self, data, row):
+		"""Copy the column values of a data record at row back into the
+		record, so it remains usable after its entity leaves the component
+		"""
+		values = data.__dict__
+		for fname, column in self.columns.items():
+			values[fname] = column[row].item()
+		del values['_ArrayData__component']
+		object.__setattr__(data, '__class__', Data)
+
+	def __setitem__(self, entity, data):
+		if entity in self.entities:
+			row = self._row(entity)
+			old_data = self.sparse_entities.values[row]
+			if old_data is not data and isinstance(old_data, ArrayData):
+				self._detach(old_data, row)
+		if isinstance(data, ArrayData):
+			values = dict((fname, getattr(data, fname)) for fname in self.columns)
+			if data._ArrayData__component is not self or data.entity is not entity:
+				data._ArrayData__component._detach(
+					data, data._ArrayData__component._row(data.entity))
+		else:
+			values = data.__dict__
+		column_values = [(fname, values.pop(fname)) for fname in self.columns]
+		Component.__setitem__(self, entity, data)
+		row = self._row(entity)
+		columns = self.columns
+		if columns and row >= len(columns.values()[0]):
+			for fname, column in columns.items():
+				columns[fname] = numpy.concatenate(
+					[column, numpy.zeros(max(len(column), 16), column.dtype)])
+		for fname, value in column_values:
+			columns[fname][row] = value
+		data.__dict__['_ArrayData__component'] = self
+		object.__setattr__(data, '__class__', ArrayData)
+
+	def remove(self, entity):
+		if entity in self.entities:
+			sparse_entities = self.sparse_entities
+			row = self._row(entity)
+			last = len(sparse_entities) - 1
+			data = sparse_entities.values[row]
+			if isinstance(data, ArrayData):
+				self._detach(data, row)
+			for column in self.columns.values():
+				column[row] = column[last]
+		return Component.remove(self, entity)
+
+	__delitem__ = remove
+
+	def __all_members(self, entities):
+		"""Return True if the entities are exactly the component members"""
+		return entities is self.entities or (
+			len(entities) == len(self.entities) and entities == self.entities)
+
+	def __rows(self, entities):
+		"""Return an index for the column rows of the entities specified,
+		skipping non-members
+		"""
+		size = len(self.sparse_entities)
+		if self.__all_members(entities):
+			return slice(0, size)
+		get_row = self.sparse_entities.sparse.get
+		rows = numpy.fromiter(
+			(get_row(entity.entity_id, -1) for entity in entities), numpy.int_)
+		return rows[rows >= 0]
+
+	def adopt_columns(self, entities, columns):
+		"""Add entities to the component in bulk, using the arrays 
+		specified as the columns without copying them. The component must
+		be empty. Fields that are not stored in columns are set to their
+		default values.
+
+		:param entities: Sequence of entities, in column row order.
+		:param columns: Dict mapping each column field name to an array
+			with a row for each entity. Arrays that do not have the dtype
+			of the field's column are converted.
+		"""
+		assert not self.entities, "Cannot adopt columns, component is not empty"
+		if sorted(columns) != sorted(self.columns):
+			raise ValueError("Columns do not match component fields: %s" 
+				% ', '.join(sorted(columns)))
+		entities = list(entities)
+		count = len(entities)
+		adopted = {}
+		for fname, column in columns.items():
+			if len(column) != count:
+				raise ValueError("Column %s does not have %d rows" % (fname, count))
+			adopted[fname] = numpy.asarray(column, self.columns[fname].dtype)
+		ids = [entity.entity_id for entity in entities]
+		values = {'_Data__fields': self.fields, '_ArrayData__component': self}
+		copied = []
+		for fname, field in self.fields.items():
+			if fname not in self.columns:
+				values[fname] = field.cast(field.default())
+				if field.type not in _immutable_types:
+					copied.append((fname, field.type))
+		new = Data.__new__
+		records = []
+		for entity in entities:
+			data = new(ArrayData)
+			attrs = data.__dict__
+			attrs.update(values)
+			attrs['entity'] = entity
+			for fname, ftype in copied:
+				attrs[fname] = ftype(attrs[fname])
+			records.append(data)
+		sparse_entities = self.sparse_entities
+		sparse_entities.sparse = dict(itertools.izip(ids, xrange(count)))
+		sparse_entities.ids = ids
+		sparse_entities.entities = entities
+		sparse_entities.values = records
+		self.columns = adopted
+		dict.update(self, itertools.izip(entities, records))
+		self.entities.update(entities)
+		for entity in entities:
+			cls = entity.__class__
+			self.class_counts[cls] = self.class_counts.get(cls, 0) + 1
+		self._added.extend(entities)
+		if self._storage is not None:
+			for entity, data in zip(entities, records):
+				self._storage._set_data(self._storage_name, entity, data)
+
+	shared = None
+	""":class:`SharedColumns` the component publishes its columns to each
+	time step, or None if they are not shared"""
+
+	def share(self, path, capacity, slots=2):
+		"""Publish the component's columns to a memory-mapped file at the
+		path specified at each time step, so that other processes can read
+		them using :class:`SharedColumnsReader`. The current columns are
+		published immediately. Return the :class:`SharedColumns` object.
+
+		:param path: Path of the file to create, replacing any existing file.
+		:param capacity: Maximum number of entities that can be published.
+		:param slots: Number of steps published before the columns of a 
+			step are overwritten. Readers must finish with a step's columns
+			before then.
+		"""
+		self.shared = SharedColumns(path, self.columns, capacity, slots)
+		self.publish()
+		return self.shared
+
+	def publish(self):
+		"""Publish the current columns to the component's shared file"""
+		sparse_entities = self.sparse_entities
+		self.shared.publish(sparse_entities.ids, self.columns, len(sparse_entities))
+
+	def step(self, dt):
+		Component.step(self, dt)
+		if self.shared is not None:
+			self.publish()
+	step.__doc__ = Component.step.__doc__
+
+	def column_match(self, fname, entities, op, value):
+		"""Return the set of entities whose field value compares to value
+		using the operator specified, or None if the comparison cannot be
+		done over the field's column. Used by
+		:class:`bGrease.component.field.FieldAccessor`.
+		"""
+		if (fname not in self.columns or op not in _vector_compare
+			or numpy.ndim(value) != 0):
+			# Sequences would be compared elementwise with the column,
+			# rather than with each field value
+			return None
+		column = self.columns[fname][:len(self.sparse_entities)]
+		try:
+			mask = op(column, value)
+		except (TypeError, ValueError):
+			return None
+		if not isinstance(mask, numpy.ndarray) or mask.shape != column.shape:
+			return None
+		members = self.sparse_entities.entities
+		matches = set(map(members.__getitem__, numpy.flatnonzero(mask).tolist()))
+		if not self.__all_members(entities):
+			matches &= entities
+		return matches
+
+	def column_mutate(self, fname, entities, op, value):
+		"""Apply the in-place operator to the field values of the entities
+		specified over the field's column. Return True if successful, or
+		False if the operation cannot be done over the column. Used by
+		:class:`bGrease.component.field.FieldAccessor`.
+		"""
+		if (fname not in self.columns or op not in _vector_mutate
+			or numpy.ndim(value) != 0):
+			return False
+		column = self.columns[fname]
+		rows = self.__rows(entities)
+		try:
+			column[rows] = _vector_mutate[op](column[rows], value)
+		except (TypeError, ValueError):
+			return False
+		return True
+
+
+class ArrayData(Data):
+	"""Data record of an :class:`ArrayComponent` member, whose column
+	field values are stored in the component
+	"""
+
+	def __getattr__(self, name):
+		component = self.__dict__['_ArrayData__component']
+		if name in component.columns:
+			return component.columns[name][component._row(self.entity)].item()
+		raise AttributeError(name)
+
+	def __setattr__(self, name, value):
+		component = self.__dict__['_ArrayData__component']
+		if name in component.columns:
+			component.columns[name][component._row(self.entity)] = (
+				component.fields[name].cast(value))
+		else:
+			Data.__setattr__(self, name, value)
+
+	def __repr__(self):
+		values = dict(self.__dict__)
+		del values['_ArrayData__component']
+		for fname in self.__component.columns:
+			values[fname] = getattr(self, fname)
+		return '<%s(%r)>' % (self.__class__.__name__, values)
+
+
+_header = struct.Struct('<4sIIIIi')
+"""Shared columns file header: magic, version, slot count, capacity,
+column count, latest slot published or -1"""
+
+_slot_header = struct.Struct('<qI4x')
+"""Shared columns slot header: step sequence, or -1 while it is being
+written, and entity count"""
+
+_column_header = struct.Struct('<32s8s')
+"""Shared columns column header: field name and NumPy dtype string"""
+
+_magic = 'GRSC'
+_version = 1
+
+
+def _shared_layout(schema, capacity, slots):
+	"""Return the offset of the first slot's data, the offsets of the
+	entity ids and each column within a slot, and the slot size, for the
+	schema sequence of (name, dtype) pairs
+	"""
+	start = _header.size + _slot_header.size * slots + _column_header.size * len(schema)
+	start += -start % 64
+	offsets = [0]
+	size = capacity * numpy.dtype(numpy.int64).itemsize
+	for name, dtype in schema:
+		size += -size % 8
+		offsets.append(size)
+		size += capacity * dtype.itemsize
+	size += -size % 64
+	return start, offsets, size
+
+
+class SharedColumns(object):
+	"""Array component columns published to a memory-mapped file, created
+	by :meth:`ArrayComponent.share`.
+
+	The file begins with a header describing the columns, followed by a
+	number of slots that each hold the entity ids and columns of one step.
+	Each publication is written to the slot after the latest one, which 
+	then becomes the latest, so the slot read by a reader is not changed 
+	until the following publications have used the other slots.
+	"""
+
+	def __init__(self, path, columns, capacity, slots=2):
+		assert slots >= 1, "At least one slot is required"
+		self.path = path
+		self.capacity = capacity
+		self.slots = slots
+		self.schema = sorted((name, column.dtype) for name, column in columns.items())
+		self.sequence = 0
+		start, offsets, slot_size = _shared_layout(self.schema, capacity, slots)
+		self._file = open(path, 'w+b')
+		self._file.truncate(start + slot_size * slots)
+		self._map = mmap.mmap(self._file.fileno(), start + slot_size * slots)
+		header = [_header.pack(_magic, _version, slots, capacity, len(self.schema), -1)]
+		header.extend(_slot_header.pack(-1, 0) for i in range(slots))
+		for name, dtype in self.schema:
+			assert len(name) <= 32, "Field name too long to share: " + name
+			header.append(_column_header.pack(name, dtype.str))
+		header = ''.join(header)
+		self._map[:len(header)] = header
+		self._slot_arrays = []
+		for slot in range(slots):
+			base = start + slot * slot_size
+			ids = numpy.frombuffer(self._map, numpy.int64, capacity, base)
+			arrays = [(name, numpy.frombuffer(
+				self._map, dtype, capacity, base + offset))
+				for (name, dtype), offset in zip(self.schema, offsets[1:])]
+			self._slot_arrays.append((ids, arrays))
+		self._latest = -1
+
+	def publish(self, entity_ids, columns, count):
+		"""Publish the first count entity ids and rows of the columns as
+		the next step, and return its sequence number
+		"""
+		if count > self.capacity:
+			raise ValueError("Cannot share %d entities, capacity is %d" 
+				% (count, self.capacity))
+		slot = (self._latest + 1) % self.slots
+		slot_offset = _header.size + slot * _slot_header.size
+		self._map[slot_offset:slot_offset + _slot_header.size] = _slot_header.pack(-1, 0)
+		ids, arrays = self._slot_arrays[slot]
+		ids[:count] = entity_ids[:count]
+		for name, array in arrays:
+			array[:count] = columns[name][:count]
+		self.sequence += 1
+		self._map[slot_offset:slot_offset + _slot_header.size] = _slot_header.pack(
+			self.sequence, count)
+		self._latest = slot
+		self._map[:_header.size] = _header.pack(_magic, _version, self.slots, 
+			self.capacity, len(self.schema), slot)
+		return self.sequence
+
+	def close(self):
+		"""Stop sharing and close the file. The file is not removed."""
+		self._slot_arrays = []
+		self._map.close()
+		self._file.close()
+
+
+class SharedColumnsReader(object):
+	"""Reads the columns shared by an :class:`ArrayComponent` from the
+	memory-mapped file at the path specified, typically in another process.
+	"""
+
+	def __init__(self, path):
+		self._file = open(path, 'rb')
+		self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, version, slots, capacity, column_count, latest = _header.unpack_from(self._map)
+		if magic != _magic or version != _version:
+			raise ValueError("Not a shared columns file: %s" % path)
+		self.slots = slots
+		self.capacity = capacity
+		offset = _header.size + _slot_header.size * slots
+		self.schema = []
+		for i in range(column_count):
+			name, dtype = _column_header.unpack_from(self._map, offset)
+			self.schema.append((name.rstrip('\0'), numpy.dtype(dtype.rstrip('\0'))))
+			offset += _column_header.size
+		self._start, self._offsets, self._slot_size = _shared_layout(
+			self.schema, capacity, slots)
+
+	def _slot_header(self, slot):
+		return _slot_header.unpack_from(self._map, _header.size + slot * _slot_header.size)
+
+	def latest(self):
+		"""Return a :class:`SharedStep` view of the columns of the latest
+		step published, or None if no step has been published
+		"""
+		slot = _header.unpack_from(self._map)[-1]
+		if slot < 0:
+			return None
+		sequence, count = self._slot_header(slot)
+		if sequence < 0:
+			return None
+		base = self._start + slot * self._slot_size
+		ids = numpy.frombuffer(self._map, numpy.int64, count, base)
+		columns = dict((name, numpy.frombuffer(self._map, dtype, count, base + offset))
+			for (name, dtype), offset in zip(self.schema, self._offsets[1:]))
+		return SharedStep(self, slot, sequence, ids, columns)
+
+	def close(self):
+		self._map.close()
+		self._file.close()
+
+
+class SharedStep(object):
+	"""Read-only view of the columns shared for a single step. The arrays
+	are views of the shared file, and are only consistent while 
+	:meth:`valid` returns True. Check it after reading them, or copy them.
+	"""
+
+	sequence = None
+	"""Sequence number of the step, counting from 1"""
+
+	entity_ids = None
+	"""Array of the ids of the entities in the step, row by row"""
+
+	columns = None
+	"""Dict mapping field names to column arrays"""
+
+	def __init__(self, reader, slot, sequence, entity_ids, columns):
+		self._reader = reader
+		self._slot = slot
+		self.sequence = sequence
+		self.entity_ids = entity_ids
+		self.columns = columns
+
+	def valid(self):
+		"""Return True if the step's columns have not been overwritten"""
+		return self._reader._slot_header(self._slot)[0] == self.sequence
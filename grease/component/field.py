@@ -14,6 +14,7 @@
 __version__ = '$Id$'
 
 import operator
+import itertools
 from bGrease.geometry import Vec2d, Vec2dArray, Rect
 from bGrease import color
 
@@ -155,58 +156,70 @@ class FieldAccessor(object):
 
         ## batch comparison operators ##
 
-        def __match(self, value, op):
+        def _match(self, value, op, lazy=False):
+                """Return the set of entities whose field value compares true to
+                value using op, or an unevaluated :class:`Query` if lazy is true
+                """
                 component = self.__field.component
                 getter = self.__getter
-                matches = set()
-                add = matches.add
                 if isinstance(value, FieldAccessor):
                         # Join match between entity sets
-                        for entity in self.__entities:
+                        def match(entity):
                                 try:
                                         data = component[entity]
                                         other = value[entity]
                                 except KeyError:
-                                        continue
-                                if op(getter(data), other):
-                                        add(entity)
+                                        return False
+                                return op(getter(data), other)
+                        query = Query((self.__entities,), (), (match,))
                 else:
-                        for entity in self.__entities:
+                        column_match = getattr(component, 'column_match', None)
+                        if column_match is not None and not self.__attrs:
+                                # Compare over the array-backed field column
+                                matches = column_match(
+                                        self.__field.name, self.__entities, op, value)
+                                if matches is not None:
+                                        if not lazy:
+                                                return matches
+                                        return Query((matches,))
+                        def match(entity):
                                 try:
                                         data = component[entity]
                                 except KeyError:
-                                        continue
-                                if op(getter(data), value):
-                                        add(entity)
-                return matches
+                                        return False
+                                return op(getter(data), value)
+                        query = Query((self.__entities,), (match,))
+                if lazy:
+                        return query
+                return query.result()
 
         def __eq__(self, value):
-                """Return an entity set of all entities with a matching field value"""
-                return self.__match(value, operator.eq)
+                """Return a set of all entities with a matching field value"""
+                return self._match(value, operator.eq)
 
         def __ne__(self, value):
-                """Return an entity set of all entities not matching field value"""
-                return self.__match(value, operator.ne)
+                """Return a set of all entities not matching field value"""
+                return self._match(value, operator.ne)
 
         def __gt__(self, value):
-                """Return an entity set of all entities with a greater field value"""
-                return self.__match(value, operator.gt)
+                """Return a set of all entities with a greater field value"""
+                return self._match(value, operator.gt)
 
         def __ge__(self, value):
-                """Return an entity set of all entities with a greater or equal field value"""
-                return self.__match(value, operator.ge)
+                """Return a set of all entities with a greater or equal field value"""
+                return self._match(value, operator.ge)
 
         def __lt__(self, value):
-                """Return an entity set of all entities with a lesser field value"""
-                return self.__match(value, operator.lt)
+                """Return a set of all entities with a lesser field value"""
+                return self._match(value, operator.lt)
 
         def __le__(self, value):
-                """Return an entity set of all entities with a lesser or equal field value"""
-                return self.__match(value, operator.le)
+                """Return a set of all entities with a lesser or equal field value"""
+                return self._match(value, operator.le)
 
         def _contains(self, values):
-                """Return an entity set of all entities with a field value contained in values"""
-                return self.__match(values, operator.contains)
+                """Return a set of all entities with a field value contained in values"""
+                return self._match(values, operator.contains)
 
         ## Batch in-place mutator methods
 
@@ -228,6 +241,11 @@ class FieldAccessor(object):
                                         continue
                                 setter(data, name, op(getter(data), other))
                 else:
+                        column_mutate = getattr(component, 'column_mutate', None)
+                        if (column_mutate is not None and not self.__attrs
+                                and column_mutate(name, self.__entities, op, value)):
+                                # Mutated the array-backed field column
+                                return self
                         for entity in self.__entities:
                                 try:
                                         data = component[entity]
@@ -276,6 +294,204 @@ class FieldAccessor(object):
                 return self.__mutate(value, operator.ixor)
 
 
+def lazy(accessor):
+        """Return an object whose comparison operators return lazily
+        evaluated :class:`Query` objects for the field accessor, rather
+        than sets of entities. Lazy queries combined with ``&`` are fused.
+
+        Example::
+
+                ships = world[Ship]
+                query = (lazy(ships.movement.speed) > 10) & (
+                        lazy(ships.health.hp) < 5)
+        """
+        return _LazyAccessor(accessor)
+
+
+class _LazyAccessor(object):
+        """Comparison operators of a :class:`FieldAccessor` returning 
+        queries, see :func:`lazy`
+        """
+
+        __slots__ = ('accessor',)
+
+        def __init__(self, accessor):
+                self.accessor = accessor
+
+        def __eq__(self, value):
+                return self.accessor._match(value, operator.eq, True)
+
+        def __ne__(self, value):
+                return self.accessor._match(value, operator.ne, True)
+
+        def __gt__(self, value):
+                return self.accessor._match(value, operator.gt, True)
+
+        def __ge__(self, value):
+                return self.accessor._match(value, operator.ge, True)
+
+        def __lt__(self, value):
+                return self.accessor._match(value, operator.lt, True)
+
+        def __le__(self, value):
+                return self.accessor._match(value, operator.le, True)
+
+        __hash__ = None
+
+
+class Query(object):
+        """Lazily evaluated set of entities matching field predicates, 
+        returned by comparisons of field accessors wrapped with :func:`lazy`.
+
+        Queries combined using ``&`` are fused into a single query rather 
+        than evaluated separately and intersected. A fused query filters
+        the intersection of the entity sets queried through each of the 
+        predicates in turn, so later predicates are only tested against 
+        the entities matching the earlier ones. Predicates comparing
+        against other field accessors are tested last.
+
+        A query is evaluated when it is first used, and the result kept,
+        so changes to the components made before then are reflected in the
+        result. The first iteration of a query streams the matching
+        entities as they are found. A query is not a :class:`set` instance,
+        use :meth:`result()` where one is required.
+        """
+
+        __entity_sets = ()
+        __predicates = ()
+        __join_predicates = ()
+        __result = None
+
+        def __init__(self, entity_sets, predicates=(), join_predicates=()):
+                self.__entity_sets = tuple(entity_sets)
+                self.__predicates = tuple(predicates)
+                self.__join_predicates = tuple(join_predicates)
+
+        def __matches(self):
+                """Return an iterator of the matching entities"""
+                if self.__result is not None:
+                        return iter(self.__result)
+                entity_sets = self.__entity_sets
+                if len(entity_sets) == 1:
+                        # Copy so the entities can be changed while iterating
+                        matches = tuple(entity_sets[0])
+                else:
+                        # Set intersection iterates the smaller set
+                        matches = entity_sets[0] & entity_sets[1]
+                        for entities in entity_sets[2:]:
+                                matches = matches & entities
+                for predicate in self.__predicates + self.__join_predicates:
+                        matches = itertools.ifilter(predicate, matches)
+                return self.__stream(matches)
+
+        def __stream(self, matches):
+                """Yield the matches, keeping them as the query result if
+                all are iterated
+                """
+                result = set()
+                add = result.add
+                for entity in matches:
+                        add(entity)
+                        yield entity
+                self.__result = result
+
+        def __set(self):
+                """Evaluate the query and return the matching entity set"""
+                if self.__result is None:
+                        for entity in self.__matches():
+                                pass
+                return self.__result
+
+        def result(self):
+                """Evaluate the query if it has not been, and return the 
+                set of matching entities. The set is kept as the query's 
+                result, so changes to it are reflected by the query.
+                """
+                return self.__set()
+
+        @staticmethod
+        def __as_set(value):
+                if isinstance(value, Query):
+                        return value.__set()
+                return value
+
+        def __iter__(self):
+                return self.__matches()
+
+        def __len__(self):
+                return len(self.__set())
+
+        def __contains__(self, entity):
+                return entity in self.__set()
+
+        def __nonzero__(self):
+                for entity in self.__matches():
+                        return True
+                return False
+
+        def __eq__(self, other):
+                if isinstance(other, (Query, set, frozenset)):
+                        return self.__set() == self.__as_set(other)
+                return NotImplemented
+
+        def __ne__(self, other):
+                if isinstance(other, (Query, set, frozenset)):
+                        return self.__set() != self.__as_set(other)
+                return NotImplemented
+
+        __hash__ = None
+
+        def __and__(self, other):
+                """Return a query fusing this query with another query or 
+                an entity set
+                """
+                if isinstance(other, Query):
+                        if other.__result is not None:
+                                other = other.__result
+                        else:
+                                return Query(self.__entity_sets + other.__entity_sets,
+                                        self.__predicates + other.__predicates,
+                                        self.__join_predicates + other.__join_predicates)
+                if isinstance(other, (set, frozenset)):
+                        if self.__result is not None:
+                                return self.__result & other
+                        return Query(self.__entity_sets + (other,), 
+                                self.__predicates, self.__join_predicates)
+                return NotImplemented
+
+        __rand__ = __and__
+
+        def __or__(self, other):
+                if isinstance(other, (Query, set, frozenset)):
+                        return self.__set() | self.__as_set(other)
+                return NotImplemented
+
+        __ror__ = __or__
+
+        def __xor__(self, other):
+                if isinstance(other, (Query, set, frozenset)):
+                        return self.__set() ^ self.__as_set(other)
+                return NotImplemented
+
+        __rxor__ = __xor__
+
+        def __sub__(self, other):
+                if isinstance(other, (Query, set, frozenset)):
+                        return self.__set() - self.__as_set(other)
+                return NotImplemented
+
+        def __rsub__(self, other):
+                if isinstance(other, (set, frozenset)):
+                        return other - self.__set()
+                return NotImplemented
+
+        def __repr__(self):
+                if self.__result is not None:
+                        return '<%s %r>' % (self.__class__.__name__, self.__result)
+                return '<%s of %d predicates @ %x>' % (self.__class__.__name__,
+                        len(self.__predicates) + len(self.__join_predicates), id(self))
+
+
 class Field(object):
         """Component field metadata and accessor interface"""
 
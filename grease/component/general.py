@@ -15,7 +15,7 @@ __version__ = '$Id$'
 
 from bGrease.component import base
 from bGrease.component import field
-from bGrease.entity import ComponentEntitySet
+from bGrease.entity import ComponentEntitySet, SparseEntitySet
 
 
 class Component(dict):
@@ -43,20 +43,45 @@ class Component(dict):
 	deleted_entities = ()
 	"""List of entities deleted from the component since the last time step"""
 
+	class_counts = None
+	"""Dict mapping entity classes to the number of member entities of 
+	each class
+	"""
+
 	new_entities = ()
 	"""List of entities added to the component since the last time step"""
 
+	sparse_entities = None
+	""":class:`bGrease.entity.SparseEntitySet` of the member entities 
+	mapped to their data, used to join components by entity id
+	"""
+
+	_storage = None
+	_storage_name = None
+
 	def __init__(self, **fields):
 		self.fields = {}
 		for fname, ftype in fields.items():
 			assert ftype in field.types, fname + " has an illegal field type"
 			self.fields[fname] = field.Field(self, fname, ftype)
 		self.entities = ComponentEntitySet(self)
+		self.class_counts = {}
+		self.sparse_entities = SparseEntitySet()
 		self._added = []
 		self._deleted = []
+		self._archetype_factories = {}
 	
 	def set_world(self, world):
 		self.world = world
+
+	def set_storage(self, storage, name):
+		"""Attach the component to a storage engine that indexes its
+		membership, see :class:`bGrease.world.ChunkedComponentParts`.
+		The storage is notified of each entity set or removed using the
+		component name given. Pass None to detach the component.
+		"""
+		self._storage = storage
+		self._storage_name = name
 	
 	def step(self, dt):
 		"""Update the component for the next timestep"""
@@ -84,18 +109,75 @@ class Component(dict):
 					data_kw[fname] = getattr(data, fname)
 		data = self[entity] = Data(self.fields, entity, **data_kw)
 		return data
+
+	def data_factory(self, **defaults):
+		"""Return a function that creates data records for this component.
+		The function accepts an entity and returns a new data record for it
+		with the default field values specified as keyword arguments, or
+		the field type's default value.
+
+		The defaults are cast to the field types once, here, rather than 
+		for each record created. Values of mutable field types are copied
+		for each record.
+		"""
+		fields = self.fields
+		for fname in defaults:
+			if fname not in fields:
+				raise AttributeError("Invalid data field: " + fname)
+		values = {'_Data__fields': fields}
+		copied = []
+		for fname, field in fields.items():
+			if fname in defaults:
+				values[fname] = field.cast(defaults[fname])
+			else:
+				values[fname] = field.cast(field.default())
+			if field.type not in _immutable_types:
+				copied.append((fname, field.type))
+		new = Data.__new__
+		def create(entity):
+			data = new(Data)
+			attrs = data.__dict__
+			attrs.update(values)
+			attrs['entity'] = entity
+			for fname, ftype in copied:
+				attrs[fname] = ftype(attrs[fname])
+			return data
+		return create
+
+	def set_archetype(self, entity, defaults):
+		"""Set the component data for a new entity from the default field
+		values of its class archetype, see 
+		:attr:`bGrease.entity.Entity.ARCHETYPE`. The data factory for each
+		entity class is created from the defaults once and cached.
+		"""
+		cls = entity.__class__
+		try:
+			create = self._archetype_factories[cls]
+		except KeyError:
+			create = self._archetype_factories[cls] = self.data_factory(**defaults)
+		data = self[entity] = create(entity)
+		return data
 	
 	def __setitem__(self, entity, data):
 		assert entity.world is self.world, "Entity not in component's world"
 		if entity not in self.entities:
 			self._added.append(entity)
 			self.entities.add(entity)
+			cls = entity.__class__
+			self.class_counts[cls] = self.class_counts.get(cls, 0) + 1
 		super(Component, self).__setitem__(entity, data)
+		self.sparse_entities.add(entity, data)
+		if self._storage is not None:
+			self._storage._set_data(self._storage_name, entity, data)
 	
 	def remove(self, entity):
 		if entity in self.entities:
 			self._deleted.append(entity)
 			self.entities.remove(entity)
+			self.class_counts[entity.__class__] -= 1
+			self.sparse_entities.remove(entity)
+			if self._storage is not None:
+				self._storage._discard_data(self._storage_name, entity)
 			return True
 		return False
 	
@@ -122,6 +204,10 @@ class Singleton(Component):
 			return self.manager[self._data.keys()[0]]
 	
 
+_immutable_types = (int, float, bool, str, object)
+"""Field types whose values can be shared between data records"""
+
+
 class Data(object):
 
 	def __init__(self, fields, entity, **data):
@@ -30,7 +30,8 @@ See :ref:`an example entity class in the tutorial <tut-entity-example>`.
 
 __version__ = '$Id$'
 
-__all__ = ('Entity', 'EntityComponentAccessor', 'ComponentEntitySet')
+__all__ = ('Entity', 'EntityComponentAccessor', 'ComponentEntitySet', 
+	'SparseEntitySet', 'install_component_accessor')
 
 
 class EntityMeta(type):
@@ -71,12 +72,42 @@ class Entity(object):
 	"""
 	__metaclass__ = EntityMeta
 
+	ARCHETYPE = None
+	"""Optional archetype declaring the components every entity of the 
+	class is created in. This is a dict mapping component names to dicts
+	of default field values for the entity's data in that component, e.g.::
+
+		class Asteroid(Entity):
+			ARCHETYPE = {
+				'position': {},
+				'movement': {'rotation': 10},
+				'renderable': {'color': '#aaa'},
+			}
+
+	New entities are inserted into all of the archetype's components 
+	in one pass when created, before :meth:`__init__()` is called. The
+	defaults are cast to the field types once per class rather than for
+	each entity. Archetypes are not merged with those of base classes.
+
+	Extent queries of the class use the archetype to skip membership 
+	checks for its components while all of its entities remain members.
+	"""
+
 	def __new__(cls, world, *args, **kw):
 		"""Create a new entity and add it to the world"""
 		entity = object.__new__(cls)
 		entity.world = world
 		entity.entity_id = world.new_entity_id()
 		world.entities.add(entity)
+		archetype = cls.ARCHETYPE
+		if archetype:
+			components = world.components
+			for name, defaults in archetype.iteritems():
+				component = getattr(components, name)
+				if hasattr(component, 'set_archetype'):
+					component.set_archetype(entity, defaults)
+				else:
+					component.set(entity, **defaults)
 		return entity
 	
 	def __getattr__(self, name):
@@ -86,6 +117,11 @@ class Entity(object):
 		Example::
 
 			my_entity.movement
+
+		Components registered with a world's
+		:class:`~bGrease.world.ComponentParts` are usually found by an
+		accessor descriptor on the :class:`Entity` class instead, see
+		:func:`install_component_accessor`.
 		"""
 		component = getattr(self.world.components, name)
 		return EntityComponentAccessor(component, self)
@@ -146,6 +182,37 @@ class Entity(object):
 		return self in self.world.entities
 
 
+class _ComponentAccessorDescriptor(object):
+	"""Non-data descriptor returning an :class:`EntityComponentAccessor`
+	for the named component. When accessed through the class or when the
+	entity's world has no such component, it raises :class:`AttributeError`
+	so that lookup falls back to :meth:`Entity.__getattr__` as before.
+	"""
+	__slots__ = ('name',)
+
+	def __init__(self, name):
+		self.name = name
+
+	def __get__(self, entity, cls=None):
+		if entity is None:
+			raise AttributeError(self.name)
+		return EntityComponentAccessor(
+			getattr(entity.world.components, self.name), entity)
+
+
+def install_component_accessor(name):
+	"""Install an accessor descriptor for the named component on the 
+	:class:`Entity` base class, so that accessing the component through 
+	entities finds it by normal attribute lookup, rather than failing it
+	first and falling back to :meth:`Entity.__getattr__`. Called when a
+	component is registered with a world. Entity subclasses are never
+	modified, and attributes they or :class:`Entity` define take
+	precedence over the accessor.
+	"""
+	if not name.startswith('_') and name not in Entity.__dict__:
+		setattr(Entity, name, _ComponentAccessorDescriptor(name))
+
+
 class EntityComponentAccessor(object):
 	"""A facade for accessing specific component data for a single entity.
 	The implementation is lazy and does not actually access the component
@@ -162,9 +229,11 @@ class EntityComponentAccessor(object):
 	__data = None
 
 	def __init__(self, component, entity):
-		clsname = self.__class__.__name__
-		self.__dict__['_%s__component' % clsname] = component
-		self.__dict__['_%s__entity' % clsname] = entity
+		# Names are mangled by hand, since setting them as attributes
+		# would go through __setattr__
+		attrs = self.__dict__
+		attrs['_EntityComponentAccessor__component'] = component
+		attrs['_EntityComponentAccessor__entity'] = entity
 	
 	def __nonzero__(self):
 		"""The accessor is True if the entity is in the component,
@@ -174,23 +243,23 @@ class EntityComponentAccessor(object):
 	
 	def __getattr__(self, name):
 		"""Return the data for the specified field of the entity's component"""
-		if self.__data is None:
+		data = self.__data
+		if data is None:
 			try:
 				data = self.__component[self.__entity]
 			except KeyError:
 				raise AttributeError(name)
-			clsname = self.__class__.__name__
-			self.__dict__['_%s__data' % clsname] = data
-		return getattr(self.__data, name)
+			self.__dict__['_EntityComponentAccessor__data'] = data
+		return getattr(data, name)
 	
 	def __setattr__(self, name, value):
 		"""Set the data for the specified field of the entity's component"""
 		if self.__data is None:
-			clsname = self.__class__.__name__
 			if self.__entity in self.__component:
-				self.__dict__['_%s__data' % clsname] = self.__component[self.__entity]
+				data = self.__component[self.__entity]
 			else:
-				self.__dict__['_%s__data' % clsname] = self.__component.set(self.__entity)
+				data = self.__component.set(self.__entity)
+			self.__dict__['_EntityComponentAccessor__data'] = data
 		setattr(self.__data, name, value)
 
 
@@ -213,3 +282,102 @@ class ComponentEntitySet(set):
 			self._component.fields[name].accessor(self).__set__(value)
 		raise AttributeError(name)
 
+
+class SparseEntitySet(object):
+	"""Set of entities keyed by their dense entity ids, with a value 
+	associated with each member. The members and their values are kept
+	in parallel dense lists, and a sparse dict maps the entity id of each
+	member to its position in them.
+
+	Adding and removing members is O(1) and, unlike Python sets, never
+	calls :meth:`Entity.__hash__`. Memory use is proportional to the
+	number of members, however large the entity ids grow.
+	"""
+
+	def __init__(self):
+		self.sparse = {}
+		self.ids = []
+		self.entities = []
+		self.values = []
+	
+	def add(self, entity, value=None):
+		"""Add an entity to the set, or replace its value if it is 
+		already a member
+		"""
+		entity_id = entity.entity_id
+		sparse = self.sparse
+		if entity_id in sparse:
+			self.values[sparse[entity_id]] = value
+		else:
+			sparse[entity_id] = len(self.ids)
+			self.ids.append(entity_id)
+			self.entities.append(entity)
+			self.values.append(value)
+	
+	def remove(self, entity):
+		"""Remove an entity from the set, raise KeyError if it is not
+		a member. The last member takes the place of the one removed.
+		"""
+		entity_id = entity.entity_id
+		sparse = self.sparse
+		try:
+			index = sparse.pop(entity_id)
+		except KeyError:
+			raise KeyError(entity)
+		last_id = self.ids.pop()
+		last_entity = self.entities.pop()
+		last_value = self.values.pop()
+		if last_id != entity_id:
+			sparse[last_id] = index
+			self.ids[index] = last_id
+			self.entities[index] = last_entity
+			self.values[index] = last_value
+	
+	def discard(self, entity):
+		"""Remove an entity from the set if it is a member"""
+		try:
+			self.remove(entity)
+		except KeyError:
+			pass
+	
+	def get(self, entity, default=None):
+		"""Return the value for an entity, or default if it is not 
+		a member
+		"""
+		index = self.sparse.get(entity.entity_id)
+		if index is not None:
+			return self.values[index]
+		return default
+	
+	def __contains__(self, entity):
+		return getattr(entity, 'entity_id', None) in self.sparse
+	
+	def __iter__(self):
+		return iter(tuple(self.entities))
+	
+	def __len__(self):
+		return len(self.ids)
+
+
+def join_sparse(sparse_sets):
+	"""Return a list containing a tuple for each entity that is a member
+	of all of the sparse sets specified, with the entity's value from 
+	each set in order. Only the smallest set is iterated, the others are
+	probed by entity id.
+	"""
+	smallest = min(sparse_sets, key=len)
+	ids = smallest.ids
+	rows = range(len(ids))
+	for sparse_set in sparse_sets:
+		if sparse_set is not smallest:
+			sparse = sparse_set.sparse
+			rows = [i for i in rows if ids[i] in sparse]
+	columns = []
+	for sparse_set in sparse_sets:
+		values = sparse_set.values
+		if sparse_set is smallest:
+			columns.append([values[i] for i in rows])
+		else:
+			sparse = sparse_set.sparse
+			columns.append([values[sparse[ids[i]]] for i in rows])
+	return zip(*columns)
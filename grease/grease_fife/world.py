@@ -39,9 +39,4 @@ class World(Mode, BaseWorld):
         BaseWorld.__init__(self)
             
     def step(self, dt):
-        for component in self.components:
-            if hasattr(component, "step"):
-                component.step(dt)
-        for system in self.systems:
-            if hasattr(system, "step"):
-                system.step(dt)
+        BaseWorld.step(self, dt)
@@ -136,6 +136,9 @@ class KeyControls(bGrease.System):
 		"""Handle pyglet key press. Invoke key press methods and
 		activate key hold functions
 		"""
+		recorder = getattr(self.world, 'recorder', None)
+		if recorder is not None:
+			recorder.record_input(self, 'on_key_press', key, modifiers)
 		key_mod = (key, modifiers & self.MODIFIER_MASK)
 		if key_mod in self._key_press_map:
 			self._key_press_map[key_mod]()
@@ -145,6 +148,9 @@ class KeyControls(bGrease.System):
 		"""Handle pyglet key release. Invoke key release methods and
 		deactivate key hold functions
 		"""
+		recorder = getattr(self.world, 'recorder', None)
+		if recorder is not None:
+			recorder.record_input(self, 'on_key_release', key, modifiers)
 		key_mod = (key, modifiers & self.MODIFIER_MASK)
 		if key_mod in self._key_release_map:
 			self._key_release_map[key_mod]()
@@ -101,7 +101,8 @@ class World(Mode, BaseWorld):
 	
 	def step(self, dt):
 		"""Execute a time step for the world. Updates the world `time`
-		and invokes the world's systems.
+		and invokes the world's systems, then applies the changes recorded
+		in the world's :attr:`commands`.
 		
 		Note that the specified time delta will be pinned to 10x the
 		configured step rate. For example if the step rate is 60,
@@ -113,12 +114,7 @@ class World(Mode, BaseWorld):
 		:type dt: float
 		"""
 		dt = min(dt, 10.0 / self.step_rate)
-		for component in self.components:
-			if hasattr(component, "step"):
-				component.step(dt)
-		for system in self.systems:
-			if hasattr(system, "step"):
-				system.step(dt)
+		BaseWorld.step(self, dt)
 
 	def on_draw(self, gl=pyglet.gl):
 		"""Clear the current OpenGL context, reset the model/view matrix and
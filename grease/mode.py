@@ -72,6 +72,8 @@ class BaseManager(object):
 		:param mode: The :class: 'Mode' object to activate
 		"""
 		mode.activate(self)
+		if getattr(mode, 'recorder', None) is not None:
+			mode.recorder.record_mode('activate', self)
 
 	def deactivate_mode(self, mode):
 		"""Perform actions to deactivate a node
@@ -79,6 +81,8 @@ class BaseManager(object):
 		:param mode: The :class: 'Mode' object to deactivate
 		"""
 		mode.deactivate(self)
+		if getattr(mode, 'recorder', None) is not None:
+			mode.recorder.record_mode('deactivate', self)
 
 		
 	def push_mode(self, mode):
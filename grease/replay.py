@@ -0,0 +1,233 @@
+#############################################################################
+#
+# Copyright (c) 2010 by Casey Duncan and contributors
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the MIT License
+# A copy of the license should accompany this distribution.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#
+#############################################################################
+"""Recording and deterministic replay of worlds.
+
+A :class:`Recorder` logs the time delta of each world step, the input
+events dispatched to the world's systems, such as
+:class:`bGrease.grease_pyglet.controls.KeyControls`, and the world's mode
+transitions, along with periodic snapshots of the world saved with
+:mod:`bGrease.serialize`.
+
+A :class:`Player` re-runs a world from a recording without a clock or
+event loop, as fast as possible, for reproducing bugs and profiling
+offline. The world must be configured with the same components and
+systems as the recorded world. Systems should get any random numbers
+from the :mod:`random` module, whose state is saved with each snapshot.
+
+Example::
+
+	recorder = replay.Recorder(world, open('game.rec', 'wb'))
+	...
+	recorder.close()
+
+	player = replay.Player(open('game.rec', 'rb'))
+	player.play(GameWorld())
+"""
+
+__version__ = '$Id$'
+
+import random
+import cPickle
+from cStringIO import StringIO
+from bGrease import serialize
+
+FORMAT_VERSION = 1
+"""Version of the recording format written"""
+
+_magic = 'GRRC'
+
+
+class Recorder(object):
+	"""Records a world to a stream. The recorder is attached to the world
+	as its :attr:`~bGrease.world.BaseWorld.recorder` until closed.
+
+	:param world: The world to record. A snapshot of the world is saved
+		when recording starts.
+	:param stream: File-like object to write the recording to.
+	:param snapshot_interval: Number of steps between world snapshots.
+	"""
+
+	steps = 0
+	"""Number of world steps recorded"""
+
+	def __init__(self, world, stream, snapshot_interval=600):
+		self.world = world
+		self.stream = stream
+		self.snapshot_interval = snapshot_interval
+		self._system_names = {}
+		self._write((_magic, FORMAT_VERSION))
+		self.snapshot()
+		world.recorder = self
+
+	def _write(self, record):
+		cPickle.dump(record, self.stream, 2)
+
+	def record_step(self, dt):
+		"""Record a step of the world with the time delta `dt`. Called by
+		the world at the start of each step
+		"""
+		if self.steps and self.steps % self.snapshot_interval == 0:
+			self.snapshot()
+		self._write(('step', self.steps, dt))
+		self.steps += 1
+
+	def record_input(self, system, event, *args):
+		"""Record an input event dispatched to a system of the world. Input
+		events are replayed by calling the method named `event` of the system
+		with `args` before the next world step.
+		"""
+		try:
+			name = self._system_names[system]
+		except KeyError:
+			for name, part in vars(self.world.systems).items():
+				if part is system:
+					break
+			else:
+				raise ValueError("System %r is not in the recorded world" % system)
+			self._system_names[system] = name
+		self._write(('input', self.steps, name, event, args))
+
+	def record_mode(self, transition, manager):
+		"""Record the world mode being activated or deactivated by a
+		mode manager, along with the class names of the modes on the
+		manager's stack
+		"""
+		self._write(('mode', self.steps, transition,
+			[mode.__class__.__name__ for mode in manager.modes]))
+
+	def snapshot(self):
+		"""Save a snapshot of the world and the state of the :mod:`random`
+		module to the recording
+		"""
+		data = StringIO()
+		serialize.dump(self.world, data)
+		self._write(('snapshot', self.steps, random.getstate(), data.getvalue()))
+
+	def close(self):
+		"""Stop recording and detach the recorder from the world. The
+		stream is flushed but not closed.
+		"""
+		if self.world.recorder is self:
+			self.world.recorder = None
+		self.stream.flush()
+
+
+def _read_records(stream):
+	while True:
+		try:
+			yield cPickle.load(stream)
+		except EOFError:
+			break
+
+def _world_state(data):
+	"""Return the entities and component records of serialized world data
+	as dicts keyed by entity id, for comparing worlds
+	"""
+	header, chunks = serialize.read(StringIO(data))
+	state = {None: header['next_entity_id']}
+	for kind, name, records in chunks:
+		state.setdefault(kind, {}).setdefault(name, {}).update(records)
+	return state
+
+class Player(object):
+	"""Replays a recording made by a :class:`Recorder`.
+
+	:param stream: Seekable file-like object to read the recording from.
+	"""
+
+	desyncs = ()
+	"""Steps where the world state differed from the recorded snapshot
+	during the last :meth:`play()`
+	"""
+
+	mode_transitions = ()
+	"""List of (step, transition, mode class names) recorded during the
+	last :meth:`play()`. Mode transitions are informational only, they are
+	not replayed, since the played world is not managed by the recorded
+	mode manager.
+	"""
+
+	snapshots = ()
+	"""List of the (step, stream offset) of the snapshots in the recording"""
+
+	def __init__(self, stream):
+		self.stream = stream
+		magic, version = cPickle.load(stream)
+		if magic != _magic:
+			raise ValueError("Not a world recording")
+		if version > FORMAT_VERSION:
+			raise ValueError("Unsupported recording version: %d" % version)
+		self.snapshots = []
+		while True:
+			offset = stream.tell()
+			try:
+				record = cPickle.load(stream)
+			except EOFError:
+				break
+			if record[0] == 'snapshot':
+				self.snapshots.append((record[1], offset))
+
+	def play(self, world, start=0, stop=None, verify=True):
+		"""Replay the recording into the world, which must not contain any
+		entities. The world is loaded from the last snapshot recorded at or
+		before the `start` step, then stepped with the recorded time
+		deltas and input events until the `stop` step or the end of the
+		recording. Return the number of steps played.
+
+		State kept by systems, such as held keys, is not part of the
+		snapshots, so replays that start after the first snapshot may
+		diverge from the recording.
+
+		Recorded mode transitions are collected in :attr:`mode_transitions`
+		but not re-applied, the world is stepped whether or not it was the
+		active mode when recorded.
+
+		:param verify: If true, compare the world to each later snapshot
+			in the recording and add the steps where they differ to
+			:attr:`desyncs`.
+		"""
+		offset = None
+		for step, snapshot_offset in self.snapshots:
+			if step <= start:
+				offset = snapshot_offset
+		if offset is None:
+			raise ValueError("No snapshot recorded at or before step %d" % start)
+		self.stream.seek(offset)
+		self.desyncs = []
+		self.mode_transitions = []
+		loaded = False
+		played = 0
+		for record in _read_records(self.stream):
+			kind, step = record[:2]
+			if stop is not None and step >= stop:
+				break
+			if kind == 'step':
+				world.step(record[2])
+				played += 1
+			elif kind == 'input':
+				name, event, args = record[2:]
+				getattr(getattr(world.systems, name), event)(*args)
+			elif kind == 'mode':
+				self.mode_transitions.append(record[1:])
+			elif kind == 'snapshot':
+				random_state, data = record[2:]
+				if not loaded:
+					serialize.load(world, StringIO(data))
+					random.setstate(random_state)
+					loaded = True
+				elif verify:
+					saved = StringIO()
+					serialize.dump(world, saved)
+					if _world_state(saved.getvalue()) != _world_state(data):
+						self.desyncs.append(step)
+		return played
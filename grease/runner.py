@@ -0,0 +1,133 @@
+#############################################################################
+#
+# Copyright (c) 2010 by Casey Duncan and contributors
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the MIT License
+# A copy of the license should accompany this distribution.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#
+#############################################################################
+"""Headless running of worlds.
+
+A :class:`Runner` steps one or more worlds with a fixed time delta in a
+tight loop, as fast as possible, without a clock or event loop. This is
+useful for server-side simulation, training AI and batch testing.
+
+Example::
+
+	runner = Runner([GameWorld() for i in range(8)], dt=1.0 / 60.0)
+	stats = runner.run(steps=10000, time_budget=30.0)
+	print stats.steps_per_second
+"""
+
+__version__ = '$Id$'
+
+import time
+
+
+class RunStats(object):
+	"""Statistics of a :meth:`Runner.run()`. Times are in seconds."""
+
+	FIELDS = ('worlds', 'steps', 'world_steps', 'sim_time', 'elapsed',
+		'steps_per_second', 'world_steps_per_second')
+
+	worlds = 0
+	"""Number of worlds run"""
+
+	steps = 0
+	"""Number of time steps run. Each world is stepped once per time step"""
+
+	sim_time = 0.0
+	"""Simulated time elapsed in each world"""
+
+	elapsed = 0.0
+	"""Wall clock time spent running"""
+
+	@property
+	def world_steps(self):
+		"""Total number of world steps run"""
+		return self.steps * self.worlds
+
+	@property
+	def steps_per_second(self):
+		"""Time steps run per wall clock second, or None if no time elapsed"""
+		if self.elapsed:
+			return self.steps / self.elapsed
+
+	@property
+	def world_steps_per_second(self):
+		"""World steps run per wall clock second, or None if no time elapsed"""
+		if self.elapsed:
+			return self.world_steps / self.elapsed
+
+	def as_dict(self):
+		"""Return the statistics as a dict"""
+		return dict((name, getattr(self, name)) for name in self.FIELDS)
+
+	def __repr__(self):
+		return '<%s %s>' % (self.__class__.__name__, ' '.join(
+			'%s=%r' % (name, getattr(self, name)) for name in self.FIELDS))
+
+
+class Runner(object):
+	"""Steps worlds with a fixed time delta, as fast as possible.
+
+	:param worlds: A world or sequence of worlds to run. The worlds are
+		stepped in turn each time step.
+	:param dt: The time delta of each world step.
+	"""
+
+	running = False
+	"""Flag set while the runner is running. Set to False, or call
+	:meth:`stop()`, to stop after the current time step.
+	"""
+
+	stats = None
+	""":class:`RunStats` for the last run"""
+
+	def __init__(self, worlds, dt=1.0 / 60.0):
+		if hasattr(worlds, 'step'):
+			worlds = [worlds]
+		self.worlds = list(worlds)
+		self.dt = dt
+
+	def run(self, steps=None, time_budget=None):
+		"""Step the worlds until `steps` time steps have been run,
+		`time_budget` seconds of wall clock time have elapsed, or
+		:meth:`stop()` is called. With neither `steps` nor `time_budget`,
+		run until stopped. Return a :class:`RunStats` for the run.
+		"""
+		dt = self.dt
+		world_steps = [world.step for world in self.worlds]
+		start = time.time()
+		if time_budget is not None:
+			deadline = start + time_budget
+		count = 0
+		self.running = True
+		try:
+			while self.running and (steps is None or count < steps):
+				for step in world_steps:
+					step(dt)
+				count += 1
+				if time_budget is not None and time.time() >= deadline:
+					break
+		finally:
+			self.running = False
+		stats = self.stats = RunStats()
+		stats.elapsed = time.time() - start
+		stats.worlds = len(world_steps)
+		stats.steps = count
+		stats.sim_time = count * dt
+		return stats
+
+	def stop(self):
+		"""Stop running after the current time step"""
+		self.running = False
+
+
+def run(worlds, steps=None, time_budget=None, dt=1.0 / 60.0):
+	"""Run worlds with a :class:`Runner` and return its :class:`RunStats`"""
+	return Runner(worlds, dt).run(steps, time_budget)
@@ -0,0 +1,285 @@
+#############################################################################
+#
+# Copyright (c) 2010 by Casey Duncan and contributors
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the MIT License
+# A copy of the license should accompany this distribution.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#
+#############################################################################
+"""Streaming save and load of worlds.
+
+Worlds are written to and read from a file-like stream incrementally, a
+chunk of entities or component records at a time, so saving or loading
+a large world never holds more than one chunk of serialized data in
+memory.
+
+The stream begins with a versioned schema header listing the fields of
+each :class:`~bGrease.component.Component` in the world and their types.
+When loading, fields saved that are no longer in a component are dropped,
+and fields added to a component since are set to their default values.
+The header also holds the id of the next entity of the saved world, so
+loaded worlds never reuse the ids of entities deleted before saving.
+
+Example::
+
+	with open('world.save', 'wb') as stream:
+		serialize.dump(world, stream)
+
+	world = GameWorld()
+	with open('world.save', 'rb') as stream:
+		serialize.load(world, stream)
+"""
+
+__version__ = '$Id$'
+
+import sys
+import json
+import struct
+import cPickle
+import itertools
+from bGrease.entity import Entity
+from bGrease.component import Component
+from bGrease.geometry import Vec2d, Vec2dArray, Rect
+from bGrease.color import RGBA
+
+FORMAT_VERSION = 1
+"""Version of the stream format written"""
+
+_magic = 'GRSW'
+_header = struct.Struct('<4sII')
+"""Stream header: magic, format version and schema length. The JSON
+schema follows the header, then the pickled chunks"""
+
+
+class _EntityRef(object):
+	"""Reference to an entity by id, used to save entities stored in
+	:class:`object` fields
+	"""
+
+	def __init__(self, entity_id):
+		self.entity_id = entity_id
+
+	def __eq__(self, other):
+		return (isinstance(other, _EntityRef)
+			and other.entity_id == self.entity_id)
+
+	def __ne__(self, other):
+		return not self.__eq__(other)
+
+
+def _encode_object(value):
+	if isinstance(value, Entity):
+		return _EntityRef(value.entity_id)
+	return value
+
+_encoders = {
+	Vec2d: lambda v: (v.x, v.y),
+	Vec2dArray: lambda a: [(v.x, v.y) for v in a],
+	RGBA: lambda c: (c.r, c.g, c.b, c.a),
+	Rect: lambda r: (r.left, r.bottom, r.right, r.top),
+	object: _encode_object,
+}
+"""Field types -> functions converting field values to picklable values"""
+
+_decoders = {
+	Vec2d: Vec2d,
+	Vec2dArray: Vec2dArray,
+	RGBA: RGBA,
+	Rect: lambda values: Rect(*values),
+}
+"""Field types -> functions converting saved values to field values"""
+
+_type_names = {}
+for _type in (int, float, bool, str, object, list, dict, set,
+	Vec2d, Vec2dArray, RGBA, Rect):
+	_type_names[_type] = _type.__name__
+_types_by_name = dict((name, ftype) for ftype, name in _type_names.items())
+
+
+def _class_name(entity_class):
+	name = '%s.%s' % (entity_class.__module__, entity_class.__name__)
+	if _import_class(name) is not entity_class:
+		raise ValueError("Entity class %s cannot be imported by name" % name)
+	return name
+
+def _import_class(name):
+	module_name, class_name = name.rsplit('.', 1)
+	__import__(module_name)
+	return getattr(sys.modules[module_name], class_name, None)
+
+
+def _next_entity_id(world):
+	"""Return the id the world will give its next new entity"""
+	entity_id = world.new_entity_id()
+	world.new_entity_id = itertools.count(entity_id).next
+	return entity_id
+
+
+def _components(world):
+	"""Return a sorted list of the world's components as (name, component)"""
+	return sorted((name, component)
+		for name, component in vars(world.components).items()
+		if not name.startswith('_') and isinstance(component, Component))
+
+def schema(world):
+	"""Return the schema of the world's components, a dict mapping
+	component names to lists of (field name, type name) pairs
+	"""
+	return dict((name, sorted((fname, _type_names[field.type])
+		for fname, field in component.fields.items()))
+		for name, component in _components(world))
+
+
+def _chunks(iterable, size):
+	iterator = iter(iterable)
+	while True:
+		chunk = list(itertools.islice(iterator, size))
+		if not chunk:
+			break
+		yield chunk
+
+def _world_chunks(world, chunk_size):
+	"""Generate (kind, name, records) chunks for the entities and the
+	component data of the world
+	"""
+	class_names = {}
+	def entity_record(entity):
+		cls = entity.__class__
+		if cls not in class_names:
+			class_names[cls] = _class_name(cls)
+		return (entity.entity_id, class_names[cls])
+	for chunk in _chunks(itertools.imap(entity_record, world.entities), chunk_size):
+		yield ('entities', None, chunk)
+	for name, component in _components(world):
+		fields = sorted(component.fields.items())
+		getters = [(fname, _encoders.get(field.type)) for fname, field in fields]
+		def data_record(entity):
+			data = component[entity]
+			return (entity.entity_id, tuple(
+				encode(getattr(data, fname)) if encode is not None
+				else getattr(data, fname) for fname, encode in getters))
+		for chunk in _chunks(itertools.imap(data_record, component.entities), chunk_size):
+			yield ('component', name, chunk)
+
+def dump(world, stream, chunk_size=1000):
+	"""Write the entities of the world and the data of its components to
+	a stream, a chunk at a time.
+
+	Entity classes must be importable by name. Entities stored directly in
+	:class:`object` fields are saved by reference, and load as ``None`` if
+	they are no longer in the world. Other field values are pickled.
+
+	:param world: The world to save.
+	:param stream: File-like object to write to.
+	:param chunk_size: Maximum number of entities or component records
+		serialized together.
+	"""
+	header = json.dumps({
+		'components': schema(world),
+		'next_entity_id': _next_entity_id(world),
+	}, sort_keys=True)
+	stream.write(_header.pack(_magic, FORMAT_VERSION, len(header)))
+	stream.write(header)
+	pickler = cPickle.Pickler(stream, 2)
+	for chunk in _world_chunks(world, chunk_size):
+		pickler.dump(chunk)
+		pickler.clear_memo()
+
+
+def _read_chunks(stream):
+	"""Generate the (kind, name, records) chunks read from the stream"""
+	unpickler = cPickle.Unpickler(stream)
+	while True:
+		try:
+			yield unpickler.load()
+		except EOFError:
+			break
+
+def read(stream):
+	"""Read the header of a stream written by :func:`dump`. Return the
+	header, a dict with the saved ``components`` schema and the
+	``next_entity_id`` of the saved world, and an iterator of the
+	(kind, name, records) chunks that follow it.
+
+	Entity chunks have the kind ``'entities'`` and records of
+	(entity id, entity class name). Component chunks have the kind
+	``'component'``, the component name, and records of (entity id,
+	field values), with the field values in the order of the schema.
+	"""
+	magic, version, header_size = _header.unpack(stream.read(_header.size))
+	if magic != _magic:
+		raise ValueError("Not a saved world stream")
+	if version > FORMAT_VERSION:
+		raise ValueError("Unsupported world stream version: %d" % version)
+	header = json.loads(stream.read(header_size))
+	return header, _read_chunks(stream)
+
+def load(world, stream):
+	"""Read entities and component data written by :func:`dump` from a
+	stream into the world, which must not contain any entities. The world
+	must have a component for each component saved. Entities keep the ids
+	they were saved with, and new entities are given the ids the saved
+	world would have given them. Entity constructors are not called.
+
+	Return the number of entities loaded.
+	"""
+	assert not world.entities, "Cannot load world, world is not empty"
+	header, chunks = read(stream)
+	loaders = {}
+	for name, fields in header['components'].items():
+		component = getattr(world.components, str(name), None)
+		if not isinstance(component, Component):
+			raise ValueError("World has no component %s to load" % name)
+		loaders[name] = _component_loader(component, fields)
+
+	entities = {}
+	classes = {}
+	new = object.__new__
+	set_attr = object.__setattr__
+	for kind, name, records in chunks:
+		if kind == 'entities':
+			chunk = []
+			for entity_id, class_name in records:
+				try:
+					cls = classes[class_name]
+				except KeyError:
+					cls = classes[class_name] = _import_class(class_name)
+				entity = new(cls)
+				set_attr(entity, 'world', world)
+				set_attr(entity, 'entity_id', entity_id)
+				entities[entity_id] = entity
+				chunk.append(entity)
+			world.entities.update(chunk)
+		else:
+			loaders[name](records, entities)
+	world.new_entity_id = itertools.count(header['next_entity_id']).next
+	return len(entities)
+
+def _component_loader(component, saved_fields):
+	"""Return a function that sets the component data from saved records,
+	converting from the saved schema to the component's fields
+	"""
+	fields = []
+	for fname, type_name in saved_fields:
+		fname = str(fname)
+		if fname in component.fields:
+			decode = _decoders.get(_types_by_name.get(type_name))
+			fields.append((fname, decode))
+		else:
+			fields.append((None, None))
+	def load_records(records, entities):
+		for entity_id, values in records:
+			data = {}
+			for (fname, decode), value in itertools.izip(fields, values):
+				if fname is not None:
+					if decode is not None:
+						value = decode(value)
+					elif isinstance(value, _EntityRef):
+						value = entities.get(value.entity_id)
+					data[fname] = value
+			component.set(entities[entity_id], **data)
+	return load_records
@@ -0,0 +1,175 @@
+#############################################################################
+#
+# Copyright (c) 2010 by Casey Duncan and contributors
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the MIT License
+# A copy of the license should accompany this distribution.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+#
+#############################################################################
+"""Memory-mapped world snapshots for fast loading of large worlds.
+
+A snapshot file holds the entities of a world and the columns of its
+:class:`~bGrease.component.array.ArrayComponent` components, each laid out
+contiguously. Loading a snapshot maps the file into memory and adopts the
+columns as the components' columns directly, so no field values are
+copied or converted, and no entity constructors are run.
+
+Requires NumPy.
+
+Example::
+
+	snapshot.save(world, 'level1.snapshot')
+
+	world = GameWorld()
+	snapshot.load(world, 'level1.snapshot')
+"""
+
+__version__ = '$Id$'
+
+import mmap
+import json
+import struct
+import itertools
+import numpy
+from bGrease.component import Component
+from bGrease.component.array import ArrayComponent
+from bGrease.serialize import _class_name, _import_class, _next_entity_id
+
+_header = struct.Struct('<4sIQ')
+"""Snapshot file header: magic, format version and directory length. The
+JSON directory follows the header, and the data follows the directory"""
+
+_magic = 'GRSN'
+_version = 1
+_align = 64
+
+
+def save(world, path):
+	"""Save a snapshot of the entities in the world and the data in its 
+	array components to the file at the path specified.
+
+	Only array components are saved, and all of their fields must be
+	stored in columns. Other components must be empty, use
+	:mod:`bGrease.serialize` to save worlds with data in other components.
+	Entity classes must be importable by name.
+	"""
+	entities = list(world.entities)
+	class_names = {}
+	for entity_class in set(entity.__class__ for entity in entities):
+		class_names[entity_class] = _class_name(entity_class)
+	classes = sorted(class_names.values())
+	class_index = dict((name, i) for i, name in enumerate(classes))
+	arrays = []
+	offset = [0]
+	def add_array(array):
+		array = numpy.ascontiguousarray(array)
+		arrays.append(array)
+		array_offset = offset[0]
+		offset[0] += array.nbytes + (-array.nbytes % _align)
+		return array_offset
+	directory = {
+		'classes': classes,
+		'next_entity_id': _next_entity_id(world),
+		'entity_count': len(entities),
+		'entity_ids': add_array(numpy.array(
+			[entity.entity_id for entity in entities], numpy.int64)),
+		'entity_classes': add_array(numpy.array(
+			[class_index[class_names[entity.__class__]] for entity in entities], 
+			numpy.int32)),
+		'components': {},
+	}
+	for name, component in vars(world.components).items():
+		if name.startswith('_') or not isinstance(component, Component):
+			continue
+		if not isinstance(component, ArrayComponent):
+			if component.entities:
+				raise ValueError("Cannot save component %s, it is not an "
+					"array component" % name)
+			continue
+		if len(component.columns) != len(component.fields):
+			raise ValueError("Cannot save component %s, it has fields not stored "
+				"in columns" % name)
+		sparse_entities = component.sparse_entities
+		count = len(sparse_entities)
+		columns = {}
+		for fname, column in component.columns.items():
+			columns[fname] = [column.dtype.str, add_array(column[:count])]
+		directory['components'][name] = {
+			'count': count,
+			'entity_ids': add_array(numpy.array(sparse_entities.ids, numpy.int64)),
+			'columns': columns,
+		}
+	directory = json.dumps(directory, sort_keys=True)
+	start = _header.size + len(directory)
+	padding = -start % _align
+	f = open(path, 'wb')
+	try:
+		f.write(_header.pack(_magic, _version, len(directory) + padding))
+		f.write(directory + ' ' * padding)
+		for array in arrays:
+			f.write(array.tostring())
+			f.write('\0' * (-array.nbytes % _align))
+	finally:
+		f.close()
+
+
+def load(world, path):
+	"""Load the snapshot file at the path specified into the world, which
+	must not contain any entities. The world must be configured with the
+	same array components as the world the snapshot was saved from.
+
+	The file is mapped copy-on-write, and the columns of the array
+	components are views of it, so changes to the world do not change the
+	file. Entities keep the ids they were saved with, and new entities are
+	given the ids the saved world would have given them. Entity
+	constructors are not called.
+
+	Return the list of entities loaded.
+	"""
+	assert not world.entities, "Cannot load snapshot, world is not empty"
+	f = open(path, 'rb')
+	try:
+		data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+	finally:
+		f.close()
+	magic, version, directory_size = _header.unpack_from(data)
+	if magic != _magic:
+		raise ValueError("Not a snapshot file: %s" % path)
+	if version != _version:
+		raise ValueError("Unsupported snapshot version %d: %s" % (version, path))
+	start = _header.size + directory_size
+	directory = json.loads(data[_header.size:start])
+	def array(dtype, offset, count):
+		return numpy.frombuffer(data, dtype, count, start + offset)
+
+	classes = [_import_class(str(name)) for name in directory['classes']]
+	count = directory['entity_count']
+	ids = array(numpy.int64, directory['entity_ids'], count).tolist()
+	class_indexes = array(numpy.int32, directory['entity_classes'], count).tolist()
+	new = object.__new__
+	set_attr = object.__setattr__
+	entities = []
+	for entity_id, class_index in itertools.izip(ids, class_indexes):
+		entity = new(classes[class_index])
+		set_attr(entity, 'world', world)
+		set_attr(entity, 'entity_id', entity_id)
+		entities.append(entity)
+	world.entities.update(entities)
+	world.new_entity_id = itertools.count(directory['next_entity_id']).next
+
+	by_id = dict(itertools.izip(ids, entities))
+	for name, info in directory['components'].items():
+		component = getattr(world.components, str(name))
+		if not isinstance(component, ArrayComponent):
+			raise ValueError("Component %s is not an array component" % name)
+		member_count = info['count']
+		members = [by_id[entity_id] for entity_id in
+			array(numpy.int64, info['entity_ids'], member_count).tolist()]
+		columns = dict((str(fname), array(numpy.dtype(str(dtype)), offset, member_count))
+			for fname, (dtype, offset) in info['columns'].items())
+		component.adopt_columns(members, columns)
+	return entities
@@ -26,7 +26,8 @@ __version__ = '$Id$'
 import itertools
 from bGrease import mode
 from bGrease.component import ComponentError
-from bGrease.entity import Entity, ComponentEntitySet
+from bGrease.entity import (Entity, ComponentEntitySet, join_sparse,
+	install_component_accessor)
 
 
 class BaseWorld(object):
@@ -54,15 +55,36 @@ class BaseWorld(object):
 	entities = None
 	"""Set of all entities that exist in the world"""
 
+	commands = None
+	""":class:`CommandBuffer` recording structural changes to the world's
+	entities to apply at the end of the world's time step
+	"""
+
+	recorder = None
+	""":class:`bGrease.replay.Recorder` logging the world's time steps,
+	or ``None`` if the world is not being recorded
+	"""
+
+	chunked = False
+	"""If true, the world components are stored in a 
+	:class:`ChunkedComponentParts` object, which groups entities by the 
+	components they belong to. Set this in a subclass to opt in.
+	"""
+
 	def __init__(self):
-		self.components = ComponentParts(self)
+		if self.chunked:
+			self.components = ChunkedComponentParts(self)
+		else:
+			self.components = ComponentParts(self)
 		self.systems = Parts(self)
 		self.renderers = Parts(self)
+		self.commands = CommandBuffer(self)
 		self.new_entity_id = itertools.count().next
 		self.new_entity_id() # skip id 0
 		self.entities = WorldEntitySet(self)
 		self._full_extent = EntityExtent(self, self.entities)
 		self._extents = {}
+		self._union_extents = {}
 		self.configure()
 
 	def configure(self):
@@ -88,36 +110,98 @@ class BaseWorld(object):
 
 			May also be a tuple of entity classes, in which case
 			the extent returned contains union of all entities of the classes
-			in the world.
+			in the world. Like class extents, union extents are created 
+			once for each set of classes and kept up to date as entities
+			are added and removed.
 
 			May also be the special value ellipsis (``...``), which
 			returns an extent containing all entities in the world.  This allows
 			you to conveniently query all entities using ``world[...]``.
 		"""
 		if isinstance(entity_class, tuple):
-			entities = set()
-			for cls in entity_class:
-				if cls in self._extents:
-					entities |= self._extents[cls].entities
-			return EntityExtent(self, entities)
+			classes = frozenset(entity_class)
+			try:
+				return self._union_extents[classes]
+			except KeyError:
+				entities = set()
+				for cls in classes:
+					if cls in self._extents:
+						entities |= self._extents[cls].entities
+				extent = self._union_extents[classes] = EntityExtent(self, entities)
+				# Make new entities of the classes be added to the union
+				self.entities._class_sets.clear()
+				return extent
 		elif entity_class is Ellipsis:
 			return self._full_extent
 		try:
 			return self._extents[entity_class]
 		except KeyError:
-			extent = self._extents[entity_class] = EntityExtent(self, set())
+			extent = self._extents[entity_class] = EntityExtent(
+				self, set(), entity_class)
 			return extent
 	
+	def step(self, dt):
+		"""Execute a time step for the world. Steps the world's components
+		and systems, then applies the changes recorded in the world's 
+		:attr:`commands`.
+
+		:param dt: The time delta since the last time step
+		:type dt: float
+		"""
+		if self.recorder is not None:
+			self.recorder.record_step(dt)
+		for component in self.components:
+			if hasattr(component, "step"):
+				component.step(dt)
+		for system in self.systems:
+			if hasattr(system, "step"):
+				system.step(dt)
+		self.commands.apply()
+	
 	def draw_renderers(self):
 		"""Draw all renderers"""
 		for renderer in self.renderers:
 			renderer.draw()
 
+	def system_stats(self):
+		"""Return a dict of the statistics kept by the world's systems for
+		the last time step, keyed by system name. Systems keep statistics
+		by exposing a `stats` attribute with an `as_dict()` method, such 
+		as :class:`bGrease.collision.Circular` systems created with 
+		``stats=True``. Systems without statistics are omitted.
+		"""
+		stats = {}
+		for name, system in vars(self.systems).iteritems():
+			if (not name.startswith('_') 
+				and getattr(system, 'stats', None) is not None):
+				stats[name] = system.stats.as_dict()
+		return stats
+
 class WorldEntitySet(set):
 	"""Entity set for a :class:`World`"""
 
 	def __init__(self, world):
 		self.world = world
+		self._class_sets = {}
+	
+	def _extent_sets(self, entity_class):
+		"""Return the extent entity sets of the class and all of its
+		entity superclasses, and of the union extents including any of
+		them. These are resolved when an entity class is first seen, and 
+		cached until a new union extent is created.
+		"""
+		try:
+			return self._class_sets[entity_class]
+		except KeyError:
+			world = self.world
+			sets = [world[cls].entities for cls in entity_class.__mro__
+				if issubclass(cls, Entity)]
+			for classes, extent in world._union_extents.iteritems():
+				if any(isinstance(cls, type) and issubclass(entity_class, cls)
+					for cls in classes):
+					sets.append(extent.entities)
+			sets = self._class_sets[entity_class] = tuple(sets)
+			return sets
 	
 	def add(self, entity):
 		"""Add the entity to the set and all necessary class sets
@@ -125,9 +209,20 @@ class WorldEntitySet(set):
 		as needed.
 		"""
 		super(WorldEntitySet, self).add(entity)
-		for cls in entity.__class__.__mro__:
-			if issubclass(cls, Entity):
-				self.world[cls].entities.add(entity)
+		for entities in self._extent_sets(entity.__class__):
+			entities.add(entity)
+
+	def update(self, entities):
+		"""Add multiple entities to the set and all necessary class sets,
+		adding the entities of each class together
+		"""
+		by_class = {}
+		for entity in entities:
+			by_class.setdefault(entity.__class__, []).append(entity)
+		for entity_class, class_entities in by_class.iteritems():
+			super(WorldEntitySet, self).update(class_entities)
+			for extent_entities in self._extent_sets(entity_class):
+				extent_entities.update(class_entities)
 
 	def remove(self, entity):
 		"""Remove the entity from the set and, world components,
@@ -139,9 +234,8 @@ class WorldEntitySet(set):
 				del component[entity]
 			except KeyError:
 				pass
-		for cls in entity.__class__.__mro__:
-			if issubclass(cls, Entity):
-				self.world[cls].entities.discard(entity)
+		for entities in self._extent_sets(entity.__class__):
+			entities.discard(entity)
 	
 	def discard(self, entity):
 		"""Remove the entity from the set if it exists, if not,
@@ -163,9 +257,14 @@ class EntityExtent(object):
 	entities = None
 	"""The full set of entities in the extent""" 
 
-	def __init__(self, world, entities):
+	entity_class = None
+	"""The entity class of the extent, or None if it is not the extent of a
+	single class"""
+
+	def __init__(self, world, entities, entity_class=None):
 		self.__world = world
 		self.entities = entities
+		self.entity_class = entity_class
 
 	def __getattr__(self, name):
 		"""Return a queriable :class:`ComponentEntitySet` for the named component 
@@ -175,11 +274,111 @@ class EntityExtent(object):
 			world[MyEntity].movement.velocity > (0, 0)
 
 		Returns a set of entities where the value of the :attr:`velocity` field
-		of the :attr:`movement` component is greater than ``(0, 0)``.
+		of the :attr:`movement` component is greater than ``(0, 0)``. Wrap
+		the field with :func:`bGrease.component.field.lazy` to get a lazily
+		evaluated query instead, lazy queries combined with ``&`` are 
+		evaluated together.
 		"""
 		component = getattr(self.__world.components, name)
+		if self.__all_members(name, component):
+			return ComponentEntitySet(component, self.entities)
 		return ComponentEntitySet(component, self.entities & component.entities)
 
+	def __all_members(self, name, component):
+		"""Return True if all of the extent's entities are known to be
+		members of the component, using the class archetype as a hint.
+		Since member entities of the class and its subclasses are always
+		in the extent, they are all members if the component's count of
+		them matches the size of the extent.
+		"""
+		entity_class = self.entity_class
+		if (entity_class is None or not entity_class.ARCHETYPE 
+			or name not in entity_class.ARCHETYPE):
+			return False
+		class_counts = getattr(component, 'class_counts', None)
+		if class_counts is None:
+			return False
+		members = 0
+		for cls, count in class_counts.iteritems():
+			if issubclass(cls, entity_class):
+				members += count
+		return members == len(self.entities)
+
+
+class CommandBuffer(object):
+	"""Records structural changes to a world -- entities spawned and
+	deleted, and entities added to and removed from components -- to be 
+	applied together later, rather than immediately. 
+	
+	Systems and collision handlers can record changes while iterating 
+	entities or components without copying them first to avoid mutating 
+	them. The world applies the changes recorded at the end of each time
+	step, in the order they were recorded.
+
+	Used for: :attr:`World.commands`
+	"""
+
+	def __init__(self, world):
+		self.world = world
+		self._commands = []
+	
+	def spawn(self, entity_class, *args, **kw):
+		"""Record the creation of a new entity. The entity is created by
+		calling ``entity_class(world, *args, **kw)``
+		"""
+		self._commands.append((self._spawn, (entity_class, args, kw)))
+	
+	def delete(self, entity):
+		"""Record the deletion of an entity from the world. Deleting an
+		entity that no longer exists does nothing.
+		"""
+		self._commands.append((self.world.entities.discard, (entity,)))
+	
+	def set(self, component_name, entity, **data):
+		"""Record setting the data of an entity in the named component,
+		see :meth:`bGrease.component.Component.set`. The entity is added 
+		to the component if it is not already a member.
+		"""
+		self._commands.append((self._set, (component_name, entity, data)))
+	
+	def remove(self, component_name, entity):
+		"""Record the removal of an entity from the named component"""
+		self._commands.append((self._remove, (component_name, entity)))
+	
+	def _spawn(self, entity_class, args, kw):
+		entity_class(self.world, *args, **kw)
+	
+	def _set(self, component_name, entity, data):
+		if entity in self.world.entities:
+			getattr(self.world.components, component_name).set(entity, **data)
+	
+	def _remove(self, component_name, entity):
+		component = getattr(self.world.components, component_name)
+		if entity in component.entities:
+			component.remove(entity)
+	
+	def apply(self):
+		"""Apply the changes recorded, in order. Changes recorded while 
+		applying, e.g., by the constructors of entities spawned, are 
+		applied as well. Return the number of changes applied.
+		"""
+		applied = 0
+		while self._commands:
+			commands = self._commands
+			self._commands = []
+			for command, args in commands:
+				command(*args)
+			applied += len(commands)
+		return applied
+	
+	def clear(self):
+		"""Discard the changes recorded without applying them"""
+		self._commands = []
+	
+	def __len__(self):
+		"""Return the number of changes recorded and not yet applied"""
+		return len(self._commands)
+
 
 class Parts(object):
 	"""Maps world parts to attributes. The parts are kept in the
@@ -275,6 +474,14 @@ class ComponentParts(Parts):
 	Used for: :attr:`World.components`
 	"""
 
+	def __setattr__(self, name, part):
+		Parts.__setattr__(self, name, part)
+		install_component_accessor(name)
+
+	def insert(self, name, part, before=None, index=None):
+		Parts.insert(self, name, part, before, index)
+		install_component_accessor(name)
+
 	def join(self, *component_names):
 		"""Join and iterate entity data from multiple components together.
 
@@ -291,6 +498,12 @@ class ComponentParts(Parts):
 		if component_names:
 			components = [getattr(self, self._validate_name(name)) 
 				for name in component_names]
+			sparse_sets = [getattr(comp, 'sparse_entities', None) 
+				for comp in components]
+			if None not in sparse_sets:
+				for row in join_sparse(sparse_sets):
+					yield row
+				return
 			if len(components) > 1:
 				entities = components[0].entities & components[1].entities
 				for comp in components[2:]:
@@ -300,3 +513,164 @@ class ComponentParts(Parts):
 			for entity in entities:
 				yield tuple(comp[entity] for comp in components)
 
+
+class _Chunk(object):
+	"""Parallel lists of the entities with a particular component
+	signature and their data in each of those components
+	"""
+
+	__slots__ = ('signature', 'entities', 'columns')
+
+	def __init__(self, signature):
+		self.signature = signature
+		self.entities = []
+		self.columns = dict((name, []) for name in signature)
+
+
+class ChunkedComponentParts(ComponentParts):
+	"""Maps world components to attributes, and additionally groups 
+	entities with the same set of components into chunks. Each chunk
+	holds the entities and their data from each component in parallel
+	lists, so a join only needs to iterate the chunks having all of 
+	the components joined, without set intersections or per-entity 
+	lookups. In exchange adding an entity to or removing it from a 
+	component moves its data between chunks.
+
+	Only :class:`bGrease.component.Component` objects are chunked. 
+	Joins including other components fall back to the set intersection.
+
+	Used for: :attr:`World.components` when :attr:`World.chunked` is true
+	"""
+
+	_chunks = None
+	_locations = None
+	_join_chunks = None
+	_chunked_names = None
+	_attached = None
+
+	def __init__(self, world):
+		self._chunks = {}
+		self._locations = {}
+		self._join_chunks = {}
+		self._chunked_names = set()
+		self._attached = []
+		ComponentParts.__init__(self, world)
+
+	def __setattr__(self, name, part):
+		ComponentParts.__setattr__(self, name, part)
+		if not name.startswith('_'):
+			self._reindex()
+
+	def __delattr__(self, name):
+		ComponentParts.__delattr__(self, name)
+		self._reindex()
+
+	def insert(self, name, part, before=None, index=None):
+		ComponentParts.insert(self, name, part, before, index)
+		self._reindex()
+	insert.__doc__ = ComponentParts.insert.__doc__
+
+	def _reindex(self):
+		"""Attach the current components and rebuild all chunks"""
+		for component in self._attached:
+			component.set_storage(None, None)
+		self._attached = []
+		self._chunks.clear()
+		self._locations.clear()
+		self._join_chunks.clear()
+		self._chunked_names.clear()
+		components = [(name, part) for name, part in vars(self).items()
+			if not name.startswith('_') and hasattr(part, 'set_storage')]
+		for name, component in components:
+			component.set_storage(self, name)
+			self._attached.append(component)
+			self._chunked_names.add(name)
+		for name, component in components:
+			for entity in component.entities:
+				self._set_data(name, entity, component[entity])
+
+	def _chunk(self, signature):
+		try:
+			return self._chunks[signature]
+		except KeyError:
+			chunk = self._chunks[signature] = _Chunk(signature)
+			self._join_chunks.clear()
+			return chunk
+
+	def _pop_row(self, chunk, row):
+		"""Remove a row from a chunk, returning a dict of its data by 
+		component name. The last row of the chunk fills the gap.
+		"""
+		entities = chunk.entities
+		last = len(entities) - 1
+		record = {}
+		if row != last:
+			moved = entities[row] = entities[last]
+			self._locations[moved] = (chunk, row)
+			for name, column in chunk.columns.iteritems():
+				record[name] = column[row]
+				column[row] = column.pop()
+		else:
+			for name, column in chunk.columns.iteritems():
+				record[name] = column.pop()
+		entities.pop()
+		return record
+
+	def _append_row(self, signature, entity, record):
+		chunk = self._chunk(signature)
+		self._locations[entity] = (chunk, len(chunk.entities))
+		chunk.entities.append(entity)
+		columns = chunk.columns
+		for name, data in record.iteritems():
+			columns[name].append(data)
+
+	def _set_data(self, name, entity, data):
+		"""Called by a component when an entity's data is set"""
+		location = self._locations.get(entity)
+		if location is None:
+			self._append_row(frozenset((name,)), entity, {name: data})
+			return
+		chunk, row = location
+		if name in chunk.signature:
+			chunk.columns[name][row] = data
+		else:
+			record = self._pop_row(chunk, row)
+			record[name] = data
+			self._append_row(chunk.signature | frozenset((name,)), entity, record)
+
+	def _discard_data(self, name, entity):
+		"""Called by a component when an entity is removed from it"""
+		location = self._locations.get(entity)
+		if location is not None and name in location[0].signature:
+			chunk, row = location
+			record = self._pop_row(chunk, row)
+			del record[name]
+			if record:
+				self._append_row(chunk.signature - frozenset((name,)), entity, record)
+			else:
+				del self._locations[entity]
+
+	def join(self, *component_names):
+		"""Join and iterate entity data from multiple components together.
+
+		For each entity in all of the components named, yield a tuple containing
+		the entity data from each component specified. The data is iterated
+		chunk by chunk, so entities in the same chunk are yielded together.
+		"""
+		if not component_names:
+			return iter(())
+		try:
+			chunks = self._join_chunks[component_names]
+		except KeyError:
+			for name in component_names:
+				getattr(self, self._validate_name(name))
+			if not self._chunked_names.issuperset(component_names):
+				return ComponentParts.join(self, *component_names)
+			names = frozenset(component_names)
+			chunks = self._join_chunks[component_names] = [chunk 
+				for chunk in self._chunks.itervalues() if names <= chunk.signature]
+		# zip() copies the rows up front, so components can be
+		# changed while the join is iterated
+		return itertools.chain.from_iterable([
+			zip(*[chunk.columns[name] for name in component_names])
+			for chunk in chunks if chunk.entities])
@@ -7,7 +7,7 @@ class TestCollisionComp(dict):
 		self.deleted_entities = set()
 
 	def set(self, entity, left=0, bottom=0, right=0, top=0, radius=0,
-		from_mask=0xffffffff, into_mask=0xffffffff,):
+		from_mask=0xffffffff, into_mask=0xffffffff, static=False):
 		if entity in self:
 			data = self[entity]
 		else:
@@ -17,6 +17,7 @@ class TestCollisionComp(dict):
 		data.radius = radius
 		data.from_mask = from_mask
 		data.into_mask = into_mask
+		data.static = static
 		return entity
 	
 class TestPositionComp(dict):
@@ -30,12 +31,24 @@ class TestPositionComp(dict):
 		data.entity = entity
 		data.position = Vec2d(position)
 
+class TestMovementComp(dict):
+
+	def set(self, entity, velocity):
+		from bGrease.geometry import Vec2d
+		if entity in self:
+			data = self[entity]
+		else:
+			data = self[entity] = Data()
+		data.entity = entity
+		data.velocity = Vec2d(velocity)
+
 class TestWorld(object):
 
 	def __init__(self):
 		self.components = self
 		self.collision = TestCollisionComp()
 		self.position = TestPositionComp()
+		self.movement = TestMovementComp()
 	
 	def join(self, *names):
 		for entity in getattr(self, names[0]):
@@ -76,6 +89,24 @@ class TestCollisionSys(object):
 		return set(self.world.collision)
 
 
+def brute_force_pairs(world):
+	"""Return the pairs of entities with overlapping aabbs and matching masks"""
+	from bGrease.collision import Pair
+	pairs = set()
+	items = world.collision.items()
+	for i, (entity1, data1) in enumerate(items):
+		for entity2, data2 in items[i + 1:]:
+			box1 = data1.aabb
+			box2 = data2.aabb
+			if (box1.left <= box2.right and box2.left <= box1.right
+				and box1.bottom <= box2.top and box2.bottom <= box1.top
+				and (data1.from_mask & data2.into_mask 
+					or data2.from_mask & data1.into_mask)
+				and not (data1.static and data2.static)):
+				pairs.add(Pair(entity1, entity2))
+	return pairs
+
+
 class PairTestCase(unittest.TestCase):
 
 	def test_create_pair(self):
@@ -106,6 +137,28 @@ class PairTestCase(unittest.TestCase):
 		from bGrease.collision import Pair
 		self.assertEqual(repr(Pair(2,1)), "Pair(2, 1)")
 
+	def test_pair_hash_distinct(self):
+		from bGrease.collision import Pair
+		# Sequential ids must not all hash alike (e.g., 1^2 == 5^6)
+		self.assertNotEqual(hash(Pair(1, 2)), hash(Pair(5, 6)))
+		hashes = set(hash(Pair(i, j)) for i in range(32) for j in range(i + 1, 32))
+		self.assertEqual(len(hashes), 32 * 31 // 2)
+
+
+class PairKeyTestCase(unittest.TestCase):
+
+	def test_pair_key_unordered(self):
+		from bGrease.collision import pair_key
+		self.assertEqual(pair_key(3, 4), pair_key(4, 3))
+		self.assertNotEqual(pair_key(3, 4), pair_key(3, 5))
+		self.assertNotEqual(pair_key(1, 2), pair_key(5, 6))
+	
+	def test_pair_key_unpack(self):
+		from bGrease.collision import pair_key, PAIR_KEY_BITS, PAIR_KEY_MASK
+		key = pair_key(42, 7)
+		self.assertEqual(key >> PAIR_KEY_BITS, 7)
+		self.assertEqual(key & PAIR_KEY_MASK, 42)
+
 
 class BroadSweepAndPruneTestCase(unittest.TestCase):
 
@@ -278,6 +331,98 @@ class BroadSweepAndPruneTestCase(unittest.TestCase):
 		self.assertPairs(coll.collision_pairs, 
 			Pair(1,3), Pair(1,5), Pair(2,3), Pair(2,5), Pair(3,1), Pair(3,5))
 
+	def test_collision_pairs_with_layers(self):
+		from bGrease.collision import BroadSweepAndPrune, Pair
+		world = TestWorld()
+		coll = BroadSweepAndPrune()
+		coll.set_world(world)
+		set_entity = world.collision.set
+
+		# Debris never collides with other debris, only ships and
+		# ships never collide with each other
+		for i in range(1, 6):
+			set_entity(i, i, 0, i + 3, 3, from_mask=1, into_mask=2)
+		set_entity(6, 2, 2, 4, 4, from_mask=2, into_mask=1)
+		set_entity(7, 3, 1, 9, 2, from_mask=2, into_mask=1)
+		coll.step(0)
+		self.assertPairs(coll.collision_pairs, 
+			Pair(1,6), Pair(2,6), Pair(3,6), Pair(4,6), 
+			Pair(1,7), Pair(2,7), Pair(3,7), Pair(4,7), Pair(5,7))
+		self.assertEqual(coll._layer_partners([(1, 2, False), (2, 1, False)]),
+			{(1, 2, False): ((2, 1, False),), (2, 1, False): ((1, 2, False),)})
+
+		# Changing masks moves entities between layers
+		set_entity(6, 2, 2, 4, 4, from_mask=0, into_mask=0)
+		set_entity(7, 3, 1, 9, 2, from_mask=4, into_mask=4)
+		coll.step(0)
+		self.assertPairs(coll.collision_pairs)
+
+	def test_collision_pairs_with_many_layers(self):
+		import random
+		from bGrease.collision import BroadSweepAndPrune
+		rand = random.Random(11)
+		world = TestWorld()
+		coll = BroadSweepAndPrune()
+		coll.set_world(world)
+		for entity in range(1, 201):
+			x = rand.uniform(0, 50)
+			y = rand.uniform(0, 50)
+			size = rand.uniform(0.5, 5)
+			world.collision.set(entity, x, y, x + size, y + size, 
+				from_mask=rand.getrandbits(32), into_mask=rand.getrandbits(4),
+				static=rand.random() < 0.1)
+		coll.step(0)
+		# Too many distinct layers to partition, the masks are tested
+		# pair-wise without building the layer partner table
+		self.assertEqual(coll.collision_pairs, brute_force_pairs(world))
+		self.assertTrue(coll._layers is None)
+		coll.MAX_LAYERS = 1000
+		coll.step(0)
+		self.assertEqual(coll.collision_pairs, brute_force_pairs(world))
+		self.assertFalse(coll._layers is None)
+
+	def test_collision_pairs_static(self):
+		from bGrease.collision import BroadSweepAndPrune, Pair
+		world = TestWorld()
+		coll = BroadSweepAndPrune()
+		coll.set_world(world)
+		set_entity = world.collision.set
+
+		set_entity(1, 0, 0, 10, 10, static=True)
+		set_entity(2, 5, 5, 15, 15, static=True)
+		set_entity(3, 8, 8, 9, 9)
+		set_entity(4, 14, 14, 20, 20)
+		set_entity(5, 30, 30, 31, 31)
+		coll.step(0)
+		# Static entities never collide with each other
+		self.assertPairs(coll.collision_pairs, Pair(1,3), Pair(2,3), Pair(2,4))
+		self.assertEqual(coll.query_point(1, 1), set([1]))
+		self.assertEqual(coll.query_point(8.5, 8.5), set([1, 2, 3]))
+
+		# Static aabbs are not re-read each step
+		set_entity(2, 50, 50, 60, 60, static=True)
+		coll.step(0)
+		self.assertPairs(coll.collision_pairs, Pair(1,3), Pair(2,3), Pair(2,4))
+
+		# Entities that become static are moved into the static arrays
+		set_entity(3, 100, 100, 101, 101, static=True)
+		set_entity(5, 0.5, 0.5, 1, 1)
+		coll.step(0)
+		self.assertPairs(coll.collision_pairs, Pair(1,5))
+		self.assertEqual(coll.query_point(100.5, 100.5), set([3]))
+		
+		# Entities that stop being static are moved back
+		set_entity(2, 50, 50, 60, 60, static=False)
+		set_entity(4, 55, 55, 56, 56)
+		coll.step(0)
+		self.assertPairs(coll.collision_pairs, Pair(1,5), Pair(2,4))
+
+		# Deleting static entities
+		world.collision.deleted_entities.add(1)
+		coll.step(0)
+		self.assertPairs(coll.collision_pairs, Pair(2,4))
+		self.assertEqual(coll.query_point(1, 1), set([5]))
+	
 	def test_query_point(self):
 		from bGrease.collision import BroadSweepAndPrune, Pair
 		world = TestWorld()
@@ -347,6 +492,340 @@ class BroadSweepAndPruneTestCase(unittest.TestCase):
 		self.assertEqual(coll.query_point(1, 1, from_mask=8), set())
 
 
+class BroadPersistentSweepAndPruneTestCase(unittest.TestCase):
+
+	def assertPairs(self, set1, *pairs):
+		pairs = set(pairs)
+		self.assertEqual(set1, pairs,
+			"%r not found, %r not expected" % (tuple(pairs - set1), tuple(set1 - pairs)))
+
+	def test_before_step(self):
+		from bGrease.collision import BroadPersistentSweepAndPrune
+		coll = BroadPersistentSweepAndPrune()
+		self.assertEqual(coll.collision_pairs, set())
+		self.assertEqual(coll.query_point(0,0), set())
+
+	def test_collision_pairs_moving(self):
+		import random
+		from bGrease.collision import BroadPersistentSweepAndPrune
+		rand = random.Random(7)
+		world = TestWorld()
+		coll = BroadPersistentSweepAndPrune()
+		coll.set_world(world)
+		boxes = {}
+		def add(entity):
+			x = rand.uniform(0, 100)
+			y = rand.uniform(0, 100)
+			size = rand.uniform(0.5, 5)
+			boxes[entity] = [x, y, size]
+			world.collision.set(entity, x, y, x + size, y + size, 
+				from_mask=rand.choice([1, 2, 3]), into_mask=rand.choice([1, 2, 3]),
+				static=rand.random() < 0.1)
+		for entity in range(1, 101):
+			add(entity)
+		coll.step(0)
+		self.assertEqual(coll.collision_pairs, brute_force_pairs(world))
+		next_entity = 101
+		for i in range(20):
+			for entity, (x, y, size) in boxes.items():
+				data = world.collision[entity]
+				if data.static:
+					continue
+				x += rand.uniform(-3, 3)
+				y += rand.uniform(-3, 3)
+				boxes[entity] = [x, y, size]
+				world.collision.set(entity, x, y, x + size, y + size, 
+					from_mask=data.from_mask, into_mask=data.into_mask)
+			world.collision.new_entities.clear()
+			world.collision.deleted_entities.clear()
+			for j in range(3):
+				add(next_entity)
+				world.collision.new_entities.add(next_entity)
+				next_entity += 1
+				deleted = rand.choice(boxes.keys())
+				del boxes[deleted]
+				del world.collision[deleted]
+				world.collision.deleted_entities.add(deleted)
+			coll.step(0)
+			self.assertEqual(coll.collision_pairs, brute_force_pairs(world))
+			self.assertEqual(coll._by_x, sorted(coll._by_x))
+			self.assertEqual(coll._by_y, sorted(coll._by_y))
+
+	def test_collision_pairs_moved_static(self):
+		from bGrease.collision import BroadPersistentSweepAndPrune, Pair
+		world = TestWorld()
+		coll = BroadPersistentSweepAndPrune()
+		coll.set_world(world)
+		world.collision.set(1, -1, -1, 1, 1)
+		world.collision.set(2, 9, -1, 11, 1)
+		coll.step(0)
+		self.assertEqual(coll.collision_pairs, set())
+		# Moving and becoming static in the same step
+		world.collision.set(1, 8, -1, 10, 1, static=True)
+		coll.step(0)
+		self.assertEqual(coll.collision_pairs, set([Pair(1, 2)]))
+		self.assertEqual(coll.query_point(8.5, 0), set([1]))
+		# Static entities are not re-read
+		world.collision.set(1, 20, -1, 22, 1, static=True)
+		coll.step(0)
+		self.assertEqual(coll.collision_pairs, set([Pair(1, 2)]))
+		# Until they stop being static
+		world.collision[1].static = False
+		coll.step(0)
+		self.assertEqual(coll.collision_pairs, set())
+		self.assertEqual(coll.query_point(21, 0), set([1]))
+
+	def test_circles_moved_static(self):
+		from bGrease.collision import (BroadSweepAndPrune, BroadAABBTree,
+			BroadPersistentSweepAndPrune, Circular, Pair)
+		for broad_phase_class in (BroadSweepAndPrune, BroadAABBTree, 
+			BroadPersistentSweepAndPrune):
+			for fused in (False, True):
+				world = TestWorld()
+				coll = Circular(broad_phase=broad_phase_class(), fused=fused)
+				coll.set_world(world)
+				world.position.set(1, (0, 0))
+				world.collision.set(1, radius=1)
+				world.position.set(2, (10, 0))
+				world.collision.set(2, radius=1)
+				coll.step(0)
+				self.assertEqual(coll.collision_pairs, set())
+				world.position.set(1, (9, 0))
+				world.collision[1].static = True
+				for i in range(2):
+					coll.step(0)
+					self.assertEqual(coll.collision_pairs, set([Pair(1, 2)]), 
+						(broad_phase_class, fused))
+					self.assertEqual(coll.query_point(8.5, 0), set([1]))
+
+	def test_collision_pairs_with_masks(self):
+		from bGrease.collision import BroadPersistentSweepAndPrune, Pair
+		world = TestWorld()
+		coll = BroadPersistentSweepAndPrune()
+		coll.set_world(world)
+		set_entity = world.collision.set
+		set_entity(1, 0, 0, 1, 1, from_mask=1, into_mask=0)
+		set_entity(2, 0, 0, 1, 1, from_mask=0, into_mask=2)
+		set_entity(3, 0, 0, 1, 1, from_mask=2, into_mask=1)
+		set_entity(4, 0, 0, 1, 1, from_mask=0, into_mask=0)
+		coll.step(0)
+		self.assertPairs(coll.collision_pairs, Pair(1,3), Pair(2,3))
+		# Mask changes take effect immediately
+		set_entity(4, 0, 0, 1, 1, from_mask=1, into_mask=0)
+		coll.step(0)
+		self.assertPairs(coll.collision_pairs, Pair(1,3), Pair(2,3), Pair(3,4))
+
+	def test_touching_and_separating(self):
+		from bGrease.collision import BroadPersistentSweepAndPrune, Pair
+		world = TestWorld()
+		coll = BroadPersistentSweepAndPrune()
+		coll.set_world(world)
+		set_entity = world.collision.set
+		set_entity(1, 0, 0, 10, 10)
+		set_entity(2, 11, 0, 12, 1)
+		coll.step(0)
+		self.assertPairs(coll.collision_pairs)
+		set_entity(2, 10, 0, 11, 1)
+		coll.step(0)
+		self.assertPairs(coll.collision_pairs, Pair(1,2))
+		set_entity(2, 5, 20, 6, 21)
+		coll.step(0)
+		self.assertPairs(coll.collision_pairs)
+		set_entity(2, -5, -5, 15, 15)
+		coll.step(0)
+		self.assertPairs(coll.collision_pairs, Pair(1,2))
+		self.assertEqual(coll.query_point(-4, -4), set([2]))
+		self.assertEqual(coll.query_point(5, 5), set([1, 2]))
+
+
+class BroadAABBTreeTestCase(unittest.TestCase):
+
+	def assertPairs(self, set1, *pairs):
+		pairs = set(pairs)
+		self.assertEqual(set1, pairs,
+			"%r not found, %r not expected" % (tuple(pairs - set1), tuple(set1 - pairs)))
+
+	def assertTreeValid(self, tree):
+		# Every node encloses its children, and parent links are consistent
+		leaves = []
+		stack = [tree._root]
+		self.assertTrue(tree._root.parent is None)
+		while stack:
+			node = stack.pop()
+			if node.child1 is None:
+				leaves.append(node)
+				left, bottom, right, top = node.aabb
+				self.assertTrue(node.left <= left and node.bottom <= bottom
+					and node.right >= right and node.top >= top)
+				continue
+			for child in (node.child1, node.child2):
+				self.assertTrue(child.parent is node)
+				self.assertTrue(node.left <= child.left and node.bottom <= child.bottom
+					and node.right >= child.right and node.top >= child.top)
+				stack.append(child)
+			self.assertEqual(node.height, 
+				1 + max(node.child1.height, node.child2.height))
+			self.assertTrue(abs(node.child1.height - node.child2.height) <= 1)
+		self.assertEqual(len(leaves), len(tree._leaves))
+
+	def test_before_step(self):
+		from bGrease.collision import BroadAABBTree
+		coll = BroadAABBTree()
+		self.assertEqual(coll.collision_pairs, set())
+		self.assertEqual(coll.query_point(0,0), set())
+	
+	def test_collision_pairs_static_collision(self):
+		from bGrease.collision import BroadAABBTree, Pair
+		world = TestWorld()
+		coll = BroadAABBTree()
+		coll.set_world(world)
+		set_entity = world.collision.set
+		set_entity(1, 10, 10, 20, 20)
+		set_entity(2, 15, 15, 25, 25)
+		set_entity(3, 5, 12, 30, 15)
+		set_entity(4, 31, 10, 40, 13)
+		set_entity(5, 32, 11, 39, 12)
+		set_entity(6, 0, 0, 2, 2)
+		set_entity(7, -1, 0.5, 1, 1.5)
+		set_entity(8, 2.1, 2.1, 2.2, 2.2)
+		set_entity(9, 50, -40, 55, 40)
+		set_entity(10, -50, -50, 50, -45) 
+		coll.step(0)
+		self.assertTreeValid(coll)
+		pairs = set(coll.collision_pairs)
+		self.assertPairs(pairs, Pair(1,2), Pair(1,3), Pair(2,3), Pair(4,5), Pair(6,7))
+		coll.step(0)
+		self.assertEqual(coll.collision_pairs, pairs)
+
+	def test_collision_pairs_moving(self):
+		import random
+		from bGrease.collision import BroadAABBTree
+		rand = random.Random(42)
+		world = TestWorld()
+		coll = BroadAABBTree(margin=2)
+		coll.set_world(world)
+		boxes = {}
+		for entity in range(1, 101):
+			x = rand.uniform(0, 100)
+			y = rand.uniform(0, 100)
+			size = rand.uniform(0.5, 5)
+			boxes[entity] = [x, y, size]
+			world.collision.set(entity, x, y, x + size, y + size, 
+				from_mask=rand.choice([1, 2, 3]), into_mask=rand.choice([1, 2, 3]))
+		coll.step(0)
+		self.assertTreeValid(coll)
+		self.assertEqual(coll.collision_pairs, brute_force_pairs(world))
+		for i in range(10):
+			for entity, (x, y, size) in boxes.items():
+				x += rand.uniform(-3, 3)
+				y += rand.uniform(-3, 3)
+				boxes[entity] = [x, y, size]
+				data = world.collision[entity]
+				world.collision.set(entity, x, y, x + size, y + size, 
+					from_mask=data.from_mask, into_mask=data.into_mask)
+			coll.step(0)
+			self.assertTreeValid(coll)
+			self.assertEqual(coll.collision_pairs, brute_force_pairs(world))
+
+	def test_reinsert_only_outside_fat_box(self):
+		from bGrease.collision import BroadAABBTree
+		world = TestWorld()
+		coll = BroadAABBTree(margin=1)
+		coll.set_world(world)
+		world.collision.set(1, 0, 0, 2, 2)
+		world.collision.set(2, 10, 10, 12, 12)
+		world.collision.set(3, 20, 20, 22, 22)
+		coll.step(0)
+		leaf = coll._leaves[1]
+		fat_box = (leaf.left, leaf.bottom, leaf.right, leaf.top)
+		self.assertEqual(fat_box, (-1, -1, 3, 3))
+		world.collision.set(1, 0.5, 0.5, 2.5, 2.5)
+		coll.step(0)
+		self.assertEqual((leaf.left, leaf.bottom, leaf.right, leaf.top), fat_box)
+		self.assertEqual(leaf.aabb, (0.5, 0.5, 2.5, 2.5))
+		world.collision.set(1, 9, 9, 11, 11)
+		coll.step(0)
+		self.assertEqual((leaf.left, leaf.bottom, leaf.right, leaf.top), (8, 8, 12, 12))
+		self.assertTreeValid(coll)
+		self.assertEqual(coll.collision_pairs, brute_force_pairs(world))
+
+	def test_new_and_deleted_entities(self):
+		from bGrease.collision import BroadAABBTree, Pair
+		world = TestWorld()
+		coll = BroadAABBTree()
+		coll.set_world(world)
+		set_entity = world.collision.set
+		set_entity(1, 1, 1, 5, 2)
+		set_entity(2, 2, 0, 3, 5)
+		coll.step(0)
+		self.assertPairs(coll.collision_pairs, Pair(1,2))
+		set_entity(3, 0, 0, 2, 2)
+		set_entity(4, 4, 0, 5, 2)
+		world.collision.new_entities.update([3, 4])
+		coll.step(0)
+		self.assertTreeValid(coll)
+		self.assertPairs(coll.collision_pairs, Pair(1,2), Pair(1,3), Pair(2,3), Pair(1,4))
+		world.collision.new_entities.clear()
+		world.collision.deleted_entities.update([1, 3])
+		coll.step(0)
+		self.assertTreeValid(coll)
+		self.assertPairs(coll.collision_pairs)
+		self.assertEqual(coll.query_point(4.5, 1), set([4]))
+
+	def test_static_entities(self):
+		from bGrease.collision import BroadAABBTree, Pair
+		world = TestWorld()
+		coll = BroadAABBTree()
+		coll.set_world(world)
+		set_entity = world.collision.set
+		set_entity(1, 0, 0, 10, 10, static=True)
+		set_entity(2, 5, 5, 15, 15, static=True)
+		set_entity(3, 8, 8, 9, 9)
+		coll.step(0)
+		self.assertPairs(coll.collision_pairs, Pair(1,3), Pair(2,3))
+		# Static aabbs are not re-read
+		set_entity(2, 50, 50, 60, 60, static=True)
+		coll.step(0)
+		self.assertPairs(coll.collision_pairs, Pair(1,3), Pair(2,3))
+		set_entity(2, 50, 50, 60, 60)
+		coll.step(0)
+		self.assertPairs(coll.collision_pairs, Pair(1,3))
+
+	def test_query_point(self):
+		from bGrease.collision import BroadAABBTree
+		world = TestWorld()
+		coll = BroadAABBTree()
+		coll.set_world(world)
+		set_entity = world.collision.set
+		set_entity(1, -1, -1, 3, 1)
+		set_entity(2, 4, 4, 8, 8, into_mask=1)
+		set_entity(3, 6, 6, 9, 9, into_mask=2)
+		coll.step(0)
+		self.assertEqual(coll.query_point(0, 0), set([1]))
+		self.assertEqual(coll.query_point([-1, -1]), set([1]))
+		self.assertEqual(coll.query_point(-1.0001, 0), set())
+		self.assertEqual(coll.query_point(3, 1), set([1]))
+		self.assertEqual(coll.query_point(3.0001, 1), set())
+		self.assertEqual(coll.query_point([7, 7]), set([2, 3]))
+		self.assertEqual(coll.query_point([7, 7], from_mask=2), set([3]))
+		self.assertEqual(coll.query_point([8.5, 8.5]), set([3]))
+		self.assertEqual(coll.query_point(-200, 100), set())
+
+	def test_as_circular_broad_phase(self):
+		from bGrease.collision import Circular, BroadAABBTree, Pair
+		world = TestWorld()
+		coll = Circular(broad_phase=BroadAABBTree())
+		coll.set_world(world)
+		world.position.set(1, (0, 0))
+		world.collision.set(1, radius=2)
+		world.position.set(2, (3, 0))
+		world.collision.set(2, radius=1.5)
+		world.position.set(3, (2.5, 2.5))
+		world.collision.set(3, radius=1)
+		coll.step(0)
+		self.assertEqual(coll.collision_pairs, set([Pair(1, 2)]))
+
+
 class CircularTestCase(unittest.TestCase):
 
 	def test_defaults(self):
@@ -549,6 +1028,517 @@ class CircularTestCase(unittest.TestCase):
 		coll.query_point([0, 0], from_mask=0xff)
 		self.assertEqual(broad.last_from_mask, 0xff)
 
+	def test_swept_update_aabbs(self):
+		from bGrease.collision import Circular
+		broad = TestCollisionSys()
+		world = TestWorld()
+		coll = Circular(broad_phase=broad, swept=True)
+		self.assertTrue(coll.swept)
+		coll.set_world(world)
+		world.position.set(1, (10, 0))
+		world.collision.set(1, radius=1)
+		world.movement.set(1, (20, -10))
+		world.position.set(2, (3, 4))
+		world.collision.set(2, radius=2)
+		coll.step(0.5)
+		col = world.collision
+		self.assertEqual(col[1].aabb, Data(left=-1, top=6, right=11, bottom=-1))
+		self.assertEqual(col[2].aabb, Data(left=1, top=6, right=5, bottom=2))
+
+	def test_time_of_impact(self):
+		from bGrease.collision import Circular
+		from bGrease.geometry import Vec2d
+		toi = Circular.time_of_impact
+		# Head on
+		self.assertEqual(toi(Vec2d(0, 0), Vec2d(10, 0), 1, Vec2d(8, 0), Vec2d(0, 0), 1), 0.6)
+		# Already touching
+		self.assertEqual(toi(Vec2d(0, 0), Vec2d(10, 0), 1, Vec2d(1, 0), Vec2d(0, 0), 1), 0)
+		# Too short
+		self.assertEqual(toi(Vec2d(0, 0), Vec2d(5, 0), 1, Vec2d(8, 0), Vec2d(0, 0), 1), None)
+		# Moving apart
+		self.assertEqual(toi(Vec2d(0, 0), Vec2d(-5, 0), 1, Vec2d(3, 0), Vec2d(0, 0), 1), None)
+		# Miss
+		self.assertEqual(toi(Vec2d(0, 3), Vec2d(10, 0), 1, Vec2d(5, 0), Vec2d(0, 0), 1), None)
+		# Both moving
+		self.assertEqual(toi(Vec2d(0, 0), Vec2d(4, 0), 1, Vec2d(10, 0), Vec2d(-4, 0), 1), 1)
+
+	def test_swept_collision_pairs(self):
+		from bGrease.collision import Circular, Pair
+		world = TestWorld()
+		pos_set = world.position.set
+		col_set = world.collision.set
+		# A fast shot that passes completely through a thin target
+		pos_set(1, (20, 0))
+		col_set(1, radius=0.5)
+		world.movement.set(1, (300, 0))
+		pos_set(2, (10, 0))
+		col_set(2, radius=1)
+		# A slow entity nearby that never touches
+		pos_set(3, (10, 5))
+		col_set(3, radius=1)
+		world.movement.set(3, (0, 6))
+
+		coll = Circular()
+		coll.set_world(world)
+		coll.step(0.1)
+		self.assertEqual(coll.collision_pairs, set())
+
+		coll = Circular(swept=True)
+		coll.set_world(world)
+		coll.step(0.1)
+		self.assertEqual(coll.collision_pairs, set([Pair(1, 2)]))
+		pair = list(coll.collision_pairs)[0]
+		self.assertAlmostEqual(pair.time_of_impact, 18.5/30)
+		info = dict((entity, (point, normal)) for entity, point, normal in pair.info)
+		self.assertAlmostEqual(info[1][0].x, 9)
+		self.assertEqual(info[1][1], (1, 0))
+		self.assertAlmostEqual(info[2][0].x, 9)
+		self.assertEqual(info[2][1], (-1, 0))
+
+	def run_fused(self, broad_phase_class):
+		import random
+		from bGrease.collision import Circular
+		rand = random.Random(4)
+		worlds = [TestWorld(), TestWorld()]
+		systems = [Circular(broad_phase=broad_phase_class()), 
+			Circular(broad_phase=broad_phase_class(), fused=True)]
+		for world, coll in zip(worlds, systems):
+			coll.set_world(world)
+		def each_world(func, *args):
+			for world in worlds:
+				func(world, *args)
+		def add(world, entity, position, radius, static):
+			world.position.set(entity, position)
+			world.collision.set(entity, radius=radius, static=static)
+			world.collision.new_entities.add(entity)
+		def move(world, entity, position, static):
+			world.position.set(entity, position)
+			world.collision[entity].static = static
+		def remove(world, entity):
+			del world.position[entity]
+			del world.collision[entity]
+			world.collision.deleted_entities.add(entity)
+		for entity in range(1, 41):
+			each_world(add, entity, (rand.uniform(0, 50), rand.uniform(0, 50)),
+				rand.uniform(0.5, 4), entity % 7 == 0)
+		next_entity = 41
+		for i in range(25):
+			for entity in list(worlds[0].collision):
+				static = worlds[0].collision[entity].static
+				if rand.random() < 0.1:
+					static = not static
+				if not static:
+					x, y = worlds[0].position[entity].position
+					each_world(move, entity, 
+						(x + rand.uniform(-3, 3), y + rand.uniform(-3, 3)), static)
+				else:
+					each_world(move, entity, worlds[0].position[entity].position, static)
+			if rand.random() < 0.5:
+				each_world(remove, rand.choice(list(worlds[0].collision)))
+			if rand.random() < 0.5:
+				each_world(add, next_entity, (rand.uniform(0, 50), rand.uniform(0, 50)),
+					rand.uniform(0.5, 4), False)
+				next_entity += 1
+			for coll in systems:
+				coll.step(0)
+			self.assertEqual(systems[1].collision_pairs, systems[0].collision_pairs)
+			self.assertEqual(systems[1].broad_phase.collision_pairs, 
+				systems[0].broad_phase.collision_pairs)
+			for j in range(5):
+				x, y = rand.uniform(0, 50), rand.uniform(0, 50)
+				self.assertEqual(systems[1].query_point(x, y), systems[0].query_point(x, y))
+			for world in worlds:
+				world.collision.new_entities.clear()
+				world.collision.deleted_entities.clear()
+
+	def test_fused_collision_pairs(self):
+		from bGrease.collision import BroadSweepAndPrune
+		self.run_fused(BroadSweepAndPrune)
+
+	def test_fused_persistent_collision_pairs(self):
+		from bGrease.collision import BroadPersistentSweepAndPrune
+		self.run_fused(BroadPersistentSweepAndPrune)
+
+	def test_fused_few_candidate_pairs(self):
+		from bGrease.collision import Circular, Pair
+		worlds = [TestWorld(), TestWorld()]
+		systems = [Circular(), Circular(fused=True)]
+		for world, coll in zip(worlds, systems):
+			coll.set_world(world)
+			world.position.set(1, (0, 0))
+			world.collision.set(1, radius=1, static=True)
+			world.position.set(2, (0, 100))
+			world.collision.set(2, radius=1, static=True)
+			# Distant fillers, so few x-overlaps are found
+			for entity in range(3, 13):
+				world.position.set(entity, (entity * 50, entity * 50))
+				world.collision.set(entity, radius=1)
+			coll.step(0)
+		for world, coll in zip(worlds, systems):
+			world.position.set(1, (0, 50))
+			world.collision[1].static = False
+			world.position.set(2, (0, 50.5))
+			world.collision[2].static = False
+			coll.step(0)
+			self.assertEqual(coll.broad_phase.collision_pairs, set([Pair(1, 2)]))
+			self.assertEqual(coll.collision_pairs, set([Pair(1, 2)]))
+		# Overlapping along x only
+		for world, coll in zip(worlds, systems):
+			world.position.set(2, (0, 60))
+			coll.step(0)
+			self.assertEqual(coll.broad_phase.collision_pairs, set())
+
+	def test_fused_static_aabbs(self):
+		from bGrease.collision import Circular
+		world = TestWorld()
+		world.position.set(1, (0, 0))
+		world.collision.set(1, radius=1)
+		world.position.set(2, (10, 0))
+		world.collision.set(2, radius=2, static=True)
+		coll = Circular(fused=True)
+		self.assertTrue(coll.fused)
+		coll.set_world(world)
+		coll.step(0)
+		# Moving entities' aabbs are not updated, static ones are
+		self.assertEqual(world.collision[1].aabb, Data(left=0, top=0, right=0, bottom=0))
+		self.assertEqual(world.collision[2].aabb, Data(left=8, top=2, right=12, bottom=-2))
+		world.position.set(1, (3, 4))
+		world.collision[1].static = True
+		coll.step(0)
+		self.assertEqual(world.collision[1].aabb, Data(left=2, top=5, right=4, bottom=3))
+
+	def test_fused_unsupported_broad_phase(self):
+		from bGrease.collision import Circular
+		broad = TestCollisionSys()
+		world = TestWorld()
+		world.position.set(1, (0, 0))
+		world.collision.set(1, radius=2)
+		coll = Circular(broad_phase=broad, fused=True)
+		coll.set_world(world)
+		coll.step(2)
+		self.assertEqual(broad.runtime, 2)
+		self.assertEqual(world.collision[1].aabb, Data(left=-2, top=2, right=2, bottom=-2))
+
+
+class ParallelCircularTestCase(unittest.TestCase):
+
+	def make_world(self, count, seed=1):
+		import random
+		rand = random.Random(seed)
+		world = TestWorld()
+		for entity in range(1, count + 1):
+			world.position.set(entity, 
+				(rand.uniform(0, 100), rand.uniform(0, 100)))
+			world.collision.set(entity, radius=rand.uniform(0.5, 4),
+				from_mask=rand.choice([1, 2, 3]), into_mask=rand.choice([1, 2, 3]))
+		return world
+
+	def assertSameCollisions(self, coll, world):
+		from bGrease.collision import Circular
+		expected = Circular()
+		expected.set_world(world)
+		expected.step(0)
+		expected_pairs = set(pair for pair in expected.collision_pairs
+			if world.collision[pair[0]].from_mask & world.collision[pair[1]].into_mask
+			or world.collision[pair[1]].from_mask & world.collision[pair[0]].into_mask)
+		self.assertEqual(coll.collision_pairs, expected_pairs)
+		expected_info = dict((pair, sorted(pair.info)) for pair in expected_pairs)
+		for pair in coll.collision_pairs:
+			self.assertEqual(sorted(pair.info), expected_info[pair])
+	
+	def test_defaults(self):
+		import multiprocessing
+		from bGrease.collision import ParallelCircular
+		coll = ParallelCircular()
+		self.assertEqual(tuple(coll.handlers), ())
+		self.assertEqual(coll.position_component, 'position')
+		self.assertEqual(coll.collision_component, 'collision')
+		self.assertEqual(coll.processes, multiprocessing.cpu_count())
+		self.assertEqual(coll.strips, coll.processes * 4)
+
+	def test_before_step(self):
+		from bGrease.collision import ParallelCircular
+		coll = ParallelCircular()
+		coll.set_world(TestWorld())
+		self.assertEqual(coll.collision_pairs, set())
+		self.assertEqual(coll.query_point(0, 0), set())
+
+	def test_collision_pairs_in_process(self):
+		from bGrease.collision import ParallelCircular
+		world = self.make_world(300)
+		coll = ParallelCircular(processes=1)
+		coll.set_world(world)
+		coll.step(0)
+		self.assertTrue(coll.collision_pairs)
+		self.assertSameCollisions(coll, world)
+
+	def test_collision_pairs_multi_process(self):
+		from bGrease.collision import ParallelCircular
+		world = self.make_world(1000)
+		coll = ParallelCircular(processes=2, strips=5, min_parallel_count=0)
+		coll.set_world(world)
+		try:
+			coll.step(0)
+			self.assertTrue(coll._pool is not None)
+			self.assertSameCollisions(coll, world)
+			# Growing past the shared array capacity
+			world = self.make_world(3000, seed=2)
+			coll.set_world(world)
+			coll.step(0)
+			self.assertSameCollisions(coll, world)
+		finally:
+			coll.close()
+		self.assertTrue(coll._pool is None)
+
+	def test_worker_lifetime(self):
+		import gc
+		from bGrease.collision import ParallelCircular
+		world = self.make_world(200)
+		coll = ParallelCircular(processes=2, min_parallel_count=0)
+		coll.set_world(world)
+		coll.step(0)
+		pool = coll._pool
+		workers = list(pool._pool)
+		self.assertTrue(all(worker.is_alive() for worker in workers))
+		# Unbinding from the world shuts down the workers
+		coll.set_world(None)
+		self.assertTrue(coll._pool is None)
+		self.assertFalse(any(worker.is_alive() for worker in workers))
+		# So does collecting the system, even in a cycle with its world
+		world.collision_system = coll
+		coll.set_world(world)
+		coll.step(0)
+		workers = list(coll._pool._pool)
+		del world, coll
+		gc.collect()
+		self.assertFalse(any(worker.is_alive() for worker in workers))
+
+	def test_handlers(self):
+		from bGrease.collision import ParallelCircular
+		calls = []
+		coll = ParallelCircular(handlers=[calls.append], processes=1)
+		coll.set_world(self.make_world(10))
+		coll.step(0)
+		self.assertEqual(calls, [coll])
+
+	def test_query_point(self):
+		from bGrease.collision import ParallelCircular
+		world = TestWorld()
+		world.position.set(1, (0, 0))
+		world.collision.set(1, radius=1)
+		world.position.set(2, (0, 2))
+		world.collision.set(2, radius=1.5, into_mask=2)
+		world.position.set(3, (-4, 3))
+		world.collision.set(3, radius=3)
+		coll = ParallelCircular(processes=1)
+		coll.set_world(world)
+		coll.step(0)
+		self.assertEqual(coll.query_point(0,0), set([1]))
+		self.assertEqual(coll.query_point([0,1]), set([1, 2]))
+		self.assertEqual(coll.query_point(0, 1, from_mask=1), set([1]))
+		self.assertEqual(coll.query_point(1.0001, 0), set())
+		self.assertEqual(coll.query_point(-1, 3), set([2,3]))
+		self.assertEqual(coll.query_point(-5, 3), set([3]))
+
+
+class NearestNeighborsTestCase(unittest.TestCase):
+
+	def make_world(self, count, seed=2):
+		import random
+		rand = random.Random(seed)
+		world = TestWorld()
+		for entity in range(1, count + 1):
+			world.position.set(entity, 
+				(rand.uniform(0, 100), rand.uniform(0, 100)))
+			world.collision.set(entity, into_mask=rand.choice([1, 2, 4]))
+		return world
+
+	def brute_force(self, world, x, y, k, from_mask=0xffffffff, max_distance=None):
+		distances = []
+		for entity, data in world.position.items():
+			dx, dy = data.position[0] - x, data.position[1] - y
+			dist = dx*dx + dy*dy
+			if (from_mask & world.collision[entity].into_mask 
+				and (max_distance is None or dist <= max_distance**2)):
+				distances.append((dist, entity))
+		return [entity for dist, entity in sorted(distances)[:k]]
+
+	def test_empty(self):
+		from bGrease.collision import NearestNeighbors
+		nearest = NearestNeighbors()
+		nearest.set_world(TestWorld())
+		self.assertEqual(nearest.nearest(0, 0), [])
+		self.assertEqual(nearest.nearest_many([(0, 0), (1, 1)], k=3), [[], []])
+
+	def test_nearest(self):
+		from bGrease.collision import NearestNeighbors
+		world = TestWorld()
+		world.position.set(1, (0, 0))
+		world.collision.set(1)
+		world.position.set(2, (5, 0))
+		world.collision.set(2, into_mask=2)
+		world.position.set(3, (0, -3))
+		world.collision.set(3)
+		world.position.set(4, (10, 10))
+		nearest = NearestNeighbors()
+		nearest.set_world(world)
+		self.assertEqual(nearest.nearest(1, 0), [1])
+		self.assertEqual(nearest.nearest([4, 0], k=2), [2, 1])
+		self.assertEqual(nearest.nearest(4, 0, k=2, from_mask=1), [1, 3])
+		self.assertEqual(nearest.nearest(4, 0, k=5), [2, 1, 3])
+		self.assertEqual(nearest.nearest(4, 0, k=5, max_distance=4.5), [2, 1])
+		self.assertEqual(nearest.nearest(4, 0, k=0), [])
+		# Entity 4 has no collision data, so it is not indexed
+		self.assertEqual(nearest.nearest(10, 10), [2])
+
+	def test_rebuilt_after_step(self):
+		from bGrease.collision import NearestNeighbors
+		world = TestWorld()
+		world.position.set(1, (0, 0))
+		world.collision.set(1)
+		world.position.set(2, (5, 0))
+		world.collision.set(2)
+		nearest = NearestNeighbors()
+		nearest.set_world(world)
+		self.assertEqual(nearest.nearest(4, 0), [2])
+		world.position.set(2, (-5, 0))
+		# Positions are only read once per step
+		self.assertEqual(nearest.nearest(4, 0), [2])
+		nearest.step(0)
+		self.assertEqual(nearest.nearest(4, 0), [1])
+
+	def test_matches_brute_force(self):
+		import random
+		from bGrease.collision import NearestNeighbors
+		world = self.make_world(300)
+		nearest = NearestNeighbors()
+		nearest.set_world(world)
+		rand = random.Random(3)
+		for i in range(100):
+			x, y = rand.uniform(-10, 110), rand.uniform(-10, 110)
+			k = rand.randint(1, 10)
+			from_mask = rand.choice([1, 3, 4, 0xffffffff])
+			max_distance = rand.choice([None, 5, 20])
+			self.assertEqual(
+				nearest.nearest(x, y, k, from_mask, max_distance),
+				self.brute_force(world, x, y, k, from_mask, max_distance))
+
+	def test_nearest_many(self):
+		from bGrease.collision import NearestNeighbors
+		world = self.make_world(200)
+		nearest = NearestNeighbors()
+		nearest.set_world(world)
+		points = [(10, 10), (50, 50), (90, 20)]
+		self.assertEqual(nearest.nearest_many(points, k=4, from_mask=2),
+			[self.brute_force(world, x, y, 4, 2) for x, y in points])
+
+
+class CollisionStatsTestCase(unittest.TestCase):
+
+	def test_defaults(self):
+		from bGrease.collision import CollisionStats, BroadSweepAndPrune, Circular
+		stats = CollisionStats()
+		self.assertEqual(stats.candidate_pairs, 0)
+		self.assertEqual(stats.hit_ratio, None)
+		self.assertEqual(sorted(stats.as_dict()), sorted(CollisionStats.FIELDS))
+		self.assertEqual(BroadSweepAndPrune().stats, None)
+		self.assertEqual(Circular().stats, None)
+		self.assertEqual(Circular().broad_phase.stats, None)
+
+	def test_hit_ratio(self):
+		from bGrease.collision import CollisionStats
+		stats = CollisionStats()
+		stats.candidate_pairs = 8
+		stats.collisions = 2
+		self.assertEqual(stats.hit_ratio, 0.25)
+		self.assertEqual(stats.as_dict()['hit_ratio'], 0.25)
+
+	def run_broad_phase(self, coll):
+		world = TestWorld()
+		coll.set_world(world)
+		set_entity = world.collision.set
+		set_entity(1, 1, 1, 5, 2)
+		set_entity(2, 2, 0, 3, 5)
+		set_entity(3, 0, 0, 2, 2)
+		set_entity(4, 4, 0, 5, 2)
+		coll.step(0)
+		coll.collision_pairs
+		stats = coll.stats
+		self.assertEqual(stats.entities, 4)
+		self.assertEqual(stats.candidate_pairs, 4)
+		self.assertEqual(stats.removals, 0)
+		self.assertTrue(stats.update_time >= 0)
+		self.assertTrue(stats.pair_time >= 0)
+
+		# Move one across the others and delete another
+		set_entity(3, 6, 0, 7, 2)
+		world.collision.deleted_entities.add(4)
+		del world.collision[4]
+		coll.step(0)
+		coll.collision_pairs
+		self.assertEqual(stats.entities, 3)
+		self.assertEqual(stats.candidate_pairs, 1)
+		self.assertEqual(stats.removals, 1)
+		self.assertTrue(stats.sort_swaps > 0)
+		return stats
+
+	def test_broad_sweep_and_prune(self):
+		from bGrease.collision import BroadSweepAndPrune
+		self.run_broad_phase(BroadSweepAndPrune(stats=True))
+
+	def test_broad_sweep_and_prune_static_removals(self):
+		from bGrease.collision import BroadSweepAndPrune
+		world = TestWorld()
+		coll = BroadSweepAndPrune(stats=True)
+		coll.set_world(world)
+		world.collision.set(1, 0, 0, 1, 1)
+		world.collision.set(2, 3, 0, 4, 1)
+		coll.step(0)
+		world.collision[1].static = True
+		coll.step(0)
+		self.assertEqual(coll.stats.removals, 1)
+		coll.step(0)
+		self.assertEqual(coll.stats.removals, 0)
+		self.assertEqual(coll.stats.sort_swaps, 0)
+
+	def test_broad_persistent_sweep_and_prune(self):
+		from bGrease.collision import BroadPersistentSweepAndPrune
+		stats = self.run_broad_phase(BroadPersistentSweepAndPrune(stats=True))
+		self.assertEqual(stats.sort_swaps, 6)
+
+	def test_circular(self):
+		from bGrease.collision import Circular, Pair
+		world = TestWorld()
+		handler_pairs = []
+		def handler(system):
+			handler_pairs.append(system.stats.collisions)
+		coll = Circular(handlers=[handler], stats=True)
+		self.assertTrue(coll.broad_phase.stats is coll.stats)
+		coll.set_world(world)
+		world.position.set(1, (0, 0))
+		world.collision.set(1, radius=1)
+		world.position.set(2, (1.9, 1.9))
+		world.collision.set(2, radius=1)
+		world.position.set(3, (1.5, 0))
+		world.collision.set(3, radius=1)
+		coll.step(0)
+		stats = coll.stats
+		self.assertEqual(handler_pairs, [2])
+		self.assertEqual(stats.entities, 3)
+		self.assertEqual(stats.candidate_pairs, 3)
+		self.assertEqual(stats.collisions, 2)
+		self.assertAlmostEqual(stats.hit_ratio, 2.0 / 3)
+		self.assertTrue(stats.narrow_time >= 0)
+		self.assertTrue(stats.handler_time >= 0)
+
+	def test_circular_own_broad_phase_stats(self):
+		from bGrease.collision import Circular, BroadSweepAndPrune
+		broad = BroadSweepAndPrune(stats=True)
+		coll = Circular(broad_phase=broad, stats=True)
+		self.assertFalse(broad.stats is coll.stats)
+		coll = Circular(broad_phase=TestCollisionSys(), stats=True)
+		self.assertFalse(hasattr(coll.broad_phase, 'stats'))
+
 
 class TestEntity(object):
 
@@ -632,6 +1622,91 @@ class CollisionHandlerTestCase(unittest.TestCase):
 			set([(entities[0], None, None), (entities[1], None, None)]))
 		self.assertEqual(entities[3].collisions, set())
 
+	def test_event_dispatcher_caches_classes(self):
+		from bGrease.collision import EventDispatcher, Pair
+		world = TestWorld()
+		col = world.collision
+		class NoEventEntity(object):
+			pass
+		entities = [col.set(TestEntity()) for i in range(2)]
+		others = [col.set(NoEventEntity()) for i in range(2)]
+		system = TestCollisionSys(pairs=[
+			Pair(entities[0], entities[1]),
+			Pair(entities[0], others[0]),
+			Pair(others[0], others[1]),
+		])
+		system.set_world(world)
+		dispatcher = EventDispatcher()
+		dispatcher(system)
+		self.assertEqual(entities[0].collisions, 
+			set([(entities[1], None, None), (others[0], None, None)]))
+		self.assertEqual(entities[1].collisions, set([(entities[0], None, None)]))
+		self.assertEqual(dispatcher._handlers, 
+			{TestEntity: TestEntity.on_collide.im_func, NoEventEntity: None})
+
+	def test_event_dispatcher_rebound_handler(self):
+		import gc
+		from bGrease.collision import dispatch_events, _dispatchers, Pair
+		world = TestWorld()
+		col = world.collision
+		calls = []
+		class Ship(object):
+			def on_collide(self, other, point, normal):
+				calls.append('first')
+		ships = [col.set(Ship()) for i in range(2)]
+		system = TestCollisionSys(pairs=[Pair(*ships)])
+		system.set_world(world)
+		dispatch_events(system)
+		self.assertEqual(calls, ['first', 'first'])
+		def on_collide(self, other, point, normal):
+			calls.append('second')
+		Ship.on_collide = on_collide
+		dispatch_events(system)
+		self.assertEqual(calls, ['first', 'first', 'second', 'second'])
+		# The dispatcher is released with the system
+		self.assertTrue(system in _dispatchers)
+		count = len(_dispatchers)
+		del system
+		gc.collect()
+		self.assertEqual(len(_dispatchers), count - 1)
+
+	def test_event_dispatcher_batches_by_class(self):
+		from bGrease.collision import EventDispatcher, Pair
+		world = TestWorld()
+		col = world.collision
+		calls = []
+		class Ship(object):
+			def on_collide(self, other, point, normal):
+				calls.append(('ship', self))
+		class Rock(object):
+			@classmethod
+			def on_collide(cls, other, point, normal):
+				calls.append(('rock', other))
+		ships = [col.set(Ship()) for i in range(3)]
+		rocks = [col.set(Rock()) for i in range(3)]
+		system = TestCollisionSys(pairs=[Pair(ship, rock) 
+			for ship, rock in zip(ships, rocks)])
+		system.set_world(world)
+		EventDispatcher()(system)
+		self.assertEqual(len(calls), 6)
+		kinds = [kind for kind, _ in calls]
+		self.assertTrue(kinds in (['ship'] * 3 + ['rock'] * 3, 
+			['rock'] * 3 + ['ship'] * 3), kinds)
+		self.assertEqual(set(entity for _, entity in calls), set(ships))
+
+	def test_event_dispatcher_collision_info(self):
+		from bGrease.collision import EventDispatcher, Pair
+		world = TestWorld()
+		col = world.collision
+		entities = [col.set(TestEntity()) for i in range(2)]
+		pair = Pair(*entities)
+		pair.set_point_normal((1, 0), (1, 0), (2, 0), (-1, 0))
+		system = TestCollisionSys(pairs=[pair])
+		system.set_world(world)
+		EventDispatcher()(system)
+		self.assertEqual(entities[0].collisions, set([(entities[1], (2, 0), (-1, 0))]))
+		self.assertEqual(entities[1].collisions, set([(entities[0], (1, 0), (1, 0))]))
+
 
 if __name__ == '__main__':
 	unittest.main()
@@ -1,9 +1,19 @@
 import unittest
+import itertools
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
 
 world = object()
 
 class TestEntity(object):
 	world = world
+	new_entity_id = itertools.count(1).next
+
+	def __init__(self):
+		self.entity_id = self.new_entity_id()
 
 
 class GeneralTestCase(unittest.TestCase):
@@ -206,5 +216,241 @@ class GeneralTestCase(unittest.TestCase):
 		self.assertTrue(entity3 in c.entities)
 
 
+	def test_class_counts(self):
+		from bGrease.component import Component
+		class OtherEntity(TestEntity):
+			pass
+		c = Component()
+		c.set_world(world)
+		entity1 = TestEntity()
+		entity2 = TestEntity()
+		entity3 = OtherEntity()
+		c.set(entity1)
+		c.set(entity2)
+		c.set(entity2)
+		c.set(entity3)
+		self.assertEqual(c.class_counts, {TestEntity: 2, OtherEntity: 1})
+		c.remove(entity1)
+		c.remove(entity1)
+		self.assertEqual(c.class_counts, {TestEntity: 1, OtherEntity: 1})
+
+	def test_data_factory(self):
+		from bGrease.component import Component
+		from bGrease.geometry import Vec2d
+		c = Component(speed=int, accel=Vec2d, state=str, tags=list)
+		c.set_world(world)
+		create = c.data_factory(speed='3', accel=(10, 5))
+		e1 = TestEntity()
+		e2 = TestEntity()
+		ed1 = create(e1)
+		ed2 = create(e2)
+		self.assertTrue(ed1.entity is e1)
+		self.assertTrue(ed2.entity is e2)
+		self.assertEqual(ed1.speed, 3)
+		self.assertEqual(ed1.accel, (10, 5))
+		self.assertTrue(isinstance(ed1.accel, Vec2d))
+		self.assertEqual(ed1.state, "")
+		self.assertEqual(ed1.tags, [])
+		# Mutable values are not shared
+		self.assertFalse(ed1.accel is ed2.accel)
+		self.assertFalse(ed1.tags is ed2.tags)
+		# Records still cast their fields when set
+		ed1.speed = 4.5
+		self.assertEqual(ed1.speed, 4)
+		self.assertRaises(AttributeError, setattr, ed1, 'bogus', 1)
+		self.assertRaises(AttributeError, c.data_factory, bogus=1)
+
+	def test_set_archetype(self):
+		from bGrease.component import Component
+		c = Component(speed=int, state=str)
+		c.set_world(world)
+		entity1 = TestEntity()
+		entity2 = TestEntity()
+		ed = c.set_archetype(entity1, {'state': 'idle'})
+		self.assertTrue(c[entity1] is ed)
+		self.assertEqual(ed.state, 'idle')
+		self.assertEqual(list(c.new_entities), [])
+		c.step(0)
+		self.assertEqual(list(c.new_entities), [entity1])
+		# The factory is cached per entity class
+		ed = c.set_archetype(entity2, {'state': 'ignored'})
+		self.assertEqual(ed.state, 'idle')
+
+
+@unittest.skipIf(numpy is None, 'requires numpy')
+class ArrayComponentTestCase(unittest.TestCase):
+
+	def test_columns(self):
+		from bGrease.component.array import ArrayComponent
+		c = ArrayComponent(x=float, n=int, on=bool, name=str)
+		c.set_world(world)
+		self.assertEqual(sorted(c.columns), ['n', 'on', 'x'])
+		entities = [TestEntity() for i in range(40)]
+		for i, entity in enumerate(entities):
+			data = c.set(entity, x=i / 2.0, n=i, on=i % 2, name=str(i))
+			self.assertEqual(data.x, i / 2.0)
+			self.assertEqual(data.n, i)
+			self.assertTrue(isinstance(data.n, int))
+			self.assertEqual(data.on, bool(i % 2))
+			self.assertEqual(data.name, str(i))
+		self.assertEqual(list(c.columns['n'][:40]), range(40))
+		data = c[entities[3]]
+		data.n = 33.9
+		self.assertEqual(data.n, 33)
+		self.assertEqual(c.columns['n'][c.sparse_entities.sparse[entities[3].entity_id]], 33)
+		self.assertRaises(AttributeError, setattr, data, 'bogus', 1)
+		self.assertTrue(repr(data).startswith('<ArrayData('), repr(data))
+
+	def test_remove(self):
+		from bGrease.component.array import ArrayComponent
+		c = ArrayComponent(n=int)
+		c.set_world(world)
+		entities = [TestEntity() for i in range(5)]
+		records = [c.set(entity, n=i) for i, entity in enumerate(entities)]
+		del c[entities[1]]
+		self.assertFalse(entities[1] in c.entities)
+		# Removed data is still readable until the next step
+		self.assertEqual(c[entities[1]].n, 1)
+		self.assertEqual(records[1].n, 1)
+		records[1].n = 100
+		self.assertEqual(records[1].n, 100)
+		self.assertEqual([c[entity].n for entity in entities], [0, 100, 2, 3, 4])
+		self.assertEqual(sorted(c.columns['n'][:4]), [0, 2, 3, 4])
+		c.step(0)
+		self.assertFalse(entities[1] in c)
+		c.set(entities[1], n=11)
+		self.assertEqual([c[entity].n for entity in entities], [0, 11, 2, 3, 4])
+		# Replacing data detaches the old record
+		old = c[entities[2]]
+		new = c.set(entities[2], n=22)
+		self.assertEqual(old.n, 2)
+		self.assertEqual(new.n, 22)
+
+	def test_archetype(self):
+		from bGrease.component.array import ArrayComponent
+		c = ArrayComponent(n=int, tags=set)
+		c.set_world(world)
+		data = c.set_archetype(TestEntity(), {'n': 7})
+		self.assertEqual(data.n, 7)
+		self.assertEqual(data.tags, set())
+
+	def test_accessor_column_ops(self):
+		from bGrease.component.array import ArrayComponent
+		c = ArrayComponent(x=float, n=int)
+		c.set_world(world)
+		entities = [TestEntity() for i in range(10)]
+		for i, entity in enumerate(entities):
+			c.set(entity, x=i, n=i)
+		x = c.fields['x'].accessor()
+		self.assertEqual(x > 6, set(entities[7:]))
+		self.assertEqual(x == 2, set([entities[2]]))
+		some = set(entities[:5])
+		self.assertEqual(c.fields['x'].accessor(some) >= 3, set(entities[3:5]))
+		x *= 0.5
+		self.assertEqual([c[entity].x for entity in entities], [i * 0.5 for i in range(10)])
+		n = c.fields['n'].accessor(some)
+		n += 0.5
+		n -= 10
+		self.assertEqual([c[entity].n for entity in entities], 
+			[-10, -9, -8, -7, -6, 5, 6, 7, 8, 9])
+		# Joins are not vectorized
+		n_all = c.fields['n'].accessor()
+		n_all += c.fields['n'].accessor(set(entities[5:]))
+		self.assertEqual([c[entity].n for entity in entities], 
+			[-10, -9, -8, -7, -6, 10, 12, 14, 16, 18])
+
+
+	def test_accessor_sequence_values_not_vectorized(self):
+		from bGrease.component import Component
+		from bGrease.component.array import ArrayComponent
+		entities = [TestEntity() for i in range(4)]
+		array = ArrayComponent(x=float)
+		plain = Component(x=float)
+		for c in (array, plain):
+			c.set_world(world)
+			for i, entity in enumerate(entities):
+				c.set(entity, x=i)
+		values = [0.0, 1.0, 5.0, 5.0]
+		for c in (array, plain):
+			x = c.fields['x'].accessor()
+			self.assertEqual(x == values, set())
+			self.assertEqual(x == tuple(values), set())
+			self.assertEqual(x != values, set(entities))
+		x = array.fields['x'].accessor()
+		self.assertRaises(TypeError, x.__iadd__, values)
+		self.assertEqual([array[entity].x for entity in entities], [0, 1, 2, 3])
+
+	def test_share_columns(self):
+		import os
+		import tempfile
+		from bGrease.component.array import ArrayComponent, SharedColumnsReader
+		c = ArrayComponent(x=float, n=int, name=str)
+		c.set_world(world)
+		fd, path = tempfile.mkstemp()
+		os.close(fd)
+		try:
+			shared = c.share(path, capacity=8)
+			reader = SharedColumnsReader(path)
+			self.assertEqual(reader.schema, [('n', numpy.dtype(int)), ('x', numpy.dtype(float))])
+			step = reader.latest()
+			self.assertEqual(step.sequence, 1)
+			self.assertEqual(len(step.entity_ids), 0)
+			entities = [TestEntity() for i in range(5)]
+			for i, entity in enumerate(entities):
+				c.set(entity, x=i * 1.5, n=i)
+			del c[entities[0]]
+			c.step(0)
+			step = reader.latest()
+			self.assertEqual(step.sequence, 2)
+			self.assertEqual(sorted(step.entity_ids), 
+				sorted(entity.entity_id for entity in entities[1:]))
+			rows = dict(zip(step.entity_ids, zip(step.columns['x'], step.columns['n'])))
+			self.assertEqual(rows[entities[3].entity_id], (4.5, 3))
+			self.assertTrue(step.valid())
+			c[entities[3]].n = 33
+			c.step(0)
+			self.assertTrue(step.valid())
+			self.assertEqual(rows[entities[3].entity_id], (4.5, 3))
+			self.assertEqual(reader.latest().sequence, 3)
+			c.step(0)
+			self.assertFalse(step.valid())
+			for i in range(10):
+				c.set(TestEntity())
+			self.assertRaises(ValueError, c.step, 0)
+			reader.close()
+			shared.close()
+			open(path, 'wb').write('not columns' * 10)
+			self.assertRaises(ValueError, SharedColumnsReader, path)
+		finally:
+			os.remove(path)
+
+	def test_share_columns_with_worker(self):
+		import os
+		import tempfile
+		import multiprocessing
+		from bGrease.component.array import ArrayComponent
+		c = ArrayComponent(x=float)
+		c.set_world(world)
+		for i in range(100):
+			c.set(TestEntity(), x=i)
+		fd, path = tempfile.mkstemp()
+		os.close(fd)
+		try:
+			c.share(path, capacity=100)
+			results = multiprocessing.Queue()
+			worker = multiprocessing.Process(target=_sum_shared_x, args=(path, results))
+			worker.start()
+			worker.join()
+			self.assertEqual(results.get(), (1, sum(range(100))))
+			c.shared.close()
+		finally:
+			os.remove(path)
+
+def _sum_shared_x(path, results):
+	from bGrease.component.array import SharedColumnsReader
+	step = SharedColumnsReader(path).latest()
+	results.put((step.sequence, step.columns['x'].sum()))
+
+
 if __name__ == '__main__':
 	unittest.main()
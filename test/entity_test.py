@@ -145,6 +145,100 @@ class EntityTestCase(unittest.TestCase):
 		self.assertFalse(entity1.exists)
 		self.assertFalse(entity2.exists)
 	
+	def test_accessor_descriptor_installed_on_registration(self):
+		from bGrease import Entity
+		from bGrease.world import BaseWorld
+		from bGrease.component import Component
+		class Ship(Entity):
+			pass
+		world = BaseWorld()
+		ship = Ship(world)
+		# Accessing a component never modifies entity classes
+		self.assertFalse(hasattr(ship, 'hull_plating'))
+		self.assertFalse('hull_plating' in Entity.__dict__)
+		world.components.hull_plating = Component(attr=str)
+		self.assertTrue('hull_plating' in Entity.__dict__)
+		self.assertFalse('hull_plating' in Ship.__dict__)
+		world.components.hull_plating.set(ship, attr='deadbeef')
+		self.assertEqual(ship.hull_plating.attr, 'deadbeef')
+		world.components.insert('cargo_hold', Component(attr=str), index=0)
+		self.assertTrue('cargo_hold' in Entity.__dict__)
+		# Class access does not return the descriptor
+		self.assertRaises(AttributeError, getattr, Ship, 'hull_plating')
+		self.assertFalse(hasattr(Ship, 'hull_plating'))
+		# Entities of worlds without the component are not affected
+		other = Ship(BaseWorld())
+		self.assertFalse(hasattr(other, 'hull_plating'))
+		# Nor are attributes defined by entity classes
+		world.components.exists = Component()
+		self.assertTrue(ship.exists is True)
+
+	def test_accessor_not_installed_by_access(self):
+		from bGrease import Entity
+		class Ship(Entity):
+			pass
+		comp = TestComponent()
+		world = TestWorld(uncached=comp)
+		ship = Ship(world)
+		comp.set(ship)
+		self.assertEqual(ship.uncached.attr, 'deadbeef')
+		self.assertFalse('uncached' in Ship.__dict__)
+		self.assertFalse('uncached' in Entity.__dict__)
+
+	def test_accessor_descriptor_preserves_semantics(self):
+		from bGrease import Entity
+		class Rock(Entity):
+			pass
+		comp = TestComponent()
+		world = TestWorld(rocky=comp)
+		rock = Rock(world)
+		comp.set(rock)
+		self.assertTrue(rock.rocky)
+		self.assertTrue(rock.rocky is not rock.rocky)
+		# Membership is checked on each access
+		del comp[rock]
+		self.assertFalse(rock.rocky)
+		self.assertRaises(AttributeError, getattr, rock.rocky, 'attr')
+		rock.rocky.attr = 'foo'
+		self.assertEqual(comp[rock].attr, 'foo')
+		# Worlds without the component still raise AttributeError
+		other = Rock(TestWorld())
+		self.assertRaises(AttributeError, getattr, other, 'rocky')
+		self.assertFalse(hasattr(other, 'rocky'))
+
+	def test_archetype(self):
+		from bGrease import Entity
+		from bGrease.component import Component
+		position = Component(x=float, y=float)
+		renderable = Component(color=str)
+		world = TestWorld(position=position, renderable=renderable, 
+			other=TestComponent())
+		class Asteroid(Entity):
+			ARCHETYPE = {
+				'position': {'y': 2},
+				'renderable': {'color': '#aaa'},
+			}
+			def __init__(self, world, x):
+				self.position.x = x
+		asteroid = Asteroid(world, 5)
+		self.assertEqual(position[asteroid].x, 5.0)
+		self.assertEqual(position[asteroid].y, 2.0)
+		self.assertEqual(renderable[asteroid].color, '#aaa')
+		self.assertFalse(asteroid in world.other)
+		other = Asteroid(world, 3)
+		self.assertEqual(position[other].x, 3.0)
+		self.assertEqual(position[other].y, 2.0)
+		self.assertFalse(position[other] is position[asteroid])
+
+	def test_archetype_plain_component(self):
+		from bGrease import Entity
+		comp = TestComponent()
+		world = TestWorld(test=comp)
+		class Thing(Entity):
+			ARCHETYPE = {'test': {}}
+		thing = Thing(world)
+		self.assertTrue(thing in comp)
+
 	def test_entity_subclass_slots(self):
 		from bGrease import Entity
 		class NewEntity(Entity):
@@ -226,5 +320,87 @@ class EntityComponentAccessorTestCase(unittest.TestCase):
 		self.assertTrue(accessor)
 
 
+
+class SparseEntitySetTestCase(unittest.TestCase):
+
+	def test_churn_memory_bounded(self):
+		from bGrease.entity import SparseEntitySet, join_sparse
+		from bGrease import Entity
+		world = TestWorld()
+		sparse_set = SparseEntitySet()
+		other = SparseEntitySet()
+		live = []
+		for i in range(20000):
+			entity = Entity(world)
+			sparse_set.add(entity, i)
+			other.add(entity, -i)
+			live.append(entity)
+			if len(live) > 50:
+				old = live.pop(0)
+				sparse_set.remove(old)
+				other.discard(old)
+		self.assertEqual(len(sparse_set), 50)
+		self.assertEqual(len(sparse_set.sparse), 50)
+		self.assertEqual(len(other.sparse), 50)
+		self.assertEqual(set(sparse_set), set(live))
+		self.assertEqual(sparse_set.get(live[-1]), 19999)
+		self.assertTrue(live[0] in sparse_set)
+		self.assertEqual(sorted(join_sparse([sparse_set, other])), 
+			sorted((i, -i) for i in range(19950, 20000)))
+
+	def test_add_remove(self):
+		from bGrease.entity import SparseEntitySet
+		from bGrease import Entity
+		world = TestWorld()
+		entities = [Entity(world) for i in range(5)]
+		members = SparseEntitySet()
+		self.assertEqual(len(members), 0)
+		self.assertFalse(entities[0] in members)
+		self.assertFalse(object() in members)
+		for i, entity in enumerate(entities):
+			members.add(entity, i)
+		self.assertEqual(len(members), 5)
+		self.assertEqual(list(members), entities)
+		self.assertTrue(entities[3] in members)
+		self.assertEqual(members.get(entities[3]), 3)
+		members.add(entities[3], 'three')
+		self.assertEqual(len(members), 5)
+		self.assertEqual(members.get(entities[3]), 'three')
+		members.remove(entities[1])
+		self.assertFalse(entities[1] in members)
+		self.assertEqual(members.get(entities[1], 'nope'), 'nope')
+		self.assertEqual(sorted(members), sorted(entities[:1] + entities[2:]))
+		self.assertEqual(members.get(entities[4]), 4)
+		self.assertRaises(KeyError, members.remove, entities[1])
+		members.discard(entities[1])
+		members.discard(entities[4])
+		members.remove(entities[0])
+		self.assertEqual(sorted(members), sorted(entities[2:4]))
+		self.assertEqual(sorted(members.values), [2, 'three'])
+		unknown = Entity(TestWorld())
+		unknown.entity_id = 1000
+		self.assertFalse(unknown in members)
+		self.assertRaises(KeyError, members.remove, unknown)
+
+	def test_join_sparse(self):
+		from bGrease.entity import SparseEntitySet, join_sparse
+		from bGrease import Entity
+		world = TestWorld()
+		entities = [Entity(world) for i in range(20)]
+		foo, bar, baz = SparseEntitySet(), SparseEntitySet(), SparseEntitySet()
+		for i, entity in enumerate(entities):
+			foo.add(entity, i)
+			if i < 5:
+				bar.add(entity, i * 10)
+			if 2 <= i < 8:
+				baz.add(entity, i * 100)
+		self.assertEqual(sorted(join_sparse([baz, bar, foo])), [
+			(200, 20, 2), (300, 30, 3), (400, 40, 4)])
+		self.assertEqual(sorted(join_sparse([foo, bar])), [
+			(0, 0), (1, 10), (2, 20), (3, 30), (4, 40)])
+		self.assertEqual(sorted(join_sparse([bar])), [
+			(0,), (10,), (20,), (30,), (40,)])
+		self.assertEqual(join_sparse([bar, SparseEntitySet()]), [])
+
 if __name__ == '__main__':
 	unittest.main()
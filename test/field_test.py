@@ -215,6 +215,88 @@ class FieldAccessorTestCase(unittest.TestCase):
 		self.assertEqual(foo_accessor < bar_accessor, set([2]))
 		self.assertEqual(foo_accessor != bar_accessor, set([2,8]))
 	
+	def test_comparisons_return_sets(self):
+		from bGrease.component.field import FieldAccessor
+		comp = TestComponent()
+		for i in range(10):
+			comp[i] = TestData(i, x=i)
+		x_accessor = FieldAccessor(TestField(comp, 'x'), set(range(10)))
+		matches = x_accessor > 6
+		self.assertTrue(type(matches) is set)
+		self.assertEqual(matches, set([7, 8, 9]))
+		# Evaluated on creation
+		comp[2].x = 20
+		self.assertEqual(matches, set([7, 8, 9]))
+		self.assertTrue(matches.issubset(x_accessor >= 0))
+		matches.add(1)
+		matches |= x_accessor == 0
+		matches &= x_accessor < 9
+		matches -= set([7])
+		self.assertEqual(matches, set([0, 1, 8]))
+		self.assertEqual(set([2, 3]) & (x_accessor > 6), set([2]))
+
+	def test_query_fusion(self):
+		from bGrease.component.field import FieldAccessor, Query, lazy
+		comp1 = TestComponent()
+		comp2 = TestComponent()
+		compared = []
+		class CountedData(TestData):
+			@property
+			def y(self):
+				compared.append(self.entity)
+				return self.__dict__['y']
+		for i in range(10):
+			comp1[i] = TestData(i, x=i)
+			comp2[i] = CountedData(i, y=i % 3)
+		x_accessor = lazy(FieldAccessor(TestField(comp1, 'x'), set(range(10))))
+		y_accessor = lazy(FieldAccessor(TestField(comp2, 'y'), set(range(2, 10))))
+		query = x_accessor >= 5
+		self.assertTrue(isinstance(query, Query))
+		fused = query & (y_accessor == 0)
+		self.assertTrue(isinstance(fused, Query))
+		self.assertEqual(compared, [])
+		self.assertEqual(fused, set([6, 9]))
+		self.assertEqual(sorted(compared), [5, 6, 7, 8, 9])
+		self.assertEqual(fused & set([1, 6]), set([6]))
+		self.assertEqual(set([6, 7]) & (x_accessor < 7), set([6]))
+		self.assertEqual((y_accessor < 1) & (x_accessor < 5), set([3]))
+		self.assertEqual(fused | set([1]), set([1, 6, 9]))
+		self.assertEqual(set([1]) | fused, set([1, 6, 9]))
+		self.assertEqual(fused - set([6]), set([9]))
+		self.assertEqual(set([6, 7]) - fused, set([7]))
+		self.assertEqual(fused ^ (x_accessor == 9), set([6]))
+		self.assertEqual(len(fused), 2)
+		self.assertTrue(6 in fused)
+		self.assertFalse(5 in fused)
+		self.assertTrue(fused)
+		self.assertFalse(x_accessor > 100)
+		self.assertTrue(fused != set([6]))
+		self.assertFalse(fused != (x_accessor == 6) | set([9]))
+		self.assertTrue(type(fused.result()) is set)
+		self.assertEqual(fused.result(), set([6, 9]))
+
+	def test_query_streaming(self):
+		from bGrease.component.field import FieldAccessor, lazy
+		comp = TestComponent()
+		for i in range(10):
+			comp[i] = TestData(i, x=i)
+		entities = set(range(10))
+		x_accessor = lazy(FieldAccessor(TestField(comp, 'x'), entities))
+		query = x_accessor > 6
+		# The query is evaluated when first used
+		comp[5].x = 10
+		matches = iter(query)
+		self.assertTrue(next(matches) in set([5, 7, 8, 9]))
+		self.assertEqual(len(list(matches)), 3)
+		comp[6].x = 11
+		self.assertEqual(sorted(query), [5, 7, 8, 9])
+		# Entities may be changed while iterating
+		query = x_accessor > 6
+		for entity in query:
+			entities.discard(entity)
+		self.assertEqual(entities, set(range(5)))
+		self.assertEqual(query, set([5, 6, 7, 8, 9]))
+	
 	def test_inplace_mutators(self):
 		from bGrease.component.field import FieldAccessor
 		entities = set([2,6,7])
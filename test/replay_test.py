@@ -0,0 +1,134 @@
+import unittest
+import random
+from cStringIO import StringIO
+
+from bGrease import Entity
+
+class Ship(Entity):
+
+	def __init__(self, world):
+		world.components.movement.set(self, x=random.random())
+
+
+class Drift(object):
+
+	world = None
+
+	def set_world(self, world):
+		self.world = world
+
+	def step(self, dt):
+		for entity in self.world[Ship].entities:
+			entity.movement.x += random.random() * dt
+			if random.random() < 0.05:
+				self.world.commands.spawn(Ship)
+
+	def on_key_press(self, key, modifiers):
+		if self.world.recorder is not None:
+			self.world.recorder.record_input(self, 'on_key_press', key, modifiers)
+		self.world.commands.spawn(Ship)
+
+
+def make_world():
+	from bGrease.world import BaseWorld
+	from bGrease.mode import BaseMode
+	from bGrease.component import Component
+
+	class GameWorld(BaseWorld, BaseMode):
+
+		def __init__(self):
+			BaseMode.__init__(self)
+			BaseWorld.__init__(self)
+
+		def configure(self):
+			self.components.movement = Component(x=float)
+			self.systems.drift = Drift()
+
+	return GameWorld()
+
+
+class ReplayTestCase(unittest.TestCase):
+
+	def record(self, steps=50, snapshot_interval=10, delete_last=False):
+		from bGrease import replay
+		from bGrease.mode import BaseManager
+		world = make_world()
+		ships = [Ship(world) for i in range(5)]
+		if delete_last:
+			ships[-1].delete()
+		stream = StringIO()
+		recorder = replay.Recorder(world, stream, snapshot_interval)
+		manager = BaseManager()
+		manager.modes = []
+		manager.push_mode(world)
+		for i in range(steps):
+			if i % 7 == 3:
+				world.systems.drift.on_key_press(32, 0)
+			world.step(1.0 / (i + 1))
+		manager.pop_mode()
+		recorder.close()
+		self.assertTrue(world.recorder is None)
+		stream.seek(0)
+		return world, stream
+
+	def state(self, world):
+		return sorted((entity.entity_id, entity.movement.x)
+			for entity in world.components.movement.entities)
+
+	def test_record_play(self):
+		from bGrease import replay
+		world, stream = self.record()
+		player = replay.Player(stream)
+		self.assertEqual([step for step, offset in player.snapshots], 
+			[0, 10, 20, 30, 40])
+		replayed = make_world()
+		self.assertEqual(player.play(replayed), 50)
+		self.assertEqual(player.desyncs, [])
+		self.assertEqual(self.state(replayed), self.state(world))
+		self.assertTrue(len(world.entities) > 12)
+		self.assertEqual(player.mode_transitions, [
+			(0, 'activate', ['GameWorld']), (50, 'deactivate', [])])
+
+	def test_play_from_snapshot(self):
+		from bGrease import replay
+		world, stream = self.record()
+		player = replay.Player(stream)
+		replayed = make_world()
+		self.assertEqual(player.play(replayed, start=25, stop=45), 25)
+		self.assertEqual(player.desyncs, [])
+		self.assertEqual(player.play(make_world(), start=45), 10)
+		self.assertEqual(player.desyncs, [])
+		self.assertEqual(player.mode_transitions, [(50, 'deactivate', [])])
+
+	def test_play_after_delete(self):
+		from bGrease import replay
+		world, stream = self.record(delete_last=True)
+		self.assertFalse(5 in [entity.entity_id for entity in world.entities])
+		player = replay.Player(stream)
+		replayed = make_world()
+		self.assertEqual(player.play(replayed), 50)
+		self.assertEqual(player.desyncs, [])
+		self.assertEqual(self.state(replayed), self.state(world))
+		replayed = make_world()
+		self.assertEqual(player.play(replayed, start=25), 30)
+		self.assertEqual(player.desyncs, [])
+		self.assertEqual(self.state(replayed), self.state(world))
+
+	def test_detect_desync(self):
+		from bGrease import replay
+		world, stream = self.record()
+		player = replay.Player(stream)
+		replayed = make_world()
+		replayed.systems.drift.on_key_press = lambda key, modifiers: None
+		player.play(replayed)
+		self.assertEqual(player.desyncs, [10, 20, 30, 40])
+
+	def test_not_a_recording(self):
+		import cPickle
+		from bGrease import replay
+		self.assertRaises(ValueError, replay.Player, 
+			StringIO(cPickle.dumps(('XXXX', 1), 2)))
+
+
+if __name__ == '__main__':
+	unittest.main()
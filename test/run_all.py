@@ -7,6 +7,10 @@ from field_test import *
 from renderer_test import *
 from collision_test import *
 from mode_test import *
+from snapshot_test import *
+from serialize_test import *
+from replay_test import *
+from runner_test import *
 
 if __name__ == '__main__':
 	unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+
+
+class Counter(object):
+
+	world = None
+
+	def __init__(self, runner=None, stop_at=None):
+		self.runner = runner
+		self.stop_at = stop_at
+		self.steps = []
+
+	def set_world(self, world):
+		self.world = world
+
+	def step(self, dt):
+		self.steps.append(dt)
+		if self.stop_at is not None and len(self.steps) == self.stop_at:
+			self.runner.stop()
+
+
+def make_world(system=None):
+	from bGrease.world import BaseWorld
+	world = BaseWorld()
+	world.systems.counter = system or Counter()
+	return world
+
+
+class RunnerTestCase(unittest.TestCase):
+
+	def test_run_steps(self):
+		from bGrease.runner import Runner
+		world = make_world()
+		runner = Runner(world, dt=0.25)
+		stats = runner.run(steps=10)
+		self.assertTrue(runner.stats is stats)
+		self.assertFalse(runner.running)
+		self.assertEqual(world.systems.counter.steps, [0.25] * 10)
+		self.assertEqual(stats.worlds, 1)
+		self.assertEqual(stats.steps, 10)
+		self.assertEqual(stats.world_steps, 10)
+		self.assertEqual(stats.sim_time, 2.5)
+		self.assertTrue(stats.elapsed >= 0)
+		self.assertEqual(sorted(stats.as_dict()), sorted(stats.FIELDS))
+
+	def test_run_batch(self):
+		from bGrease.runner import run
+		worlds = [make_world() for i in range(4)]
+		stats = run(worlds, steps=25)
+		for world in worlds:
+			self.assertEqual(len(world.systems.counter.steps), 25)
+		self.assertEqual(stats.worlds, 4)
+		self.assertEqual(stats.steps, 25)
+		self.assertEqual(stats.world_steps, 100)
+
+	def test_time_budget(self):
+		import time
+		from bGrease.runner import Runner
+		world = make_world()
+		world.systems.sleep = Counter()
+		world.systems.sleep.step = lambda dt: time.sleep(0.01)
+		stats = Runner(world).run(time_budget=0.05)
+		self.assertTrue(stats.elapsed >= 0.05)
+		self.assertTrue(1 <= stats.steps <= 6)
+		self.assertEqual(len(world.systems.counter.steps), stats.steps)
+		self.assertTrue(stats.steps_per_second > 0)
+
+	def test_stop(self):
+		from bGrease.runner import Runner
+		world = make_world()
+		runner = Runner(world)
+		world.systems.counter = Counter(runner, stop_at=7)
+		stats = runner.run()
+		self.assertEqual(stats.steps, 7)
+		self.assertFalse(runner.running)
+
+	def test_commands_applied(self):
+		from bGrease import Entity
+		from bGrease.runner import run
+		world = make_world()
+		world.systems.spawn = Counter()
+		world.systems.spawn.step = lambda dt: world.commands.spawn(Entity)
+		run(world, steps=5)
+		self.assertEqual(len(world.entities), 5)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,148 @@
+import unittest
+from cStringIO import StringIO
+
+from bGrease import Entity
+
+class Ship(Entity):
+	pass
+
+class Rock(Entity):
+	pass
+
+
+def make_world(**fields):
+	from bGrease.world import BaseWorld
+	from bGrease.component import Component
+	from bGrease.geometry import Vec2d, Rect
+	from bGrease.color import RGBA
+	world = BaseWorld()
+	world.components.position = Component(position=Vec2d, angle=float)
+	world.components.renderable = Component(color=RGBA, bounds=Rect)
+	world.components.target = Component(target=object, tags=set, **fields)
+	return world
+
+
+class SerializeTestCase(unittest.TestCase):
+
+	def make_saved_world(self):
+		from bGrease.geometry import Rect
+		world = make_world()
+		ships = []
+		for i in range(25):
+			entity = (Ship, Rock)[i % 2](world)
+			world.components.position.set(entity, position=(i, -i), angle=i / 2.0)
+			if i % 3 == 0:
+				world.components.renderable.set(entity, color='#ff000080',
+					bounds=Rect(0, 0, i, i))
+			if ships:
+				world.components.target.set(entity, target=ships[-1], tags=set([i]))
+			ships.append(entity)
+		world.entities.remove(ships[4])
+		return world
+
+	def dump(self, world, chunk_size=4):
+		from bGrease import serialize
+		stream = StringIO()
+		serialize.dump(world, stream, chunk_size)
+		stream.seek(0)
+		return stream
+
+	def test_dump_load(self):
+		from bGrease import serialize
+		world = self.make_saved_world()
+		loaded = make_world()
+		self.assertEqual(serialize.load(loaded, self.dump(world)), 24)
+		self.assertEqual(sorted((e.entity_id, type(e)) for e in loaded.entities),
+			sorted((e.entity_id, type(e)) for e in world.entities))
+		self.assertEqual(len(loaded[Ship].entities), 12)
+		for name in ('position', 'renderable', 'target'):
+			saved = getattr(world.components, name)
+			component = getattr(loaded.components, name)
+			self.assertEqual(sorted(e.entity_id for e in component.entities),
+				sorted(e.entity_id for e in saved.entities))
+		by_id = dict((e.entity_id, e) for e in loaded.entities)
+		for entity in world.entities:
+			copy = by_id[entity.entity_id]
+			self.assertEqual(copy.position.position, entity.position.position)
+			self.assertEqual(copy.position.angle, entity.position.angle)
+			if entity in world.components.renderable:
+				self.assertEqual(copy.renderable.color, entity.renderable.color)
+				rect = lambda r: (r.left, r.bottom, r.right, r.top)
+				self.assertEqual(rect(copy.renderable.bounds),
+					rect(entity.renderable.bounds))
+			if entity in world.components.target:
+				if entity.target.target in world.entities:
+					self.assertTrue(copy.target.target.world is loaded)
+					self.assertEqual(copy.target.target.entity_id,
+						entity.target.target.entity_id)
+				else:
+					self.assertTrue(copy.target.target is None)
+				self.assertEqual(copy.target.tags, entity.target.tags)
+		new = Ship(loaded)
+		self.assertEqual(new.entity_id, 26)
+
+	def test_dump_in_chunks(self):
+		from bGrease import serialize
+		stream = self.dump(self.make_saved_world(), chunk_size=10)
+		header, read_chunks = serialize.read(stream)
+		self.assertEqual(sorted(header), ['components', 'next_entity_id'])
+		self.assertEqual(header['next_entity_id'], 26)
+		chunks = []
+		for kind, name, records in read_chunks:
+			self.assertTrue(len(records) <= 10)
+			chunks.append((kind, name, len(records)))
+		self.assertEqual(chunks, [('entities', None, 10), ('entities', None, 10),
+			('entities', None, 4), ('component', 'position', 10),
+			('component', 'position', 10), ('component', 'position', 4),
+			('component', 'renderable', 9), ('component', 'target', 10),
+			('component', 'target', 10), ('component', 'target', 3)])
+
+	def test_next_entity_id(self):
+		from bGrease import serialize
+		world = make_world()
+		ships = [Ship(world) for i in range(5)]
+		world.entities.remove(ships[-1])
+		stream = self.dump(world)
+		self.assertEqual(Ship(world).entity_id, 6)
+		loaded = make_world()
+		serialize.load(loaded, stream)
+		self.assertEqual(Ship(loaded).entity_id, 6)
+
+	def test_schema(self):
+		from bGrease import serialize
+		self.assertEqual(serialize.schema(make_world()), {
+			'position': [('angle', 'float'), ('position', 'Vec2d')],
+			'renderable': [('bounds', 'Rect'), ('color', 'RGBA')],
+			'target': [('tags', 'set'), ('target', 'object')],
+			})
+
+	def test_load_changed_schema(self):
+		from bGrease import serialize
+		world = self.make_saved_world()
+		stream = self.dump(world)
+		from bGrease.component import Component
+		from bGrease.geometry import Rect
+		loaded = make_world(rank=int)
+		loaded.components.renderable = Component(bounds=Rect)
+		serialize.load(loaded, stream)
+		for entity in loaded.components.target.entities:
+			self.assertEqual(entity.target.rank, 0)
+		for data in loaded.components.renderable.itervalues():
+			self.assertFalse(hasattr(data, 'color'))
+
+	def test_load_missing_component(self):
+		from bGrease import serialize
+		stream = self.dump(self.make_saved_world())
+		loaded = make_world()
+		del loaded.components.target
+		self.assertRaises(ValueError, serialize.load, loaded, stream)
+
+	def test_load_bad_stream(self):
+		from bGrease import serialize
+		self.assertRaises(ValueError, serialize.load, make_world(),
+			StringIO('XXXX' + '\0' * 20))
+		self.assertRaises(ValueError, serialize.read, StringIO('XXXX' + '\0' * 20))
+
+
+if __name__ == '__main__':
+	unittest.main()
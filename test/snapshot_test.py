@@ -0,0 +1,147 @@
+import unittest
+import os
+import tempfile
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+from bGrease import Entity
+
+class Ship(Entity):
+	pass
+
+class Bigship(Ship):
+	pass
+
+class Rock(Entity):
+	pass
+
+
+def make_world(world_class=None):
+	from bGrease.world import BaseWorld
+	from bGrease.component import Component
+	from bGrease.component.array import ArrayComponent
+	world = (world_class or BaseWorld)()
+	world.components.movement = ArrayComponent(x=float, n=int, on=bool)
+	world.components.health = ArrayComponent(hp=int)
+	world.components.name = Component(name=str)
+	return world
+
+
+@unittest.skipIf(numpy is None, 'requires numpy')
+class SnapshotTestCase(unittest.TestCase):
+
+	def setUp(self):
+		fd, self.path = tempfile.mkstemp()
+		os.close(fd)
+	
+	def tearDown(self):
+		os.remove(self.path)
+
+	def test_save_load(self):
+		from bGrease import snapshot
+		world = make_world()
+		for i in range(30):
+			entity = (Ship, Bigship, Rock)[i % 3](world)
+			world.components.movement.set(entity, x=i / 2.0, n=i, on=i % 2)
+			if i % 2:
+				world.components.health.set(entity, hp=i * 10)
+		world.entities.remove(list(world[Rock].entities)[0])
+		snapshot.save(world, self.path)
+
+		loaded = make_world()
+		entities = snapshot.load(loaded, self.path)
+		self.assertEqual(len(entities), 29)
+		self.assertEqual(loaded.entities, set(entities))
+		self.assertEqual(sorted(e.entity_id for e in loaded.entities),
+			sorted(e.entity_id for e in world.entities))
+		self.assertEqual(len(loaded[Ship].entities), 20)
+		self.assertEqual(len(loaded[Bigship].entities), 10)
+		self.assertEqual(len(loaded[Rock].entities), 9)
+		by_id = dict((e.entity_id, e) for e in entities)
+		for entity in world.entities:
+			other = by_id[entity.entity_id]
+			self.assertTrue(other.__class__ is entity.__class__)
+			self.assertEqual(other.movement.x, entity.movement.x)
+			self.assertEqual(other.movement.n, entity.movement.n)
+			self.assertEqual(other.movement.on, entity.movement.on)
+			self.assertEqual(bool(other.health), bool(entity.health))
+			if entity.health:
+				self.assertEqual(other.health.hp, entity.health.hp)
+		self.assertEqual(len(loaded.components.health), 15)
+		self.assertEqual(loaded.components.health.class_counts[Ship], 5)
+		self.assertEqual(len(loaded.components.name), 0)
+		loaded.components.movement.step(0)
+		self.assertEqual(sorted(loaded.components.movement.new_entities), sorted(entities))
+		# The loaded world can be changed without changing the file
+		ship = list(loaded[Ship].entities)[0]
+		ship.movement.n = 1000
+		new_ship = Ship(loaded)
+		self.assertEqual(new_ship.entity_id, 31)
+		loaded.components.movement.set(new_ship, n=7)
+		self.assertEqual(new_ship.movement.n, 7)
+		self.assertEqual(loaded[Ship].movement.n > 999, set([ship]))
+		again = make_world()
+		snapshot.load(again, self.path)
+		self.assertEqual(again[...].movement.n > 999, set())
+
+	def test_next_entity_id(self):
+		from bGrease import snapshot
+		world = make_world()
+		ships = [Ship(world) for i in range(5)]
+		ships[-1].delete()
+		snapshot.save(world, self.path)
+		self.assertEqual(Ship(world).entity_id, 6)
+		loaded = make_world()
+		snapshot.load(loaded, self.path)
+		self.assertEqual(Ship(loaded).entity_id, 6)
+
+	def test_chunked_world(self):
+		from bGrease import snapshot
+		from bGrease.world import BaseWorld
+		class ChunkedWorld(BaseWorld):
+			chunked = True
+		world = make_world()
+		for i in range(5):
+			ship = Ship(world)
+			world.components.movement.set(ship, n=i)
+			world.components.health.set(ship, hp=i)
+		snapshot.save(world, self.path)
+		loaded = make_world(ChunkedWorld)
+		snapshot.load(loaded, self.path)
+		self.assertEqual(sorted((m.n, h.hp) 
+			for m, h in loaded.components.join('movement', 'health')),
+			[(i, i) for i in range(5)])
+
+	def test_save_errors(self):
+		from bGrease import snapshot
+		from bGrease.component.array import ArrayComponent
+		class Local(Entity):
+			pass
+		world = make_world()
+		Local(world)
+		self.assertRaises(ValueError, snapshot.save, world, self.path)
+		world = make_world()
+		world.components.tagged = ArrayComponent(tag=str)
+		self.assertRaises(ValueError, snapshot.save, world, self.path)
+		# Only empty components that are not array components are allowed
+		world = make_world()
+		ship = Ship(world)
+		snapshot.save(world, self.path)
+		world.components.name.set(ship, name='Enterprise')
+		self.assertRaises(ValueError, snapshot.save, world, self.path)
+
+	def test_load_errors(self):
+		from bGrease import snapshot
+		world = make_world()
+		Ship(world)
+		snapshot.save(world, self.path)
+		self.assertRaises(AssertionError, snapshot.load, world, self.path)
+		open(self.path, 'wb').write('x' * 100)
+		self.assertRaises(ValueError, snapshot.load, make_world(), self.path)
+
+
+if __name__ == '__main__':
+	unittest.main()
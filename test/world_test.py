@@ -230,6 +230,91 @@ class WorldTestCase(unittest.TestCase):
 		self.assertFalse(entity3 in extent.entities)
 		self.assertTrue(entity3 in world[Another].entities)
 	
+	def test_archetype_extent_component_access(self):
+		from bGrease import Entity
+		from bGrease.world import BaseWorld
+		from bGrease.component import Component
+		class Ship(Entity):
+			ARCHETYPE = {'test': {}}
+		class Bigship(Ship):
+			pass
+		class Rock(Entity):
+			pass
+		world = BaseWorld()
+		comp = world.components.test = Component(x=int)
+		ships = [Ship(world), Ship(world), Bigship(world)]
+		rock = Rock(world)
+		comp.set(rock)
+		self.assertEqual(world[Ship].test, set(ships))
+		self.assertEqual(world[Bigship].test, set(ships[2:]))
+		self.assertEqual(world[Entity].test, set(ships + [rock]))
+		del ships[0].test
+		self.assertEqual(world[Ship].test, set(ships[1:]))
+		comp.set(ships[0])
+		world.entities.remove(ships[1])
+		self.assertEqual(world[Ship].test, set([ships[0], ships[2]]))
+
+	def test_extent_sets_resolved_per_class(self):
+		from bGrease import Entity
+		from bGrease.world import BaseWorld
+		class Mixin(object):
+			pass
+		class Superentity(Entity):
+			pass
+		class Subentity(Mixin, Superentity):
+			pass
+		world = BaseWorld()
+		sub_extent = world[Subentity]
+		sub1 = Subentity(world)
+		sub2 = Subentity(world)
+		super = Superentity(world)
+		self.assertEqual(sub_extent.entities, set([sub1, sub2]))
+		self.assertEqual(world[Superentity].entities, set([sub1, sub2, super]))
+		self.assertEqual(world[Entity].entities, set([sub1, sub2, super]))
+		self.assertFalse(Mixin in world._extents)
+		world.entities.remove(sub1)
+		self.assertEqual(sub_extent.entities, set([sub2]))
+		self.assertEqual(world[Superentity].entities, set([sub2, super]))
+		self.assertEqual(world[Entity].entities, set([sub2, super]))
+		class Another(Subentity):
+			pass
+		another = Another(world)
+		self.assertEqual(sub_extent.entities, set([sub2, another]))
+		self.assertEqual(world[Another].entities, set([another]))
+		self.assertEqual(world[Entity].entities, set([sub2, super, another]))
+
+	def test_union_extents(self):
+		from bGrease import Entity
+		from bGrease.world import BaseWorld
+		class Asteroid(Entity):
+			pass
+		class Shot(Entity):
+			pass
+		class BigShot(Shot):
+			pass
+		class Ship(Entity):
+			pass
+		world = BaseWorld()
+		asteroid = Asteroid(world)
+		shot = Shot(world)
+		ship = Ship(world)
+		extent = world[(Asteroid, Shot)]
+		self.assertEqual(extent.entities, set([asteroid, shot]))
+		self.assertTrue(world[(Shot, Asteroid)] is extent)
+		self.assertEqual(world[(Ship,)].entities, set([ship]))
+		big = BigShot(world)
+		asteroid2 = Asteroid(world)
+		self.assertEqual(extent.entities, set([asteroid, asteroid2, shot, big]))
+		world.entities.remove(asteroid)
+		world.entities.remove(big)
+		self.assertEqual(extent.entities, set([asteroid2, shot]))
+		self.assertEqual(world[(Asteroid, Ship)].entities, set([asteroid2, ship]))
+		ship2 = Ship(world)
+		self.assertEqual(world[(Asteroid, Ship)].entities, 
+			set([asteroid2, ship, ship2]))
+		self.assertEqual(extent.entities, set([asteroid2, shot]))
+		self.assertEqual(world[(Entity, Ship)].entities, world.entities)
+
 	def test_entity_superclass_extents(self):
 		from bGrease import World, Entity
 		class Superentity(Entity):
@@ -394,6 +479,98 @@ class WorldTestCase(unittest.TestCase):
 		self.assertEqual(sorted(world.components.join('baz')), [
 			(0,), (100,), (200,)])
 
+	def test_join_sparse_components(self):
+		from bGrease import Entity
+		from bGrease.world import BaseWorld
+		from bGrease.component import Component
+		world = BaseWorld()
+		foo = world.components.foo = Component(x=int)
+		bar = world.components.bar = Component(x=int)
+		baz = world.components.baz = Component(x=int)
+		entities = [Entity(world) for i in range(20)]
+		for i, entity in enumerate(entities):
+			foo.set(entity, x=i)
+			if i < 5:
+				bar.set(entity, x=i * 10)
+			if i < 3:
+				baz.set(entity, x=i * 100)
+		def join(*names):
+			return sorted(tuple(data.x for data in row) 
+				for row in world.components.join(*names))
+		self.assertEqual(join('baz', 'bar', 'foo'), [
+			(0, 0, 0), (100, 10, 1), (200, 20, 2)])
+		self.assertEqual(join('foo', 'bar'), [
+			(0, 0), (1, 10), (2, 20), (3, 30), (4, 40)])
+		self.assertEqual(join('baz'), [(0,), (100,), (200,)])
+		del bar[entities[1]]
+		foo.set(entities[0], x=-1)
+		world.entities.remove(entities[2])
+		self.assertEqual(join('baz', 'bar', 'foo'), [(0, 0, -1)])
+		self.assertEqual(len(join('foo')), 19)
+
+	def test_chunked_join_components(self):
+		from bGrease import Entity
+		from bGrease.world import BaseWorld, ChunkedComponentParts
+		from bGrease.component import Component
+		class ChunkedWorld(BaseWorld):
+			chunked = True
+		world = ChunkedWorld()
+		self.assertTrue(isinstance(world.components, ChunkedComponentParts))
+		foo = world.components.foo = Component(x=int)
+		bar = world.components.bar = Component(x=int)
+		baz = world.components.baz = Component(x=int)
+		entities = [Entity(world) for i in range(20)]
+		for i, entity in enumerate(entities):
+			foo.set(entity, x=i)
+			if i < 5:
+				bar.set(entity, x=i * 10)
+			if i < 3:
+				baz.set(entity, x=i * 100)
+		def join(*names):
+			return sorted(tuple(data.x for data in row) 
+				for row in world.components.join(*names))
+		self.assertEqual(join('baz', 'bar', 'foo'), [
+			(0, 0, 0), (100, 10, 1), (200, 20, 2)])
+		self.assertEqual(join('foo', 'bar'), [
+			(0, 0), (1, 10), (2, 20), (3, 30), (4, 40)])
+		self.assertEqual(join('baz'), [(0,), (100,), (200,)])
+		self.assertEqual(list(world.components.join()), [])
+		self.assertRaises(AttributeError, world.components.join, 'spam')
+		# Membership changes move entities between chunks
+		del bar[entities[1]]
+		baz.set(entities[4], x=400)
+		foo.set(entities[0], x=-1)
+		world.entities.remove(entities[2])
+		self.assertEqual(join('baz', 'bar', 'foo'), [(0, 0, -1), (400, 40, 4)])
+		self.assertEqual(join('baz'), [(0,), (100,), (400,)])
+		self.assertEqual(len(join('foo')), 19)
+		# Replacing a component rebuilds the chunks
+		world.components.bar = Component(x=int)
+		self.assertEqual(join('bar'), [])
+		self.assertEqual(bar._storage, None)
+		world.components.bar.set(entities[5], x=50)
+		self.assertEqual(join('foo', 'bar'), [(5, 50)])
+		del world.components.baz
+		self.assertEqual(baz._storage, None)
+		self.assertEqual(len(join('foo')), 19)
+
+	def test_chunked_join_mixed_components(self):
+		from bGrease import Entity
+		from bGrease.world import BaseWorld
+		from bGrease.component import Component
+		class ChunkedWorld(BaseWorld):
+			chunked = True
+		world = ChunkedWorld()
+		foo = world.components.foo = Component(x=int)
+		bar = world.components.bar = TestComponent()
+		entities = [Entity(world) for i in range(3)]
+		for i, entity in enumerate(entities):
+			foo.set(entity, x=i)
+			bar.add(entity, i * 10)
+		self.assertEqual(sorted((data.x, value) 
+			for data, value in world.components.join('foo', 'bar')), 
+			[(0, 0), (1, 10), (2, 20)])
+
 	def test_illegal_part_name(self):
 		from bGrease import World
 		from bGrease.component import ComponentError
@@ -445,6 +622,57 @@ class WorldTestCase(unittest.TestCase):
 		self.assertEqual(list(world.systems), [sys3])
 		self.assertRaises(AttributeError, delattr, world, 'one')
 	
+	def test_system_stats(self):
+		from bGrease.world import BaseWorld
+		class TestStats(object):
+			def as_dict(self):
+				return {'pairs': 3}
+		world = BaseWorld()
+		self.assertEqual(world.system_stats(), {})
+		world.systems.one = TestSystem()
+		world.systems.two = TestSystem()
+		world.systems.two.stats = TestStats()
+		world.systems.three = TestSystem()
+		world.systems.three.stats = None
+		self.assertEqual(world.system_stats(), {'two': {'pairs': 3}})
+
+	def test_command_buffer(self):
+		from bGrease import Entity
+		from bGrease.world import BaseWorld
+		from bGrease.component import Component
+		class Debris(Entity):
+			def __init__(self, world, size):
+				world.components.shape.set(self, size=size)
+				world.commands.set('age', self, seconds=1.0)
+		world = BaseWorld()
+		world.components.shape = Component(size=int)
+		world.components.age = Component(seconds=float)
+		debris = [Debris(world, i) for i in range(5)]
+		self.assertEqual(len(world.commands), 5)
+		self.assertEqual(world.commands.apply(), 5)
+		self.assertEqual(len(world.commands), 0)
+		self.assertEqual(world[Debris].age, set(debris))
+		# Changes are deferred while iterating
+		for entity in world[Debris].entities:
+			if entity.shape.size % 2:
+				world.commands.delete(entity)
+				world.commands.spawn(Debris, 10)
+			else:
+				world.commands.remove('age', entity)
+		world.commands.delete(debris[1])
+		world.commands.set('age', debris[1], seconds=2.0)
+		self.assertEqual(world[Debris].entities, set(debris))
+		self.assertEqual(world.commands.apply(), 11)
+		self.assertEqual(len(world[Debris].entities), 5)
+		self.assertEqual(world[Debris].entities & set(debris), 
+			set([debris[0], debris[2], debris[4]]))
+		self.assertEqual(len(world[Debris].age), 2)
+		self.assertEqual(list(world[Debris].age.seconds), [1.0, 1.0])
+		world.commands.spawn(Debris, 100)
+		world.commands.clear()
+		self.assertEqual(world.commands.apply(), 0)
+		self.assertEqual(len(world[Debris].entities), 5)
+
 	def test_insert_system(self):
 		from bGrease import World
 		world = World()